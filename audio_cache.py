@@ -0,0 +1,413 @@
+"""
+Persistent audio cache for the Discord TTS App.
+
+Rendered speech is stored as WAV files named after the TTS key (see get_tts_key), so the
+same text/voice/rate always maps to the same file and survives restarts. A small JSON
+index records the size and usage of every entry; it is loaded lazily on first use and
+written atomically, a short while after it changes rather than on every insert, so a
+burst of new entries costs one write. When the cache grows past its byte budget the
+least recently used (or least frequently used) entries are evicted.
+
+PcmCache is a bounded in-memory tier in front of the disk cache that keeps decoded
+samples, so repeated phrases play without any file I/O or WAV parsing.
+"""
+
+import os
+import json
+import time
+import uuid
+import threading
+from collections import OrderedDict
+
+import soundfile as sf
+
+def default_cache_dir() -> str:
+    """Per-user directory for cached audio that is not wiped like the temp folder"""
+    base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "discord_tts", "audio_cache")
+
+class AudioCache:
+    """
+    Size-capped, content-addressed cache of rendered WAV files
+
+    Entries are keyed by the TTS key. All methods are thread-safe.
+    """
+    INDEX_NAME = "index.json"
+    POLICIES = ("lru", "lfu")
+
+    def __init__(self, cache_dir: str, max_bytes: int = 256 * 1024 * 1024, policy: str = "lru",
+                 flush_delay: float = 2.0, flush_every: int = 32):
+        """
+        Args:
+            cache_dir (str): Directory holding the WAV files and the index
+            max_bytes (int): Byte budget; older entries are evicted above it
+            policy (str): "lru" (least recently used) or "lfu" (least frequently used)
+            flush_delay (float): Seconds after a change before the index is written
+            flush_every (int): Changes after which the index is written without waiting
+        """
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown cache policy: {policy}")
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self._index_path = os.path.join(cache_dir, self.INDEX_NAME)
+        self._lock = threading.Lock()
+        self._entries = None  # key -> {"size", "last_access", "hits"}; loaded lazily
+        self._total_bytes = 0
+        self._dirty = False
+        self._changes = 0       # Inserts and evictions not yet written to the index
+        self._flush_timer = None
+        self.flush_delay = flush_delay
+        self.flush_every = flush_every
+        self.hits = 0
+        self.misses = 0
+
+    def path_for(self, key: str) -> str:
+        """Final location of the WAV file for a key"""
+        return os.path.join(self.cache_dir, f"{key}.wav")
+
+    def get(self, key: str):
+        """
+        Look up a cached entry and mark it as used
+
+        Args:
+            key (str): The TTS key
+
+        Returns:
+            str: Path to the cached WAV file, or None on a miss
+        """
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._entries.get(key)
+            path = self.path_for(key)
+            if entry is None or not os.path.exists(path):
+                if entry is not None:
+                    self._forget(key)
+                self.misses += 1
+                path = None
+            else:
+                entry["last_access"] = time.time()
+                entry["hits"] += 1
+                self._dirty = True
+                self.hits += 1
+        # Usage counts drive eviction, so they are saved like any other change
+        self._schedule_flush()
+        return path
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            self._ensure_loaded()
+            return key in self._entries and os.path.exists(self.path_for(key))
+
+    def temp_path(self, key: str) -> str:
+        """
+        Unique scratch path in the cache directory for writing an entry
+
+        Pass the finished file to commit(). Concurrent writers of the same key never
+        share a scratch file, so a reader can never see a partially written WAV.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        return os.path.join(self.cache_dir, f"{key}.{uuid.uuid4().hex}.tmp")
+
+    def commit(self, key: str, tmp_path: str) -> str:
+        """
+        Atomically move a finished scratch file into place and record it
+
+        Args:
+            key (str): The TTS key
+            tmp_path (str): File returned by temp_path() that has been fully written
+
+        Returns:
+            str: Path to the cached WAV file
+        """
+        path = self.path_for(key)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            self._ensure_loaded()
+            old = self._entries.get(key)
+            if old:
+                self._total_bytes -= old["size"]
+            self._entries[key] = {"size": size, "last_access": time.time(), "hits": 0}
+            self._total_bytes += size
+            self._evict(keep=key)
+            self._changed()
+        self._schedule_flush()
+        return path
+
+    def put_pcm(self, key: str, pcm, sample_rate: int) -> str:
+        """
+        Write decoded audio to the cache as 16-bit WAV
+
+        Args:
+            key (str): The TTS key
+            pcm (np.ndarray): float32 samples
+            sample_rate (int): Sample rate of pcm
+
+        Returns:
+            str: Path to the cached WAV file
+        """
+        tmp_path = self.temp_path(key)
+        try:
+            sf.write(tmp_path, pcm, sample_rate, subtype='PCM_16', format='WAV')
+            return self.commit(key, tmp_path)
+        except Exception:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def set_budget(self, max_bytes: int):
+        """Change the byte budget and evict immediately if the cache is now too large"""
+        with self._lock:
+            self.max_bytes = max_bytes
+            if self._entries is not None:
+                self._evict()
+        self._schedule_flush()
+
+    def stats(self) -> dict:
+        """Entry count, size and hit statistics"""
+        with self._lock:
+            self._ensure_loaded()
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def flush(self):
+        """Write the index to disk now if it changed (atomic replace)"""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not self._dirty or self._entries is None:
+                return
+            data = json.dumps(self._entries)
+            self._dirty = False
+            self._changes = 0
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = f"{self._index_path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp, self._index_path)
+        except Exception as e:
+            print(f"Could not save cache index: {e}")
+
+    def close(self):
+        """Write pending index changes; call before the process exits"""
+        self.flush()
+
+    def cleanup(self, legacy_dirs=()):
+        """
+        Reconcile the index with the files on disk (meant for a background thread)
+
+        Removes leftover scratch files, indexes WAV files the index does not know about,
+        drops entries whose file is gone and evicts down to the budget.
+
+        Args:
+            legacy_dirs (iterable): Old cache folders whose .wav/.mp3 files are deleted
+        """
+        for folder in legacy_dirs:
+            try:
+                for f in os.listdir(folder):
+                    if f.endswith('.wav') or f.endswith('.mp3'):
+                        try:
+                            os.unlink(os.path.join(folder, f))
+                        except OSError:
+                            pass
+            except OSError:
+                pass
+
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+
+        on_disk = {}
+        for name in names:
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith('.tmp'):
+                # Scratch files older than a minute belong to a crashed writer
+                try:
+                    if time.time() - os.path.getmtime(path) > 60:
+                        os.unlink(path)
+                except OSError:
+                    pass
+            elif name.endswith('.wav'):
+                try:
+                    st = os.stat(path)
+                    on_disk[name[:-4]] = (st.st_size, st.st_mtime)
+                except OSError:
+                    pass
+
+        with self._lock:
+            self._ensure_loaded()
+            for key in [k for k in self._entries if k not in on_disk]:
+                self._forget(key)
+            for key, (size, mtime) in on_disk.items():
+                entry = self._entries.get(key)
+                if entry is None:
+                    self._entries[key] = {"size": size, "last_access": mtime, "hits": 0}
+                    self._total_bytes += size
+                    self._changed()
+                elif entry["size"] != size:
+                    self._total_bytes += size - entry["size"]
+                    entry["size"] = size
+                    self._changed()
+            self._evict()
+        self.flush()
+
+    def _ensure_loaded(self):
+        """Read the index on first use (caller holds the lock)"""
+        if self._entries is not None:
+            return
+        self._entries = {}
+        try:
+            with open(self._index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for key, entry in data.items():
+                self._entries[key] = {
+                    "size": int(entry.get("size", 0)),
+                    "last_access": float(entry.get("last_access", 0)),
+                    "hits": int(entry.get("hits", 0)),
+                }
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Could not load cache index, starting empty: {e}")
+        self._total_bytes = sum(e["size"] for e in self._entries.values())
+
+    def _forget(self, key):
+        """Drop an entry from the index (caller holds the lock)"""
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._total_bytes -= entry["size"]
+            self._changed()
+
+    def _changed(self):
+        """Mark the index as modified (caller holds the lock)"""
+        self._dirty = True
+        self._changes += 1
+
+    def _schedule_flush(self):
+        """Write the index soon, or now if many changes are pending"""
+        with self._lock:
+            if not self._dirty:
+                return
+            if self._changes < self.flush_every:
+                if self._flush_timer is None:
+                    self._flush_timer = threading.Timer(self.flush_delay, self.flush)
+                    self._flush_timer.daemon = True
+                    self._flush_timer.start()
+                return
+        self.flush()
+
+    def _evict(self, keep=None):
+        """Delete entries until the cache fits its budget (caller holds the lock)"""
+        if self._total_bytes <= self.max_bytes:
+            return
+        if self.policy == "lfu":
+            rank = lambda k: (self._entries[k]["hits"], self._entries[k]["last_access"])
+        else:
+            rank = lambda k: self._entries[k]["last_access"]
+        for key in sorted(self._entries, key=rank):
+            if self._total_bytes <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            try:
+                os.unlink(self.path_for(key))
+            except OSError:
+                pass
+            self._forget(key)
+
+class PcmCache:
+    """
+    In-memory LRU cache of decoded audio, capped by total array size in bytes
+
+    Cached arrays are marked read-only because they are shared between playbacks.
+    All methods are thread-safe.
+    """
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Args:
+            max_bytes (int): Memory budget for all cached sample arrays
+        """
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (samples, sample_rate)
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        """
+        Args:
+            key (str): The TTS key
+
+        Returns:
+            tuple: (samples, sample_rate), or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, samples, sample_rate: int):
+        """
+        Store decoded audio; entries larger than the whole budget are not cached
+
+        Args:
+            key (str): The TTS key
+            samples (np.ndarray): Decoded float32 samples
+            sample_rate (int): Sample rate of samples
+        """
+        if samples.nbytes > self.max_bytes:
+            return
+        samples.flags.writeable = False
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old[0].nbytes
+            self._entries[key] = (samples, sample_rate)
+            self._total_bytes += samples.nbytes
+            self._evict()
+
+    def discard(self, key: str):
+        """Drop an entry if present"""
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old[0].nbytes
+
+    def set_budget(self, max_bytes: int):
+        """Change the memory budget, evicting immediately if needed"""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def stats(self) -> dict:
+        """Entry count, memory use and hit statistics"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _evict(self):
+        """Drop least recently used entries until within budget (caller holds the lock)"""
+        while self._total_bytes > self.max_bytes and self._entries:
+            _, (samples, _) = self._entries.popitem(last=False)
+            self._total_bytes -= samples.nbytes
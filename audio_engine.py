@@ -0,0 +1,377 @@
+"""
+Persistent audio output engine for the Discord TTS App.
+
+Instead of opening a new output stream for every message, the engine keeps one output
+sink open per device (see audio_sinks). Each sink is fed from a preallocated ring
+buffer, so the audio callback only copies samples and never allocates. A single feeder
+thread moves queued audio into the ring buffers as space frees up, which allows messages
+of any length and streaming playback while audio is still being generated.
+
+When audio goes to several devices at once (Discord cable and monitor), the devices are
+kept in step: every stream reports when its samples reach the DAC, the engine pads the
+start so all devices begin together, and it slightly resamples the other devices to follow
+the first route's clock.
+"""
+
+import time
+import threading
+from collections import deque
+
+import numpy as np
+
+from audio_utils import TARGET_SAMPLE_RATE
+from audio_sinks import OutputSink, PortAudioSink
+
+class AudioEngine:
+    """
+    Long-lived playback engine with named output routes
+
+    Routes map a name (e.g. "cable", "monitor") to a PortAudio device index or to an
+    OutputSink. Routes that point at the same device or sink share one ring buffer. Audio
+    is played to all routes unless a subset is given. With synchronize on, the output of
+    the first route is the clock reference.
+    """
+    # Drift correction: proportional gain (ratio per second of offset), integral gain
+    # (per second), largest correction, and the offset fixed by a jump instead of slewing
+    SYNC_KP = 0.5
+    SYNC_KI = 0.05
+    SYNC_MAX_CORRECTION = 0.002
+    SYNC_JUMP = 0.02
+    SYNC_INTERVAL = 0.05
+
+    def __init__(self, sample_rate: int = TARGET_SAMPLE_RATE, blocksize: int = 512,
+                 buffer_seconds: float = 2.0, synchronize: bool = True, sync_fill: float = 0.25):
+        """
+        Args:
+            sample_rate (int): Sample rate of all audio passed to the engine
+            blocksize (int): Frames per audio callback
+            buffer_seconds (float): Ring buffer size per device
+            synchronize (bool): Align start times and correct drift between devices
+            sync_fill (float): Seconds buffered per device while synchronizing (corrections
+                               take effect after this much audio)
+        """
+        self.sample_rate = sample_rate
+        self.blocksize = blocksize
+        self.capacity = int(sample_rate * buffer_seconds)
+        self.synchronize = synchronize
+        self.sync_fill = int(sample_rate * sync_fill)
+        self._reference = None  # Output of the first route
+        self._align = False     # Pad the device starts before the next write
+        self._last_sync = 0.0
+        self._routes = {}    # route name -> device index or sink
+        self._outputs = {}   # device index or sink -> OutputSink
+        self._cond = threading.Condition()
+        self._pending = deque()
+        self._pending_offset = 0
+        self._markers = []   # (ring write position per target, callback) waiting to be played
+        self._targets = []
+        self._generation = 0
+        self._input_done = True
+        self._active = False
+        self._on_finished = None
+        self._closed = False
+        self._feeder = threading.Thread(target=self._feed_loop, daemon=True)
+        self._feeder.start()
+
+    @property
+    def is_active(self) -> bool:
+        """Whether audio is queued or still playing"""
+        return self._active
+
+    @property
+    def route_names(self) -> tuple:
+        """Names of the configured routes"""
+        return tuple(self._routes)
+
+    def set_routes(self, routes: dict):
+        """
+        Point routes at outputs, opening and closing them only where needed
+
+        Sinks passed in are opened here and closed by the engine once no route uses them.
+
+        Args:
+            routes (dict): Route name -> device index or OutputSink
+
+        Raises:
+            sd.PortAudioError: If a device cannot be opened
+            RuntimeError: If PortAudio is not available
+        """
+        with self._cond:
+            wanted = set(routes.values())
+            for key in list(self._outputs):
+                if key not in wanted:
+                    self._outputs.pop(key).close()
+            for key in wanted:
+                if key not in self._outputs:
+                    sink = key if isinstance(key, OutputSink) else PortAudioSink(key)
+                    sink.open(self.sample_rate, self.blocksize, self.capacity)
+                    self._outputs[key] = sink
+            self._routes = dict(routes)
+            self._reference = self._outputs.get(next(iter(routes.values()), None))
+
+    def play(self, samples: np.ndarray, routes=None, on_finished=None):
+        """
+        Stop the current audio and play samples
+
+        Args:
+            samples (np.ndarray): Mono float32 samples at the engine sample rate
+            routes (iterable): Route names to play to (default: all)
+            on_finished (callable): Called from the engine thread when playback ends
+        """
+        push = self.begin_stream(routes, on_finished)
+        push(samples)
+        push(None)
+
+    def begin_stream(self, routes=None, on_finished=None):
+        """
+        Stop the current audio and start a stream of blocks that are pushed later
+
+        Args:
+            routes (iterable): Route names to play to (default: all)
+            on_finished (callable): Called from the engine thread when playback ends
+
+        Returns:
+            callable: Queues a mono float32 block for playback; None marks the end. A
+                      callable is a marker: it is called from the engine thread once all
+                      audio pushed before it has been played.
+        """
+        with self._cond:
+            self._stop_locked()
+            names = self._routes.keys() if routes is None else routes
+            devices = {self._routes[n] for n in names if n in self._routes}
+            self._targets = sorted((self._outputs[d] for d in devices),
+                                   key=lambda out: out is not self._reference)
+            for out in self._targets:
+                out.reset_stream()
+            self._align = True
+            self._input_done = False
+            self._active = True
+            self._on_finished = on_finished
+            return self._make_push(self._generation)
+
+    def continue_stream(self, push, on_finished=None):
+        """
+        Reopen the input of a stream that is still playing so more audio follows gaplessly
+
+        Args:
+            push (callable): Push function previously returned for that stream
+            on_finished (callable): Replaces the end-of-playback callback
+
+        Returns:
+            callable: Push function like begin_stream(), or None if that stream has
+                      finished, was stopped or was replaced
+        """
+        with self._cond:
+            if not self._active or push.generation != self._generation:
+                return None
+            self._input_done = False
+            self._on_finished = on_finished
+            return self._make_push(self._generation)
+
+    def _make_push(self, generation):
+        """Push function that only accepts audio while generation is current"""
+        def push(block):
+            with self._cond:
+                if generation != self._generation:
+                    return  # Playback was stopped or replaced
+                if block is None:
+                    self._input_done = True
+                elif callable(block) or len(block):
+                    self._pending.append(block)
+                self._cond.notify()
+        push.generation = generation
+        return push
+
+    def stop(self):
+        """Silence all outputs immediately and drop queued audio"""
+        with self._cond:
+            self._stop_locked()
+
+    def underruns(self) -> int:
+        """Total number of output underflows and starved blocks of all outputs"""
+        return sum(out.underruns for out in list(self._outputs.values()))
+
+    def sync_stats(self) -> dict:
+        """
+        Output latency and synchronization state per open output
+
+        Returns:
+            dict: device index or sink -> {"name", "latency_ms", "offset_ms", "drift_ppm",
+                  "underruns", "reference"}; offset is how far ahead of the reference it plays
+        """
+        return {
+            key: {
+                "name": out.name,
+                "latency_ms": round(out.latency * 1000, 1),
+                "offset_ms": round(out.offset * 1000, 2),
+                "drift_ppm": round(out.drift * 1e6, 1),
+                "underruns": out.underruns,
+                "reference": out is self._reference,
+            }
+            for key, out in list(self._outputs.items())
+        }
+
+    def close(self):
+        """Stop the feeder thread and close every device stream"""
+        with self._cond:
+            self._stop_locked()
+            self._closed = True
+            for out in self._outputs.values():
+                out.close()
+            self._outputs = {}
+            self._cond.notify()
+
+    def _stop_locked(self):
+        self._generation += 1
+        self._pending.clear()
+        self._pending_offset = 0
+        self._markers = []
+        for out in self._targets:
+            out.ring.request_flush()
+            out.expect_audio = False
+        self._targets = []
+        self._input_done = True
+        self._active = False
+        self._on_finished = None
+
+    def _syncing(self) -> bool:
+        return self.synchronize and len(self._targets) > 1
+
+    def _space_locked(self, wanted: int) -> int:
+        """Samples of the next block that every target can take now"""
+        if not self._syncing():
+            return min([out.ring.free() for out in self._targets] + [wanted])
+        # Keep the rings short so clock corrections take effect quickly, and leave room
+        # for resampling and start padding
+        space = wanted
+        for out in self._targets:
+            room = min(out.ring.free(), self.sync_fill - out.ring.queued()) - len(out.backlog)
+            space = min(space, int((room - 8) / (1 + self.SYNC_MAX_CORRECTION)))
+        return space
+
+    def _write_locked(self, chunk):
+        """Copy the next piece of the stream into every target ring"""
+        if not self._syncing():
+            for out in self._targets:
+                out.ring.write(chunk)
+            return
+        if self._align:
+            self._align_starts_locked()
+        for out in self._targets:
+            data = chunk
+            if out is not self._targets[0]:
+                data = out.resampler.process(chunk, out.ratio)
+                if out.skip:
+                    dropped = min(out.skip, len(data))
+                    data, out.skip = data[dropped:], out.skip - dropped
+            out.fed += len(chunk)
+            if len(out.backlog):
+                data = np.concatenate((out.backlog, data))
+            written = out.ring.write(data)
+            out.backlog = data[written:]
+
+    def _align_starts_locked(self):
+        """Pad the start of the stream so every device plays its first sample at once"""
+        self._align = False
+        now = time.perf_counter()
+        starts = {out: out.start_time(now) for out in self._targets}
+        latest = max(starts.values())
+        for out, start in starts.items():
+            pad = int(round((latest - start) * self.sample_rate))
+            if pad > 0:
+                out.backlog = np.concatenate((np.zeros(pad, dtype=np.float32), out.backlog))
+
+    def _sync_locked(self):
+        """Measure how far each device is from the reference and adjust its resampling"""
+        now = time.perf_counter()
+        dt = now - self._last_sync
+        if dt < self.SYNC_INTERVAL:
+            return
+        self._last_sync = now
+        reference = self._targets[0].playing_position(now)
+        if reference is None:
+            return
+        for out in self._targets[1:]:
+            position = out.playing_position(now)
+            if position is None:
+                continue
+            error = (position - reference) / self.sample_rate  # > 0: this device is ahead
+            if abs(error) > self.SYNC_JUMP:
+                # Too far off to slew (e.g. after an underrun): delay or skip audio directly
+                samples = int(abs(error) * self.sample_rate)
+                if error > 0:
+                    out.backlog = np.concatenate((np.zeros(samples, dtype=np.float32), out.backlog))
+                else:
+                    out.skip += samples
+                out.offset = 0.0
+                continue
+            out.offset += 0.1 * (error - out.offset)
+            limit = self.SYNC_MAX_CORRECTION
+            out.drift = min(max(out.drift + self.SYNC_KI * out.offset * min(dt, 1.0), -limit), limit)
+            out.ratio = 1.0 + min(max(out.drift + self.SYNC_KP * out.offset, -limit), limit)
+
+    def _due_markers_locked(self):
+        """Remove and return the markers whose audio has been played on every target"""
+        due = []
+        while self._markers and all(out.ring.played() >= pos for out, pos in self._markers[0][0]):
+            due.append(self._markers.pop(0)[1])
+        return due
+
+    def _feed_loop(self):
+        """Move queued audio into the ring buffers and detect the end of playback"""
+        while True:
+            finished = None
+            with self._cond:
+                if self._closed:
+                    return
+                # A short block is only an underrun while more audio is on its way
+                expect_audio = self._active and not (self._input_done and not self._pending)
+                for out in self._targets:
+                    out.expect_audio = expect_audio
+                if self._active and self._syncing():
+                    self._sync_locked()
+                markers = self._due_markers_locked() if self._markers else []
+                if markers:
+                    pass  # Run the callbacks outside the lock
+                elif not self._active:
+                    self._cond.wait()
+                    continue
+                elif self._pending and callable(self._pending[0]):
+                    # Marker: due once the devices have played what they have been given
+                    self._markers.append(([(out, out.ring.written() + len(out.backlog))
+                                           for out in self._targets], self._pending.popleft()))
+                    continue
+                elif not self._pending:
+                    if self._input_done and all(out.ring.available() == 0 and not len(out.backlog)
+                                                for out in self._targets):
+                        finished = self._on_finished
+                        self._active = False
+                        self._on_finished = None
+                    else:
+                        # Wait for more input or for the devices to drain
+                        self._cond.wait(0.01)
+                        continue
+                else:
+                    block = self._pending[0]
+                    space = self._space_locked(len(block) - self._pending_offset)
+                    if space <= 0:
+                        self._cond.wait(0.01)
+                        continue
+                    chunk = block[self._pending_offset:self._pending_offset + space]
+                    self._write_locked(chunk)
+                    self._pending_offset += len(chunk)
+                    if self._pending_offset >= len(block):
+                        self._pending.popleft()
+                        self._pending_offset = 0
+                    continue
+
+            for marker in markers:
+                try:
+                    marker()
+                except Exception as e:
+                    print(f"Playback marker callback failed: {e}")
+            if finished:
+                try:
+                    finished()
+                except Exception as e:
+                    print(f"Playback finished callback failed: {e}")
@@ -0,0 +1,292 @@
+"""
+Silence trimming and loudness normalization for the Discord TTS App.
+
+Edge TTS pads its audio with silence, mostly in front of the first word, and its voices
+differ in level by several decibels. Speech is cleaned up once, when it enters the cache:
+it is brought to a common loudness (ITU-R BS.1770 integrated loudness, in LUFS), the
+silence before and after the speech is cut to a short margin, and a look-ahead peak
+limiter keeps the gain from clipping. Every step is vectorized with numpy, so a sentence
+takes about ten milliseconds on a worker thread, and playback only reads finished samples.
+
+Audio that is played while it is still being received cannot be measured first; for it,
+LeadingSilenceGate drops the silence in front of the first word on the fly and applies
+the gain last measured for the same voice.
+"""
+
+import time
+import threading
+import functools
+
+import numpy as np
+
+from audio_utils import TARGET_SAMPLE_RATE
+
+def _db_to_gain(db: float) -> float:
+    return 10.0 ** (db / 20.0)
+
+def _biquad_response(b, a, w) -> np.ndarray:
+    """Complex frequency response of a biquad at angular frequencies w (radians/sample)"""
+    z1 = np.exp(-1j * w)
+    z2 = z1 * z1
+    return (b[0] + b[1] * z1 + b[2] * z2) / (a[0] + a[1] * z1 + a[2] * z2)
+
+@functools.lru_cache(maxsize=8)
+def _k_weighting(n: int, sample_rate: int) -> np.ndarray:
+    """Frequency response of the BS.1770 K-weighting filters at the bins of an n-point rfft"""
+    # Filter design as in libebur128, so any sample rate works
+    k = np.tan(np.pi * 1681.974450955533 / sample_rate)
+    q = 0.7071752369554196
+    vh = _db_to_gain(3.999843853973347)
+    vb = vh ** 0.4996667741545416
+    a0 = 1.0 + k / q + k * k
+    shelf = ([(vh + vb * k / q + k * k) / a0, 2.0 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0],
+             [1.0, 2.0 * (k * k - 1.0) / a0, (1.0 - k / q + k * k) / a0])
+    k = np.tan(np.pi * 38.13547087602444 / sample_rate)
+    q = 0.5003270373238773
+    a0 = 1.0 + k / q + k * k
+    high_pass = ([1.0, -2.0, 1.0], [1.0, 2.0 * (k * k - 1.0) / a0, (1.0 - k / q + k * k) / a0])
+    w = 2.0 * np.pi * np.arange(n // 2 + 1) / n
+    return _biquad_response(*shelf, w) * _biquad_response(*high_pass, w)
+
+def integrated_loudness(x: np.ndarray, sample_rate: int = TARGET_SAMPLE_RATE) -> float:
+    """
+    Gated integrated loudness of mono audio (ITU-R BS.1770)
+
+    The K-weighting filters are applied in the frequency domain, so the whole signal is
+    filtered by one FFT instead of a sample-by-sample IIR loop.
+
+    Returns:
+        float: Loudness in LUFS, or -inf for silence
+    """
+    if not len(x):
+        return float("-inf")
+    # Zero padding keeps the filters' decay from wrapping around to the start
+    n = 1 << int(np.ceil(np.log2(len(x) + sample_rate // 2)))
+    weighted = np.fft.irfft(np.fft.rfft(x, n) * _k_weighting(n, sample_rate), n)[:len(x)]
+
+    # Mean square of 400 ms blocks with 75% overlap
+    power = weighted * weighted
+    block, hop = int(0.4 * sample_rate), int(0.1 * sample_rate)
+    if len(power) < block:
+        energies = np.array([power.mean()])
+    else:
+        total = np.concatenate(([0.0], np.cumsum(power)))
+        starts = np.arange(0, len(power) - block + 1, hop)
+        energies = (total[starts + block] - total[starts]) / block
+
+    # Absolute gate at -70 LUFS, then a relative gate 10 LU below the gated loudness
+    with np.errstate(divide="ignore"):
+        loudness = -0.691 + 10.0 * np.log10(energies)
+    energies = energies[loudness > -70.0]
+    if not len(energies):
+        return float("-inf")
+    relative = -0.691 + 10.0 * np.log10(energies.mean()) - 10.0
+    energies = energies[-0.691 + 10.0 * np.log10(energies) > relative]
+    return float(-0.691 + 10.0 * np.log10(energies.mean()))
+
+def trim_silence(x: np.ndarray, sample_rate: int = TARGET_SAMPLE_RATE, threshold_db: float = -50.0,
+                 keep_start_ms: float = 30.0, keep_end_ms: float = 150.0, fade_ms: float = 5.0) -> np.ndarray:
+    """
+    Cut the silence before the first and after the last sample above a threshold
+
+    Args:
+        x (np.ndarray): Mono float32 samples
+        threshold_db (float): Level in dBFS below which audio counts as silence
+        keep_start_ms (float): Silence kept before the first sound
+        keep_end_ms (float): Silence kept after the last sound (the pause between sentences)
+        fade_ms (float): Fade applied at a cut so it does not click
+
+    Returns:
+        np.ndarray: The trimmed samples (x itself if nothing was cut or all of it is silent)
+    """
+    loud = np.flatnonzero(np.abs(x) >= _db_to_gain(threshold_db))
+    if not len(loud):
+        return x
+    start = max(0, loud[0] - int(keep_start_ms * sample_rate / 1000))
+    end = min(len(x), loud[-1] + 1 + int(keep_end_ms * sample_rate / 1000))
+    if start == 0 and end == len(x):
+        return x
+    y = np.array(x[start:end], dtype=np.float32)
+    fade = min(int(fade_ms * sample_rate / 1000), len(y) // 2)
+    if fade:
+        ramp = np.linspace(0.0, 1.0, fade, endpoint=False, dtype=np.float32)
+        if start > 0:
+            y[:fade] *= ramp
+        if end < len(x):
+            y[-fade:] *= ramp[::-1]
+    return y
+
+def _running_min(x: np.ndarray, width: int) -> np.ndarray:
+    """Minimum over a centered window of odd width (van Herk/Gil-Werman, O(n))"""
+    half = width // 2
+    total = -(-(len(x) + width - 1) // width) * width
+    padded = np.ones(total, dtype=x.dtype)
+    padded[half:half + len(x)] = x
+    blocks = padded.reshape(-1, width)
+    prefix = np.minimum.accumulate(blocks, axis=1).ravel()
+    suffix = np.minimum.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+    return np.minimum(suffix[:len(x)], prefix[width - 1:width - 1 + len(x)])
+
+def _moving_average(x: np.ndarray, width: int) -> np.ndarray:
+    """Mean over a centered window of odd width, extending the edge values"""
+    padded = np.pad(x, width // 2, mode="edge")
+    total = np.concatenate(([0.0], np.cumsum(padded, dtype=np.float64)))
+    return ((total[width:] - total[:-width]) / width).astype(x.dtype)
+
+def peak_limit(x: np.ndarray, sample_rate: int = TARGET_SAMPLE_RATE, ceiling: float = 0.891,
+               window_ms: float = 5.0) -> np.ndarray:
+    """
+    Keep peaks below ceiling with a smooth, look-ahead gain reduction
+
+    The gain each peak needs is spread over a window around it by a running minimum and
+    then smoothed by a moving average of the same width, so the gain never rises above
+    what a peak needs and changes without clicks.
+
+    Args:
+        x (np.ndarray): Mono float32 samples
+        ceiling (float): Highest allowed absolute sample value
+        window_ms (float): Attack and release time of the gain reduction
+
+    Returns:
+        np.ndarray: Limited samples (x itself if no sample exceeds the ceiling)
+    """
+    peaks = np.abs(x)
+    if not len(x) or peaks.max() <= ceiling:
+        return x
+    needed = np.minimum(1.0, ceiling / np.maximum(peaks, 1e-9)).astype(np.float32)
+    width = int(window_ms * sample_rate / 1000) | 1
+    gain = _moving_average(_running_min(needed, width), width)
+    return np.clip(x * gain, -ceiling, ceiling).astype(np.float32)
+
+class LeadingSilenceGate:
+    """
+    Drops the silence in front of streamed audio
+
+    Blocks are passed through process() in order. Until the first sample above the
+    threshold arrives nothing is returned; from then on every sample is, starting
+    keep_start_ms before that first sound. A fixed gain and a hard ceiling are applied to
+    everything that passes.
+    """
+    def __init__(self, sample_rate: int = TARGET_SAMPLE_RATE, threshold_db: float = -50.0,
+                 keep_start_ms: float = 30.0, gain: float = 1.0, ceiling: float = 1.0,
+                 enabled: bool = True):
+        self.threshold = _db_to_gain(threshold_db)
+        self.keep = int(keep_start_ms * sample_rate / 1000)
+        self.gain = np.float32(gain)
+        self.ceiling = ceiling
+        self.open = not enabled
+        self.dropped = 0  # Samples of leading silence removed
+        self._held = np.zeros(0, dtype=np.float32)
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        if self.gain != 1.0:
+            block = np.clip(block * self.gain, -self.ceiling, self.ceiling)
+        if self.open:
+            return block
+        loud = np.flatnonzero(np.abs(block) >= self.threshold)
+        if not len(loud):
+            # Keep the end of the silence for the margin before the first sound
+            held = np.concatenate((self._held, block))
+            self.dropped += len(held) - min(len(held), self.keep)
+            self._held = held[len(held) - min(len(held), self.keep):]
+            return block[:0]
+        self.open = True
+        held = np.concatenate((self._held, block))
+        start = max(0, len(self._held) + loud[0] - self.keep)
+        self.dropped += start
+        self._held = None
+        return held[start:]
+
+class PostProcessor:
+    """
+    Loudness normalization, silence trimming and peak limiting of new audio
+
+    process() may be called from several threads. The gain found for each voice is
+    remembered, so streamed audio of that voice can be leveled before it is complete.
+    """
+    def __init__(self, enabled: bool = True, silence_threshold_db: float = -50.0,
+                 keep_start_ms: float = 30.0, keep_end_ms: float = 150.0,
+                 target_lufs: float = -18.0, peak_db: float = -1.0, max_gain_db: float = 20.0):
+        """
+        Args:
+            enabled (bool): Process audio at all
+            silence_threshold_db (float): Level in dBFS (after normalization) below which
+                audio at the start and end counts as silence
+            keep_start_ms (float): Silence kept before the first sound
+            keep_end_ms (float): Silence kept after the last sound
+            target_lufs (float): Loudness everything is brought to (None keeps the level)
+            peak_db (float): Ceiling of the peak limiter in dBFS
+            max_gain_db (float): Largest boost, so near-silent audio is not amplified to noise
+        """
+        self.enabled = enabled
+        self.silence_threshold_db = silence_threshold_db
+        self.keep_start_ms = keep_start_ms
+        self.keep_end_ms = keep_end_ms
+        self.target_lufs = target_lufs
+        self.peak_db = peak_db
+        self.max_gain_db = max_gain_db
+        self._gains = {}   # voice -> last gain applied
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.trimmed_seconds = 0.0
+        self.busy_time = 0.0
+
+    def gain_for(self, pcm: np.ndarray, sample_rate: int = TARGET_SAMPLE_RATE) -> float:
+        """Linear gain that brings pcm to the target loudness"""
+        if self.target_lufs is None:
+            return 1.0
+        loudness = integrated_loudness(pcm, sample_rate)
+        if not np.isfinite(loudness):
+            return 1.0
+        return _db_to_gain(min(self.target_lufs - loudness, self.max_gain_db))
+
+    def process(self, pcm: np.ndarray, sample_rate: int = TARGET_SAMPLE_RATE, voice: str = None,
+                timings: dict = None) -> np.ndarray:
+        """
+        Normalize, trim and limit audio before it is cached
+
+        Args:
+            pcm (np.ndarray): Mono float32 samples
+            sample_rate (int): Sample rate of pcm
+            voice (str): Voice that spoke it; its gain is remembered for streaming
+            timings (dict): If given, seconds spent are added under "postprocess"
+
+        Returns:
+            np.ndarray: The processed samples (pcm itself when disabled)
+        """
+        if not self.enabled or not len(pcm):
+            return pcm
+        started = time.perf_counter()
+        gain = self.gain_for(pcm, sample_rate)
+        out = pcm * np.float32(gain) if gain != 1.0 else pcm
+        out = trim_silence(out, sample_rate, self.silence_threshold_db, self.keep_start_ms, self.keep_end_ms)
+        out = peak_limit(out, sample_rate, _db_to_gain(self.peak_db))
+        out = np.ascontiguousarray(out, dtype=np.float32)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            if voice is not None:
+                self._gains[voice] = gain
+            self.processed += 1
+            self.trimmed_seconds += (len(pcm) - len(out)) / sample_rate
+            self.busy_time += elapsed
+        if timings is not None:
+            timings["postprocess"] = timings.get("postprocess", 0.0) + elapsed
+        return out
+
+    def stream_gate(self, voice: str = None, sample_rate: int = TARGET_SAMPLE_RATE) -> LeadingSilenceGate:
+        """A gate for streamed audio of voice, leveled with the voice's last gain"""
+        with self._lock:
+            gain = self._gains.get(voice, 1.0) if self.enabled else 1.0
+        return LeadingSilenceGate(sample_rate, self.silence_threshold_db, self.keep_start_ms,
+                                  gain=gain, ceiling=_db_to_gain(self.peak_db), enabled=self.enabled)
+
+    def stats(self) -> dict:
+        """Clips processed, silence removed and time spent"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "processed": self.processed,
+                "trimmed_s_total": round(self.trimmed_seconds, 2),
+                "busy_ms_total": round(self.busy_time * 1000, 1),
+                "target_lufs": self.target_lufs,
+            }
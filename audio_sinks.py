@@ -0,0 +1,436 @@
+"""
+Output sinks for the audio engine.
+
+A sink owns the ring buffer of one output and pulls samples from it on its own clock.
+PortAudioSink plays to a sound card. The other sinks need no audio hardware, so playback
+can be exercised on a headless machine or in tests:
+
+    NullSink       discards the audio
+    WavFileSink    writes the played audio to a WAV file
+    LoopbackSink   keeps the played audio in memory with the time every block was played
+
+These run in real time, N times faster, as fast as possible (speed=float("inf")), or only
+when advance() is called (speed=0), which makes throughput, stop latency and underrun
+checks deterministic.
+"""
+
+import math
+import time
+import threading
+from collections import namedtuple
+
+import numpy as np
+import soundfile as sf
+try:
+    import sounddevice as sd
+except OSError:
+    # PortAudio is missing (e.g. on a headless server); only device output is unavailable
+    sd = None
+
+from audio_utils import FractionalResampler
+
+def list_output_devices() -> dict:
+    """
+    PortAudio devices that can play audio
+
+    Returns:
+        dict: Device name -> device index (empty if PortAudio is not available)
+    """
+    if sd is None:
+        return {}
+    return {info['name']: index for index, info in enumerate(sd.query_devices())
+            if info.get('max_output_channels', 0) > 0}
+
+def default_output_device():
+    """Index of the system default output device, or None"""
+    if sd is None:
+        return None
+    device = sd.default.device[1]
+    return device if device is not None and device >= 0 else None
+
+class RingBuffer:
+    """
+    Preallocated single-producer / single-consumer float32 ring buffer
+
+    The producer only advances the write counter and the consumer only advances the
+    read counter, so the audio callback can read without taking a lock.
+    """
+    def __init__(self, capacity: int):
+        """
+        Args:
+            capacity (int): Number of samples the buffer can hold
+        """
+        self.capacity = capacity
+        self._buf = np.zeros(capacity, dtype=np.float32)
+        self._read = 0
+        self._write = 0
+        self._flush_to = None
+
+    def available(self) -> int:
+        """Samples waiting to be read"""
+        return self._write - self._read
+
+    def free(self) -> int:
+        """Samples that can be written without overwriting unread data"""
+        return self.capacity - (self._write - self._read)
+
+    def write(self, samples: np.ndarray) -> int:
+        """
+        Copy samples into the buffer (producer side)
+
+        Returns:
+            int: Number of samples written, limited by the free space
+        """
+        n = min(len(samples), self.free())
+        start = self._write % self.capacity
+        first = min(n, self.capacity - start)
+        self._buf[start:start + first] = samples[:first]
+        self._buf[:n - first] = samples[first:n]
+        self._write += n
+        return n
+
+    def read_into(self, out: np.ndarray) -> int:
+        """
+        Fill out with buffered samples and pad with silence (consumer side)
+
+        Returns:
+            int: Number of real samples copied
+        """
+        if self._flush_to is not None:
+            self._read = max(self._read, self._flush_to)
+            self._flush_to = None
+        n = min(len(out), self._write - self._read)
+        start = self._read % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first] = self._buf[start:start + first]
+        out[first:n] = self._buf[:n - first]
+        out[n:] = 0.0
+        self._read += n
+        return n
+
+    def written(self) -> int:
+        """Total samples written since the buffer was created"""
+        return self._write
+
+    def played(self) -> int:
+        """Total samples read (or skipped by a flush) since the buffer was created"""
+        return self._read
+
+    def queued(self) -> int:
+        """Samples still to be played, ignoring anything a pending flush will skip"""
+        read = self._read if self._flush_to is None else max(self._read, self._flush_to)
+        return self._write - read
+
+    def request_flush(self):
+        """Ask the consumer to skip everything written so far (producer side)"""
+        self._flush_to = self._write
+
+
+class OutputSink:
+    """
+    Base class of all outputs: a ring buffer, its playback clock and synchronization state
+
+    Subclasses call render() whenever the output needs the next block. The engine opens
+    a sink when it is first routed to and closes it when it is no longer used.
+    """
+    # Name used in statistics
+    name = "sink"
+
+    def __init__(self):
+        self.sample_rate = None
+        self.blocksize = None
+        self.ring = None
+        self.underruns = 0
+        # True while the engine expects audio to keep coming; a short block then is an underrun
+        self.expect_audio = False
+        self._starved = False
+        # (ring index, time.perf_counter() at which it is heard), from the last render
+        self.clock = None
+        self.latency = 0.0
+        # Synchronization state (engine feeder thread only)
+        self.resampler = FractionalResampler()
+        self.ratio = 1.0       # Output samples per input sample
+        self.drift = 0.0       # Integrated clock correction
+        self.offset = 0.0      # Smoothed playback offset from the reference output (s)
+        self.backlog = np.zeros(0, dtype=np.float32)  # Resampled audio not yet in the ring
+        self.skip = 0          # Samples to drop from the next output
+        self.fed = 0           # Stream samples handed to this output
+        self.start_index = 0   # Ring index of the stream start
+
+    def open(self, sample_rate: int, blocksize: int, capacity: int):
+        """
+        Allocate the ring buffer and start pulling audio
+
+        Args:
+            sample_rate (int): Sample rate of the audio
+            blocksize (int): Frames per block
+            capacity (int): Ring buffer size in samples
+        """
+        self.sample_rate = sample_rate
+        self.blocksize = blocksize
+        self.ring = RingBuffer(capacity)
+        self._start()
+
+    def _start(self):
+        """Start the output (subclasses)"""
+
+    def close(self):
+        """Stop the output and release its resources"""
+
+    def render(self, out: np.ndarray, latency: float) -> int:
+        """
+        Fill out with the next samples
+
+        Args:
+            out (np.ndarray): Mono float32 block to fill
+            latency (float): Seconds until the first sample of out is heard
+
+        Returns:
+            int: Number of real samples (the rest is silence)
+        """
+        expected = self.expect_audio
+        n = self.ring.read_into(out)
+        # Count each gap once, and only after the stream has started playing here
+        starved = expected and n < len(out) and self.ring.played() > self.start_index
+        if starved and not self._starved:
+            self.underruns += 1
+        self._starved = starved
+        self.latency += 0.05 * (latency - self.latency)
+        self.clock = (self.ring.played() - n, time.perf_counter() + latency)
+        return n
+
+    def start_time(self, now: float) -> float:
+        """When audio written now would be heard (time.perf_counter() seconds)"""
+        queued = (self.ring.queued() + len(self.backlog)) / self.sample_rate
+        clock = self.clock
+        if clock is None:
+            return now + self.latency + queued
+        # The next block after the last render starts where the ring is read next
+        period = self.blocksize / self.sample_rate
+        next_block = clock[1] + period
+        earliest = now + self.latency
+        if next_block < earliest:
+            next_block += math.ceil((earliest - next_block) / period) * period
+        return next_block + queued
+
+    def playing_position(self, now: float):
+        """
+        Stream sample being played at time now, or None before the stream has started here
+        """
+        clock = self.clock
+        if clock is None or clock[0] < self.start_index:
+            return None
+        index = min(clock[0] + (now - clock[1]) * self.sample_rate, self.ring.written())
+        ahead = self.ring.written() - index + len(self.backlog) - self.skip
+        return self.fed - ahead / self.ratio
+
+    def reset_stream(self):
+        """Forget per-stream state; the learned clock drift is kept"""
+        self.resampler.reset()
+        self.backlog = np.zeros(0, dtype=np.float32)
+        self.skip = 0
+        self.fed = 0
+        self.offset = 0.0
+        self.ratio = 1.0 + self.drift
+        self.start_index = self.ring.written()
+
+class PortAudioSink(OutputSink):
+    """An always-open callback stream on a sound card"""
+    def __init__(self, device: int):
+        """
+        Args:
+            device (int): PortAudio output device index
+
+        Raises:
+            RuntimeError: If PortAudio is not available
+        """
+        super().__init__()
+        if sd is None:
+            raise RuntimeError("Audio output is not available: PortAudio library not found")
+        self.device = device
+        self.name = str(device)
+        self.stream = None
+
+    def _start(self):
+        self.stream = sd.OutputStream(
+            device=self.device,
+            samplerate=self.sample_rate,
+            channels=1,
+            dtype='float32',
+            blocksize=self.blocksize,
+            latency='low',
+            callback=self._callback
+        )
+        self.latency = float(self.stream.latency)
+        self.stream.start()
+
+    def _callback(self, outdata, frames, time_info, status):
+        if status.output_underflow:
+            self.underruns += 1
+        # Some host APIs report no DAC time; fall back to the nominal latency
+        latency = time_info.outputBufferDacTime - time_info.currentTime
+        if not 0.0 < latency < 1.0:
+            latency = self.stream.latency
+        self.render(outdata[:, 0], latency)
+
+    def close(self):
+        try:
+            self.stream.abort()
+            self.stream.close()
+        except Exception:
+            pass
+
+class ClockedSink(OutputSink):
+    """
+    Sink driven by its own clock instead of a sound card
+
+    With speed > 0 a thread pulls one block every blocksize / (sample_rate * speed)
+    seconds (float("inf") pulls as fast as the audio arrives). With speed=0 nothing
+    happens until advance() is called.
+    """
+    def __init__(self, speed: float = 1.0, latency: float = 0.0):
+        """
+        Args:
+            speed (float): Playback speed relative to real time (0 = manual)
+            latency (float): Simulated output latency in seconds
+        """
+        super().__init__()
+        self.speed = speed
+        self.latency = self._simulated_latency = latency
+        self.frames_played = 0   # Blocks pulled so far times blocksize
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+    def _start(self):
+        if self.speed > 0:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def close(self):
+        self._closed = True
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(1.0)
+
+    def advance(self, blocks: int = 1) -> int:
+        """
+        Pull blocks right now (any speed; the only clock when speed=0)
+
+        Returns:
+            int: Real samples played
+        """
+        return sum(self._pull() for _ in range(blocks))
+
+    def _pull(self) -> int:
+        with self._lock:
+            block = np.empty(self.blocksize, dtype=np.float32)
+            n = self.render(block, self._simulated_latency)
+            self.frames_played += self.blocksize
+            self.consume(block, n)
+            return n
+
+    def consume(self, block: np.ndarray, real: int):
+        """Handle a played block with real samples at the start (subclasses)"""
+
+    def _run(self):
+        fast = self.speed == float("inf")
+        period = 0.0 if fast else self.blocksize / (self.sample_rate * self.speed)
+        next_time = time.perf_counter()
+        while not self._closed:
+            n = self._pull()
+            if fast:
+                if n == 0:
+                    time.sleep(0.001)  # Nothing to play; do not spin
+                continue
+            next_time += period
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -0.5:
+                next_time = time.perf_counter()  # Fell far behind (e.g. suspended); resync
+
+    def render(self, out, latency):
+        n = super().render(out, latency)
+        if self.speed in (0, float("inf")):
+            self.clock = None  # Not on the wall clock; keep it out of synchronization
+        return n
+
+class NullSink(ClockedSink):
+    """Plays into nothing"""
+    name = "null"
+
+class WavFileSink(ClockedSink):
+    """
+    Writes the played audio to a WAV file
+
+    Only real samples are written; the silence between messages is left out.
+    """
+    name = "wav"
+
+    def __init__(self, path: str, speed: float = float("inf"), latency: float = 0.0):
+        """
+        Args:
+            path (str): WAV file to create (overwritten)
+            speed (float): Playback speed relative to real time (see ClockedSink)
+            latency (float): Simulated output latency in seconds
+        """
+        super().__init__(speed, latency)
+        self.path = path
+        self._file = None
+
+    def _start(self):
+        self._file = sf.SoundFile(self.path, 'w', samplerate=self.sample_rate, channels=1,
+                                  subtype='PCM_16', format='WAV')
+        super()._start()
+
+    def consume(self, block, real):
+        if real:
+            self._file.write(block[:real])
+
+    def close(self):
+        super().close()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+# A block of real audio played by a LoopbackSink
+PlayedBlock = namedtuple("PlayedBlock", "index frame wall_time samples")
+
+class LoopbackSink(ClockedSink):
+    """
+    Keeps the played audio in memory together with when each block was played
+
+    Every block with real audio is recorded as a PlayedBlock:
+        index      ring index of its first sample (counts everything ever written)
+        frame      sink frames played before it, i.e. its time on the sink clock
+        wall_time  time.perf_counter() when it was pulled
+        samples    the real samples
+    """
+    name = "loopback"
+
+    def __init__(self, speed: float = 0, latency: float = 0.0):
+        """
+        Args:
+            speed (float): Playback speed relative to real time (default: manual)
+            latency (float): Simulated output latency in seconds
+        """
+        super().__init__(speed, latency)
+        self.blocks = []
+
+    def consume(self, block, real):
+        if real:
+            self.blocks.append(PlayedBlock(self.ring.played() - real, self.frames_played - self.blocksize,
+                                           time.perf_counter(), block[:real].copy()))
+
+    def recorded(self) -> np.ndarray:
+        """All real samples played so far, in order"""
+        with self._lock:
+            if not self.blocks:
+                return np.zeros(0, dtype=np.float32)
+            return np.concatenate([b.samples for b in self.blocks])
+
+    def clear(self):
+        """Forget what has been recorded"""
+        with self._lock:
+            self.blocks = []
@@ -0,0 +1,395 @@
+"""
+Audio decoding and resampling helpers for the Discord TTS App.
+
+Edge TTS returns MP3 audio (24kHz mono), while Discord expects 48kHz. This module decodes
+the MP3 data in memory with libsndfile (through soundfile) and resamples it with a
+vectorized polyphase filter, so no ffmpeg process or temporary file is needed.
+"""
+
+import io
+import time
+from math import gcd
+
+import numpy as np
+import soundfile as sf
+
+# Sample rate used for all playback (required for Discord)
+TARGET_SAMPLE_RATE = 48000
+
+# libsndfile only decodes MP3 from version 1.1.0 on
+MP3_SUPPORTED = 'MP3' in sf.available_formats()
+
+# Layer III bitrate tables (kbps) indexed by the header bitrate index
+_MP3_BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],  # MPEG-1
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],       # MPEG-2 / 2.5
+}
+# Sample rate tables indexed by the header version bits
+_MP3_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],  # MPEG-1
+    2: [22050, 24000, 16000],  # MPEG-2
+    0: [11025, 12000, 8000],   # MPEG-2.5
+}
+
+def parse_mp3_frame_header(header: bytes):
+    """
+    Parse a 4-byte MPEG Layer III frame header
+
+    Args:
+        header (bytes): The first four bytes of a frame
+
+    Returns:
+        tuple: (frame_length, sample_rate, samples_per_frame), or None if the bytes
+               are not a valid Layer III header
+    """
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+    version = (header[1] >> 3) & 0x03
+    layer = (header[1] >> 1) & 0x03
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 0x03
+    padding = (header[2] >> 1) & 0x01
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+    if version == 3:
+        bitrate = _MP3_BITRATES[1][bitrate_index] * 1000
+        return 144 * bitrate // sample_rate + padding, sample_rate, 1152
+    bitrate = _MP3_BITRATES[2][bitrate_index] * 1000
+    return 72 * bitrate // sample_rate + padding, sample_rate, 576
+
+def _silence_frame(frame: bytes) -> bytes:
+    """
+    Make a Layer III frame decode as silence while keeping its bytes
+
+    Frames may take part of their audio data from the frames before them (the bit
+    reservoir). When decoding starts in the middle of a stream the first frame has no
+    such history, and libmpg123 reports it on stderr. Zeroing its side info turns it
+    into a valid, silent frame, and its data is still there for the frames after it.
+
+    Args:
+        frame (bytes): One complete frame
+
+    Returns:
+        bytes: The frame with its side info zeroed (unchanged if it carries a CRC)
+    """
+    if not frame[1] & 0x01:
+        return frame  # Protected by a CRC, which would no longer match
+    mpeg1 = (frame[1] >> 3) & 0x03 == 3
+    mono = frame[3] >> 6 == 3
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    return frame[:4] + bytes(side_info) + frame[4 + side_info:]
+
+def _to_mono(data: np.ndarray) -> np.ndarray:
+    """Mix multi-channel audio down to a contiguous mono float32 array"""
+    if data.ndim > 1:
+        data = data.mean(axis=1)
+    return np.ascontiguousarray(data, dtype=np.float32)
+
+class PolyphaseResampler:
+    """
+    Streaming rational resampler using a windowed-sinc polyphase filter
+
+    Only the filter phases that contribute to an output sample are evaluated, and all
+    output samples of a block are computed in one vectorized operation. The filter state
+    is kept between calls, so audio can be resampled block by block as it is decoded.
+    """
+    # Outputs computed per vectorized step (bounds temporary memory)
+    _CHUNK = 16384
+
+    def __init__(self, orig_sr: int, target_sr: int, taps_per_phase: int = 16):
+        """
+        Design the filter and initialize the stream state
+
+        Args:
+            orig_sr (int): Input sample rate
+            target_sr (int): Output sample rate
+            taps_per_phase (int): Filter length per polyphase branch (quality vs speed)
+        """
+        g = gcd(int(orig_sr), int(target_sr))
+        self.up = int(target_sr) // g
+        self.down = int(orig_sr) // g
+        self.taps = taps_per_phase
+
+        # Windowed-sinc low-pass at the lower of the two Nyquist frequencies,
+        # designed at the upsampled rate. Odd length keeps the delay a whole sample.
+        n_taps = self.up * taps_per_phase - 1
+        cutoff = 0.5 / max(self.up, self.down)
+        n = np.arange(n_taps) - (n_taps - 1) / 2
+        h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(n_taps, 8.0)
+        h *= self.up / h.sum()  # Unity gain after zero-stuffing
+        h = np.append(h, 0.0)
+
+        # phases[p, k] holds tap p + k*up; reversed so it lines up with input windows
+        self._phases = h.reshape(taps_per_phase, self.up).T[:, ::-1].astype(np.float32)
+        self._delay = (n_taps - 1) // 2
+
+        self.reset()
+
+    def reset(self):
+        """Clear the stream state so a new, unrelated signal can be processed"""
+        # Input history with (taps - 1) samples of leading silence
+        self._buf = np.zeros(self.taps - 1, dtype=np.float32)
+        self._base = -(self.taps - 1)   # Absolute input index of _buf[0]
+        self._pos = self._delay         # Next output position at the upsampled rate
+        self._total_in = 0
+        self._total_out = 0
+
+    def process(self, x: np.ndarray) -> np.ndarray:
+        """
+        Resample the next block of a signal
+
+        Args:
+            x (np.ndarray): Mono input samples
+
+        Returns:
+            np.ndarray: All output samples that can be computed so far
+        """
+        x = np.asarray(x, dtype=np.float32)
+        self._total_in += len(x)
+        self._buf = np.concatenate((self._buf, x))
+        return self._run(self._base + len(self._buf) - 1)
+
+    def flush(self) -> np.ndarray:
+        """
+        Finish the signal and return the remaining output samples
+
+        Returns:
+            np.ndarray: The tail of the resampled signal
+        """
+        expected = -(-self._total_in * self.up // self.down)
+        tail_in = self._delay // self.up + self.taps + 1
+        self._buf = np.concatenate((self._buf, np.zeros(tail_in, dtype=np.float32)))
+        out = self._run(self._base + len(self._buf) - 1, limit=expected - self._total_out)
+        self.reset()
+        return out
+
+    def _run(self, last_index, limit=None):
+        """Compute every output whose input window ends at or before last_index"""
+        last_pos = (last_index + 1) * self.up - 1
+        count = 0 if self._pos > last_pos else (last_pos - self._pos) // self.down + 1
+        if limit is not None:
+            count = max(0, min(count, limit))
+
+        out = np.empty(count, dtype=np.float32)
+        if count == 0:
+            return out  # Not enough input yet (the window view needs at least taps samples)
+        windows = np.lib.stride_tricks.sliding_window_view(self._buf, self.taps)
+        for start in range(0, count, self._CHUNK):
+            pos = self._pos + self.down * np.arange(start, min(start + self._CHUNK, count))
+            newest = pos // self.up - self._base
+            out[start:start + len(pos)] = np.einsum(
+                'ij,ij->i', windows[newest - self.taps + 1], self._phases[pos % self.up])
+
+        self._pos += self.down * count
+        self._total_out += count
+
+        # Drop input samples that no future output needs
+        keep_from = self._pos // self.up - (self.taps - 1) - self._base
+        if keep_from > 0:
+            self._buf = self._buf[keep_from:]
+            self._base += keep_from
+        return out
+
+def resample_poly(x: np.ndarray, orig_sr: int, target_sr: int) -> np.ndarray:
+    """
+    Resample a complete mono signal
+
+    Args:
+        x (np.ndarray): Mono input samples
+        orig_sr (int): Input sample rate
+        target_sr (int): Output sample rate
+
+    Returns:
+        np.ndarray: float32 samples at target_sr
+    """
+    x = np.asarray(x, dtype=np.float32)
+    if orig_sr == target_sr:
+        return x
+    resampler = PolyphaseResampler(orig_sr, target_sr)
+    return np.concatenate((resampler.process(x), resampler.flush()))
+
+class FractionalResampler:
+    """
+    Streaming resampler for ratios very close to 1 that may change from block to block
+
+    Used to keep two sound cards in step: a correction of a few hundred ppm is inaudible
+    but removes the drift between their clocks. Samples are interpolated with a cubic
+    Hermite (Catmull-Rom) spline; at a ratio of exactly 1 the input passes unchanged.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Forget the stream state"""
+        # The last three input samples and the next read position relative to them
+        self._hist = np.zeros(3, dtype=np.float32)
+        self._pos = 3.0
+
+    def process(self, x: np.ndarray, ratio: float) -> np.ndarray:
+        """
+        Resample the next block
+
+        Args:
+            x (np.ndarray): Mono input samples
+            ratio (float): Output samples per input sample
+
+        Returns:
+            np.ndarray: The resampled block (about len(x) * ratio samples)
+        """
+        buf = np.concatenate((self._hist, np.asarray(x, dtype=np.float32)))
+        step = 1.0 / ratio
+        # Each output needs the samples at floor(t) - 1 ... floor(t) + 2
+        count = max(0, int(np.ceil((len(buf) - 2 - self._pos) / step)))
+        t = self._pos + step * np.arange(count)
+        i = t.astype(np.int64)
+        f = (t - i).astype(np.float32)
+        y0, y1, y2, y3 = buf[i - 1], buf[i], buf[i + 1], buf[i + 2]
+        out = y1 + 0.5 * f * (y2 - y0 + f * (2 * y0 - 5 * y1 + 4 * y2 - y3 + f * (3 * (y1 - y2) + y3 - y0)))
+        self._pos = self._pos + step * count - (len(buf) - 3)
+        self._hist = buf[-3:]
+        return out.astype(np.float32)
+
+def decode_mp3(mp3_bytes: bytes, sample_rate: int = TARGET_SAMPLE_RATE, timings: dict = None) -> np.ndarray:
+    """
+    Decode MP3 data in memory into mono float32 samples
+
+    Args:
+        mp3_bytes (bytes): A complete MP3 stream
+        sample_rate (int): Sample rate of the returned audio
+        timings (dict): If given, seconds spent are added under "decode" and "resample"
+
+    Returns:
+        np.ndarray: Mono float32 samples at sample_rate
+    """
+    started = time.perf_counter()
+    data, fs = sf.read(io.BytesIO(mp3_bytes), dtype='float32')
+    data = _to_mono(data)
+    decoded = time.perf_counter()
+    pcm = resample_poly(data, fs, sample_rate)
+    if timings is not None:
+        timings["decode"] = timings.get("decode", 0.0) + decoded - started
+        timings["resample"] = timings.get("resample", 0.0) + time.perf_counter() - decoded
+    return pcm
+
+class Mp3StreamDecoder:
+    """
+    Incremental in-process MP3 decoder for audio that is still being received
+
+    Incoming bytes are split at frame boundaries and every batch of complete frames is
+    decoded as soon as it arrives. A few already-decoded frames are decoded again in
+    front of each batch so the decoder has the bit reservoir and overlap state it needs,
+    and their output is discarded; the first of them only supplies the reservoir and is
+    decoded as silence. Decoded audio is resampled with a streaming polyphase filter so
+    block boundaries stay seamless.
+    """
+    def __init__(self, sample_rate: int = TARGET_SAMPLE_RATE, prime_frames: int = 6):
+        """
+        Args:
+            sample_rate (int): Sample rate of the returned audio
+            prime_frames (int): Frames decoded again before each batch to warm up the decoder
+        """
+        self.sample_rate = sample_rate
+        self.prime_frames = prime_frames
+        self._buf = bytearray()
+        self._pending = []   # Complete frames not decoded yet
+        self._history = []   # Most recent decoded frames, used for priming
+        self._resampler = None
+        self._samples_per_frame = 0
+        self._header_checked = False
+        # Seconds spent so far, for latency statistics
+        self.decode_time = 0.0
+        self.resample_time = 0.0
+
+    def feed(self, data: bytes) -> np.ndarray:
+        """
+        Add received MP3 bytes
+
+        Args:
+            data (bytes): The next chunk of the MP3 stream
+
+        Returns:
+            np.ndarray: Newly decoded samples (may be empty)
+        """
+        self._buf += data
+        self._split_frames()
+        return self._decode_pending(final=False)
+
+    def flush(self) -> np.ndarray:
+        """
+        Decode everything that is left at the end of the stream
+
+        Returns:
+            np.ndarray: The remaining samples
+        """
+        self._split_frames()
+        out = self._decode_pending(final=True)
+        if self._resampler is not None:
+            started = time.perf_counter()
+            out = np.concatenate((out, self._resampler.flush()))
+            self.resample_time += time.perf_counter() - started
+        return out
+
+    def _split_frames(self):
+        """Move every complete frame from the byte buffer to the pending list"""
+        buf = self._buf
+        pos = 0
+        if not self._header_checked:
+            # Skip an ID3v2 tag at the start of the stream
+            if len(buf) < 10:
+                return
+            if buf[:3] == b'ID3':
+                size = (buf[6] << 21) | (buf[7] << 14) | (buf[8] << 7) | buf[9]
+                if len(buf) < 10 + size:
+                    return
+                pos = 10 + size
+            self._header_checked = True
+
+        while pos + 4 <= len(buf):
+            info = parse_mp3_frame_header(bytes(buf[pos:pos + 4]))
+            if info is None:
+                pos += 1  # Resynchronize on garbage
+                continue
+            length, fs, spf = info
+            if pos + length > len(buf):
+                break
+            frame = bytes(buf[pos:pos + length])
+            pos += length
+            # Xing/Info frames carry metadata only
+            if b'Xing' in frame[:64] or b'Info' in frame[:64]:
+                continue
+            if self._resampler is None:
+                self._resampler = PolyphaseResampler(fs, self.sample_rate)
+                self._samples_per_frame = spf
+            self._pending.append(frame)
+        del buf[:pos]
+
+    def _decode_pending(self, final):
+        """Decode the pending frames with priming frames in front of them"""
+        if not self._pending:
+            return np.zeros(0, dtype=np.float32)
+
+        prime = len(self._history)
+        if not final and prime + len(self._pending) < 3:
+            # Too short for format detection; wait for more frames
+            return np.zeros(0, dtype=np.float32)
+        started = time.perf_counter()
+        frames = self._history + self._pending
+        if prime:
+            frames[0] = _silence_frame(frames[0])
+        try:
+            data, _ = sf.read(io.BytesIO(b''.join(frames)), dtype='float32')
+        except Exception:
+            if final:
+                raise  # Nothing more will arrive, so the audio would be cut short
+            return np.zeros(0, dtype=np.float32)
+
+        pcm = _to_mono(data)[prime * self._samples_per_frame:]
+        self._history = (self._history + self._pending)[-self.prime_frames:]
+        self._pending = []
+        decoded = time.perf_counter()
+        self.decode_time += decoded - started
+        pcm = self._resampler.process(pcm)
+        self.resample_time += time.perf_counter() - decoded
+        return pcm
@@ -0,0 +1,214 @@
+"""
+Batch renderer for phrase packs.
+
+Renders a file of (text, voice, rate) rows with Edge TTS, either into the app's audio
+cache (so the phrases play instantly in the app) or as WAV files in an output folder.
+Requests go through the app's backend registry, so they get the same deadlines, retries
+and fallback voice as speech in the app.
+Downloads run concurrently on one asyncio loop with a fixed limit, and MP3 decoding and
+resampling run in a process pool so they do not hold up the downloads.
+
+Supported inputs:
+    .txt    one phrase per line (voice and rate from --voice / --rate)
+    .csv    columns text, voice, rate (header row optional; missing values use the defaults)
+    .jsonl  one {"text": ..., "voice": ..., "rate": ...} object per line
+
+Usage:
+    python batch_render.py phrases.csv --voice en-US-AriaNeural
+    python batch_render.py phrases.jsonl --out rendered --concurrency 8
+"""
+
+import os
+import re
+import sys
+import csv
+import json
+import time
+import asyncio
+import argparse
+import concurrent.futures
+
+import soundfile as sf
+
+from audio_utils import TARGET_SAMPLE_RATE, MP3_SUPPORTED, decode_mp3
+from tts_engine import AUDIO_CACHE, BACKENDS, POSTPROCESS, get_tts_key, load_audio
+
+def normalize_rate(rate) -> str:
+    """
+    Turn "10", "+10", "-5%" or 10 into the "+10%" form Edge TTS expects
+
+    Raises:
+        ValueError: If rate is not a percentage
+    """
+    value = str(rate).strip()
+    if not value:
+        return "+0%"
+    m = re.fullmatch(r'([+-]?\d+)%?', value)
+    if not m:
+        raise ValueError(f"Invalid rate: {rate}")
+    return f"{int(m.group(1)):+d}%"
+
+def read_rows(path: str, default_voice: str = None, default_rate: str = "+0%") -> list:
+    """
+    Read the phrases to render
+
+    Args:
+        path (str): A .txt, .csv or .jsonl file
+        default_voice (str): Voice for rows that do not name one
+        default_rate (str): Rate for rows that do not give one
+
+    Returns:
+        list: (line number, text, voice, rate) tuples
+
+    Raises:
+        ValueError: If a row has no voice and there is no default, or a rate is invalid
+    """
+    ext = os.path.splitext(path)[1].lower()
+    raw = []  # (line number, text, voice, rate)
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        if ext == '.jsonl':
+            for number, line in enumerate(f, 1):
+                if line.strip():
+                    item = json.loads(line)
+                    raw.append((number, item.get("text", ""), item.get("voice"), item.get("rate")))
+        elif ext == '.csv':
+            rows = list(csv.reader(f))
+            columns = ["text", "voice", "rate"]
+            start = 0
+            if rows and "text" in [c.strip().lower() for c in rows[0]]:
+                columns = [c.strip().lower() for c in rows[0]]
+                start = 1
+            for number, row in enumerate(rows[start:], start + 1):
+                item = dict(zip(columns, row))
+                raw.append((number, item.get("text", ""), item.get("voice"), item.get("rate")))
+        else:
+            for number, line in enumerate(f, 1):
+                raw.append((number, line, None, None))
+
+    rows = []
+    for number, text, voice, rate in raw:
+        text = (text or "").strip()
+        if not text:
+            continue
+        voice = (voice or "").strip() or default_voice
+        if not voice:
+            raise ValueError(f"Line {number}: no voice given and no --voice default")
+        rows.append((number, text, voice, normalize_rate(rate if rate not in (None, "") else default_rate)))
+    return rows
+
+def _output_name(index: int, text: str) -> str:
+    """File name for a rendered phrase: its position plus a readable slug"""
+    slug = re.sub(r'\W+', '_', text).strip('_')[:40] or "phrase"
+    return f"{index:04d}_{slug}.wav"
+
+async def render_batch(rows, out_dir=None, concurrency: int = 4, workers: int = None) -> dict:
+    """
+    Render rows into the cache, or into out_dir if given
+
+    Args:
+        rows (list): (line number, text, voice, rate) tuples from read_rows()
+        out_dir (str): Folder for WAV files; None writes into the audio cache
+        concurrency (int): Edge TTS requests in flight at once
+        workers (int): Decoder processes (default: one per CPU)
+
+    Returns:
+        dict: Counts, audio duration, elapsed time and failures
+    """
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+    report = {"rendered": 0, "cached": 0, "failed": [], "audio_seconds": 0.0}
+
+    def store(name, key, pcm, voice=None):
+        """
+        Write decoded audio to its destination (runs in a thread) and return it
+
+        New audio (voice given) is trimmed and leveled first, like everything the app caches.
+        """
+        if voice is not None:
+            pcm = POSTPROCESS.process(pcm, TARGET_SAMPLE_RATE, voice=voice)
+        if out_dir:
+            sf.write(os.path.join(out_dir, name), pcm, TARGET_SAMPLE_RATE, subtype='PCM_16', format='WAV')
+        else:
+            AUDIO_CACHE.put_pcm(key, pcm, TARGET_SAMPLE_RATE)
+        return pcm
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        async def render(index, number, text, voice, rate):
+            key = get_tts_key(text, voice, rate)
+            name = _output_name(index, text)
+            try:
+                cached = AUDIO_CACHE.get(key)
+                if cached:
+                    report["cached"] += 1
+                    if out_dir:
+                        pcm = load_audio(cached)[0]
+                        await loop.run_in_executor(None, store, name, key, pcm)
+                    report["audio_seconds"] += sf.info(cached).duration
+                    return
+                async with semaphore:
+                    stream = await BACKENDS.open(text, voice, rate)
+                    mp3_bytes = await stream.read()
+                if not mp3_bytes:
+                    raise RuntimeError("No audio received")
+                # A fallback backend sounds different, so its audio gets its own key
+                cache_voice = stream.backend.cache_voice(voice)
+                if cache_voice != voice:
+                    key = get_tts_key(text, cache_voice, rate)
+                pcm = await loop.run_in_executor(pool, decode_mp3, mp3_bytes, TARGET_SAMPLE_RATE)
+                pcm = await loop.run_in_executor(None, store, name, key, pcm, cache_voice)
+                report["rendered"] += 1
+                report["audio_seconds"] += len(pcm) / TARGET_SAMPLE_RATE
+            except Exception as e:
+                report["failed"].append((number, text, f"{type(e).__name__}: {e}"))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(render(i, *row) for i, row in enumerate(rows, 1)))
+        report["elapsed"] = time.perf_counter() - started
+
+    AUDIO_CACHE.close()
+    return report
+
+def print_report(report: dict, total: int):
+    """Print throughput and failures"""
+    elapsed = max(report["elapsed"], 1e-9)
+    done = report["rendered"] + report["cached"]
+    print(f"Rendered {report['rendered']} and reused {report['cached']} cached of {total} "
+          f"phrases in {elapsed:.1f}s")
+    print(f"Throughput: {done / elapsed:.2f} utterances/s, "
+          f"{report['audio_seconds'] / elapsed:.2f} audio-seconds/s "
+          f"({report['audio_seconds']:.1f}s of audio)")
+    if report["failed"]:
+        print(f"Failures: {len(report['failed'])}")
+        for number, text, error in report["failed"]:
+            print(f"  line {number}: {text[:50]!r}: {error}")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Render a phrase pack with Edge TTS")
+    parser.add_argument("input", help="Phrases as .txt, .csv or .jsonl")
+    parser.add_argument("--voice", help="Voice for rows without one (e.g. en-US-AriaNeural)")
+    parser.add_argument("--rate", default="+0%", help="Rate for rows without one (default: +0%%)")
+    parser.add_argument("--out", help="Write WAV files to this folder instead of the app cache")
+    parser.add_argument("--concurrency", type=int, default=4, help="Requests in flight (default: 4)")
+    parser.add_argument("--workers", type=int, default=None, help="Decoder processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    if not MP3_SUPPORTED:
+        print("Batch rendering needs libsndfile 1.1 or newer (MP3 support)", file=sys.stderr)
+        return 2
+    try:
+        rows = read_rows(args.input, args.voice, normalize_rate(args.rate))
+    except (OSError, ValueError) as e:
+        print(f"Could not read {args.input}: {e}", file=sys.stderr)
+        return 2
+    if not rows:
+        print("Nothing to render")
+        return 0
+
+    report = asyncio.run(render_batch(rows, args.out, max(1, args.concurrency), args.workers))
+    print_report(report, len(rows))
+    return 1 if report["failed"] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
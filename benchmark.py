@@ -0,0 +1,327 @@
+"""
+End-to-end latency benchmark for the Discord TTS App.
+
+Runs scripted workloads against a local stand-in for the Edge TTS websocket endpoint, so
+results do not depend on the real service or the network. The stand-in answers every
+request with canned MP3 audio after a configurable latency and jitter, sending it in
+chunks the way Edge TTS does. Audio goes through _tts_edge, the caches and the playback
+engine with no output devices, which acts as a null sink.
+
+Reported as JSON (p50/p95/p99 in milliseconds):
+    synthesis     request to audio in the cache on a miss (_tts_edge, cold cache)
+    decode        MP3 decode and resample of one utterance (decode_mp3)
+    cache_hit     _tts_edge + load_audio for cached text (memory and disk tier)
+    first_sample  speak() to the first sample handed to the output, cold cache
+    throughput    utterances/s and audio-seconds/s for a concurrent batch
+
+Usage:
+    python benchmark.py --latency 80 --jitter 30 --output results.json
+    python benchmark.py --compare results.json      # print changes against a baseline
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+
+import numpy as np
+import soundfile as sf
+from aiohttp import web, WSMsgType
+import edge_tts.communicate
+
+import tts_engine
+from audio_utils import TARGET_SAMPLE_RATE, MP3_SUPPORTED, decode_mp3, parse_mp3_frame_header
+from audio_cache import AudioCache, PcmCache
+from audio_engine import AudioEngine
+from audio_sinks import NullSink
+
+class FakeEdgeServer:
+    """
+    Local websocket server speaking enough of the Edge TTS protocol for edge_tts
+
+    Every SSML request is answered with MP3 audio whose length follows the text length.
+    The first audio chunk is delayed by latency plus a random jitter; later chunks follow
+    at chunk_interval.
+    """
+    # Seconds of audio per character of text, roughly natural speech
+    SECONDS_PER_CHAR = 0.065
+
+    def __init__(self, latency: float = 0.08, jitter: float = 0.03, chunk_frames: int = 8,
+                 chunk_interval: float = 0.01, seed: int = 1):
+        """
+        Args:
+            latency (float): Seconds before the first audio chunk
+            jitter (float): Maximum extra random delay in seconds (uniform)
+            chunk_frames (int): MP3 frames per websocket message
+            chunk_interval (float): Seconds between audio messages
+            seed (int): Seed for the jitter so runs are repeatable
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.chunk_frames = chunk_frames
+        self.chunk_interval = chunk_interval
+        self._random = random.Random(seed)
+        self._mp3 = {}  # duration in 1/10 s -> MP3 bytes
+        self.port = None
+        self.requests = 0
+        self._loop = None
+        self._runner = None
+
+    def start(self):
+        """Start the server on a free localhost port in a background thread"""
+        ready = threading.Event()
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self._start())
+            ready.set()
+            self._loop.run_forever()
+        threading.Thread(target=run, daemon=True).start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        """Shut the server down"""
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    @property
+    def url(self) -> str:
+        """Replacement for edge_tts' WSS_URL"""
+        return f"ws://127.0.0.1:{self.port}/edge/v1?TrustedClientToken=benchmark"
+
+    async def _start(self):
+        app = web.Application()
+        app.add_routes([web.get('/edge/v1', self._handle)])
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    def _audio_for(self, text: str) -> bytes:
+        """Canned speech-like MP3 (a gliding tone) with a duration that follows the text"""
+        tenths = max(5, int(len(text) * self.SECONDS_PER_CHAR * 10))
+        if tenths not in self._mp3:
+            t = np.arange(tenths * 2400) / 24000
+            x = 0.3 * np.sin(2 * np.pi * (180 + 40 * np.sin(2 * np.pi * 3 * t)) * t)
+            buf = io.BytesIO()
+            sf.write(buf, x.astype(np.float32), 24000, format='MP3', subtype='MPEG_LAYER_III')
+            self._mp3[tenths] = buf.getvalue()
+        return self._mp3[tenths]
+
+    @staticmethod
+    def _frames(mp3: bytes) -> list:
+        """Split an MP3 stream into frames"""
+        frames, pos = [], 0
+        while pos + 4 <= len(mp3):
+            info = parse_mp3_frame_header(mp3[pos:pos + 4])
+            if info is None:
+                pos += 1
+                continue
+            frames.append(mp3[pos:pos + info[0]])
+            pos += info[0]
+        return frames
+
+    async def _handle(self, request):
+        ws = web.WebSocketResponse(compress=True)
+        await ws.prepare(request)
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT or "Path:ssml" not in msg.data:
+                continue
+            self.requests += 1
+            request_id = msg.data.split("X-RequestId:", 1)[1].split("\r\n", 1)[0]
+            text = msg.data.split("<prosody", 1)[1].split(">", 1)[1].split("</prosody>", 1)[0]
+            frames = self._frames(self._audio_for(text))
+
+            await asyncio.sleep(self.latency + self._random.uniform(0, self.jitter))
+            await ws.send_str(f"X-RequestId:{request_id}\r\nPath:turn.start\r\n\r\n{{}}")
+            header = (f"X-RequestId:{request_id}\r\nContent-Type:audio/mpeg\r\n"
+                      f"Path:audio\r\n").encode()
+            for i in range(0, len(frames), self.chunk_frames):
+                chunk = b''.join(frames[i:i + self.chunk_frames])
+                await ws.send_bytes(len(header).to_bytes(2, "big") + header + chunk)
+                await asyncio.sleep(self.chunk_interval)
+            await ws.send_str(f"X-RequestId:{request_id}\r\nPath:turn.end\r\n\r\n{{}}")
+        return ws
+
+def summarize(samples: list) -> dict:
+    """Count, mean and p50/p95/p99/max of durations in seconds, reported in ms"""
+    if not samples:
+        return {"count": 0}
+    ms = np.asarray(samples) * 1000
+    return {
+        "count": len(ms),
+        "mean": round(float(ms.mean()), 2),
+        "p50": round(float(np.percentile(ms, 50)), 2),
+        "p95": round(float(np.percentile(ms, 95)), 2),
+        "p99": round(float(np.percentile(ms, 99)), 2),
+        "max": round(float(ms.max()), 2),
+    }
+
+def _phrases(count: int, tag: str) -> list:
+    """Distinct phrases of varying length so every run starts with a cold cache"""
+    words = ("quick brown fox jumps over the lazy dog while the cat watches from a warm "
+             "sunny window sill and the birds sing").split()
+    rng = random.Random(count)
+    return [f"{tag} {i}: " + " ".join(rng.choice(words) for _ in range(rng.randint(3, 24))) + "."
+            for i in range(count)]
+
+async def run_workloads(voice: str, count: int, concurrency: int) -> dict:
+    """Run every workload and return the summarized results"""
+    results = {}
+
+    # Synthesis through the backends, decoder and cache the app uses; every phrase is new
+    synthesis = []
+    for text in _phrases(count, "synth"):
+        started = time.perf_counter()
+        await tts_engine._tts_edge(text, voice, "+0%")
+        synthesis.append(time.perf_counter() - started)
+
+    # Decode on its own, on audio fetched through the backend registry
+    decode = []
+    for text in _phrases(count, "decode"):
+        stream = await tts_engine.BACKENDS.open(text, voice, "+0%")
+        mp3 = await stream.read()
+        started = time.perf_counter()
+        decode_mp3(mp3, TARGET_SAMPLE_RATE)
+        decode.append(time.perf_counter() - started)
+    results["synthesis"] = summarize(synthesis)
+    results["decode"] = summarize(decode)
+
+    # Cache hits: render once, then time lookups from memory and from disk
+    texts = _phrases(count, "cache")
+    for text in texts:
+        await tts_engine._tts_edge(text, voice, "+0%")
+    memory_hits, disk_hits = [], []
+    for text in texts:
+        started = time.perf_counter()
+        tts_engine.load_audio(await tts_engine._tts_edge(text, voice, "+0%"))
+        memory_hits.append(time.perf_counter() - started)
+        tts_engine.PCM_CACHE.discard(tts_engine.get_tts_key(text, voice, "+0%"))
+        started = time.perf_counter()
+        tts_engine.load_audio(await tts_engine._tts_edge(text, voice, "+0%"))
+        disk_hits.append(time.perf_counter() - started)
+    results["cache_hit"] = summarize(memory_hits)
+    results["cache_hit_disk"] = summarize(disk_hits)
+
+    # Request to first sample through the queue and playback engine (null sink)
+    engine = _null_sink_engine(asyncio.get_running_loop())
+    errors = []
+    engine.scheduler.on_error = lambda utterance, error: errors.append(error)
+    first_samples = []
+    for text in _phrases(count, "speak"):
+        utterance = await engine.speak(text, voice)
+        first_samples.append(await asyncio.wrap_future(utterance.first_audio))
+        while engine.busy:
+            await asyncio.sleep(0.001)
+    results["first_sample"] = {**summarize(first_samples), "errors": len(errors)}
+    results["stages"] = engine.timing_stats()
+
+    # Throughput of a concurrent batch
+    semaphore = asyncio.Semaphore(concurrency)
+    audio_seconds = 0.0
+    async def render(text):
+        nonlocal audio_seconds
+        async with semaphore:
+            samples = tts_engine.load_audio(await tts_engine._tts_edge(text, voice, "+0%"))[0]
+            audio_seconds += len(samples) / TARGET_SAMPLE_RATE
+    batch = _phrases(count * 4, "batch")
+    started = time.perf_counter()
+    await asyncio.gather(*(render(text) for text in batch))
+    elapsed = time.perf_counter() - started
+    results["throughput"] = {
+        "utterances": len(batch),
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "utterances_per_s": round(len(batch) / elapsed, 2),
+        "audio_seconds_per_s": round(audio_seconds / elapsed, 2),
+    }
+    engine.close()
+    # Close the warm connections on this loop, before the fake server shuts down
+    await tts_engine.EDGE.connections.close()
+    return results
+
+def _null_sink_engine(loop):
+    """A TtsEngine on the given loop that plays into a null sink as fast as possible"""
+    output = AudioEngine()
+    output.set_routes({"null": NullSink(speed=float("inf"))})
+    engine = tts_engine.TtsEngine(output=output, loop=loop, timing_log=None)
+    engine.stream_playback = True
+    return engine
+
+def _version() -> str:
+    """git describe of the tree being measured, if available"""
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+                              timeout=5).stdout.strip() or "unknown"
+    except Exception:
+        return "unknown"
+
+def compare(current: dict, baseline: dict):
+    """Print percentile changes against an earlier result file"""
+    for name, stats in current["results"].items():
+        old = baseline.get("results", {}).get(name, {})
+        if "p50" not in stats and "utterances_per_s" not in stats:
+            continue  # Nested per-stage table
+        for field in ("p50", "p95", "p99", "utterances_per_s", "audio_seconds_per_s"):
+            if field in stats and old.get(field):
+                change = (stats[field] - old[field]) / old[field] * 100
+                print(f"{name:>15} {field:>20}: {old[field]:>10} -> {stats[field]:>10} ({change:+.1f}%)")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Latency benchmark against a fake Edge TTS server")
+    parser.add_argument("--latency", type=float, default=80, help="Server latency in ms (default: 80)")
+    parser.add_argument("--jitter", type=float, default=30, help="Random extra latency in ms (default: 30)")
+    parser.add_argument("--chunk-interval", type=float, default=10, help="ms between audio chunks (default: 10)")
+    parser.add_argument("--count", type=int, default=30, help="Utterances per workload (default: 30)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Requests in flight for throughput (default: 4)")
+    parser.add_argument("--voice", default="en-US-AriaNeural")
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    parser.add_argument("--compare", help="Baseline JSON file to compare against")
+    args = parser.parse_args(argv)
+
+    if not MP3_SUPPORTED:
+        print("The benchmark needs libsndfile 1.1 or newer (MP3 support)", file=sys.stderr)
+        return 2
+
+    server = FakeEdgeServer(args.latency / 1000, args.jitter / 1000,
+                            chunk_interval=args.chunk_interval / 1000).start()
+    edge_tts.communicate.WSS_URL = server.url
+
+    # Keep the user's cache out of it
+    with tempfile.TemporaryDirectory() as cache_dir:
+        tts_engine.AUDIO_CACHE = AudioCache(cache_dir)
+        tts_engine.PCM_CACHE = PcmCache()
+        try:
+            results = asyncio.run(run_workloads(args.voice, args.count, args.concurrency))
+        finally:
+            server.stop()
+
+    report = {
+        "version": _version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"latency_ms": args.latency, "jitter_ms": args.jitter,
+                   "chunk_interval_ms": args.chunk_interval, "count": args.count,
+                   "concurrency": args.concurrency},
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    print(output)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(report, json.load(f))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""
+Bounded worker pool for blocking work in the Discord TTS App.
+
+Synthesis runs on one asyncio loop, shared by previews, voice listing and every queued
+message. Decoding MP3 data, resampling and writing WAV files block for milliseconds to
+seconds, and done inline they stall every other coroutine on that loop. BoundedExecutor
+runs such work on a small thread pool (numpy, libsndfile and ffmpeg release the GIL) and
+limits how many jobs may be queued: once the pool is saturated, further callers wait
+asynchronously for a slot instead of piling up work and memory.
+"""
+
+import time
+import asyncio
+import threading
+import functools
+import concurrent.futures
+
+class BoundedExecutor:
+    """
+    Thread pool with back-pressure for coroutines
+
+    run() may be awaited from any event loop. A slot is held until the job has actually
+    finished, so cancelled callers never let more work pile up than max_pending.
+    """
+    def __init__(self, max_workers: int = 2, max_pending: int = 8, name: str = "tts-worker"):
+        """
+        Args:
+            max_workers (int): Threads running jobs
+            max_pending (int): Jobs that may be running or queued at once
+            name (str): Thread name prefix
+        """
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._waiters = {}   # loop -> futures of callers waiting for a slot
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.pending = 0
+        self.waited = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self.busy_time = 0.0
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Run func(*args, **kwargs) on the pool once a slot is free
+
+        Returns:
+            The result of func; its exception is raised here
+        """
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        if not self._slots.acquire(blocking=False):
+            # Back-pressure: wait on the loop (not in a thread) until a job finishes
+            with self._lock:
+                self.waited += 1
+            while True:
+                waiter = loop.create_future()
+                with self._lock:
+                    self._waiters.setdefault(loop, []).append(waiter)
+                # Retry after registering, so a slot freed in between is not missed
+                acquired = self._slots.acquire(blocking=False)
+                try:
+                    if not acquired:
+                        await waiter
+                finally:
+                    with self._lock:
+                        waiters = self._waiters.get(loop, [])
+                        if waiter in waiters:
+                            waiters.remove(waiter)
+                if acquired:
+                    break
+        waited = time.perf_counter() - started
+        with self._lock:
+            self.pending += 1
+            self.wait_time += waited
+            self.max_wait = max(self.max_wait, waited)
+        try:
+            job = self._pool.submit(self._timed, functools.partial(func, *args, **kwargs))
+        except BaseException:
+            self._release(None)
+            raise
+        job.add_done_callback(self._release)
+        return await asyncio.wrap_future(job)
+
+    def stats(self) -> dict:
+        """Jobs finished, jobs running or queued, and time spent waiting for a slot"""
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "pending": self.pending,
+                "completed": self.completed,
+                "waited": self.waited,
+                "wait_ms_total": round(self.wait_time * 1000, 1),
+                "wait_ms_max": round(self.max_wait * 1000, 1),
+                "busy_ms_total": round(self.busy_time * 1000, 1),
+            }
+
+    def shutdown(self):
+        """Stop the worker threads once the jobs already submitted have finished"""
+        self._pool.shutdown(wait=False)
+
+    def _timed(self, call):
+        started = time.perf_counter()
+        try:
+            return call()
+        finally:
+            with self._lock:
+                self.busy_time += time.perf_counter() - started
+
+    def _release(self, job):
+        """Free the slot of a finished or cancelled job and wake the waiting callers"""
+        self._slots.release()
+        with self._lock:
+            self.pending -= 1
+            if job is not None and not job.cancelled():
+                self.completed += 1
+            waiting, self._waiters = self._waiters, {}
+        # Every waiter retries; the ones that find no free slot wait again
+        for loop, waiters in waiting.items():
+            for waiter in waiters:
+                try:
+                    loop.call_soon_threadsafe(self._wake, waiter)
+                except RuntimeError:
+                    pass  # That loop has been closed
+
+    @staticmethod
+    def _wake(waiter):
+        if not waiter.done():
+            waiter.set_result(None)
@@ -0,0 +1,153 @@
+"""
+Startup cache warming for the Discord TTS App.
+
+Frequently and recently sent messages are rendered into the audio cache in the
+background after the UI appears, so replaying a common phrase does not need a network
+round-trip. The warmer renders one message at a time, waits while the user is speaking
+and abandons its current render as soon as a real request for other audio comes in. A
+request for the message being warmed shares that render instead (see SingleFlight).
+"""
+
+import time
+import asyncio
+from datetime import datetime
+
+def rank_history(history: list, limit: int, half_life_days: float = 7.0, now=None) -> list:
+    """
+    Rank history messages by how often and how recently they were sent
+
+    Every occurrence of a message adds a weight that halves every half_life_days, so a
+    phrase sent many times last month can still beat one sent once today.
+
+    Args:
+        history (list): History entries with "text", "date" and "timestamp"
+        limit (int): Maximum number of messages to return
+        half_life_days (float): Age at which an occurrence counts half
+        now (datetime): Reference time (default: now)
+
+    Returns:
+        list: Distinct message texts, best first
+    """
+    now = now or datetime.now()
+    scores = {}
+    latest = {}
+    for position, entry in enumerate(history):
+        text = entry.get("text", "").strip()
+        if not text:
+            continue
+        try:
+            sent = datetime.strptime(f'{entry.get("date")} {entry.get("timestamp")}', "%Y-%m-%d %H:%M:%S")
+            age_days = max(0.0, (now - sent).total_seconds() / 86400)
+        except (TypeError, ValueError):
+            # Entries without a usable date count as old, newer ones slightly less so
+            age_days = 30.0 + (len(history) - position)
+        scores[text] = scores.get(text, 0.0) + 0.5 ** (age_days / half_life_days)
+        latest[text] = max(latest.get(text, position), position)
+    ranked = sorted(scores, key=lambda t: (scores[t], latest[t]), reverse=True)
+    return ranked[:limit]
+
+class CacheWarmer:
+    """
+    Low-priority background renderer for a list of messages
+
+    Runs on the app's asyncio loop. Before each render it waits until the app has been
+    idle for idle_delay seconds; preempt() cancels the render in progress, which is
+    retried once the app is idle again.
+    """
+    def __init__(self, loop, synthesize, is_cached, is_busy, idle_delay: float = 1.5):
+        """
+        Args:
+            loop: The asyncio event loop that runs the synthesis coroutines
+            synthesize: Coroutine function (text, voice, rate) that renders into the cache
+            is_cached (callable): (text, voice, rate) -> whether the audio is cached
+            is_busy (callable): Whether the app is currently speaking
+            idle_delay (float): Quiet time required after user activity before rendering
+        """
+        self.loop = loop
+        self.synthesize = synthesize
+        self.is_cached = is_cached
+        self.is_busy = is_busy
+        self.idle_delay = idle_delay
+        self._last_activity = 0.0
+        self._current = None   # asyncio task of the render in progress
+        self._current_request = None  # (text, voice, rate) of that render
+        self._task = None      # concurrent.futures.Future of the warming run
+        self._run_id = 0       # Bumped by stop() so a cancelled run does not retry
+        self.warmed = 0
+        self.skipped = 0
+        self.preempted = 0
+        self.failed = 0
+
+    def start(self, texts: list, voice: str, rate: str):
+        """
+        Render texts in order in the background, replacing any earlier run
+
+        Args:
+            texts (list): Messages to render, most valuable first
+            voice (str): Voice name
+            rate (str): Speaking rate
+        """
+        self.stop()
+        self._task = asyncio.run_coroutine_threadsafe(
+            self._run(self._run_id, list(texts), voice, rate), self.loop)
+
+    def rendering(self, text: str, voice: str, rate: str) -> bool:
+        """Whether the render in progress is for this message"""
+        return self._current is not None and self._current_request == (text, voice, rate)
+
+    def preempt(self, text: str = None, voice: str = None, rate: str = None):
+        """
+        A real request arrived: abandon the current render and wait for idle time
+
+        If the request is for the message being rendered, the render is kept so the request
+        can join it rather than start the same work again.
+        """
+        self._last_activity = time.monotonic()
+        current = self._current
+        if current is not None and not self.rendering(text, voice, rate):
+            self.loop.call_soon_threadsafe(current.cancel)
+
+    def stop(self):
+        """Cancel the warming run"""
+        self._run_id += 1
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        """Counters for the current and previous runs"""
+        return {
+            "warmed": self.warmed,
+            "skipped": self.skipped,
+            "preempted": self.preempted,
+            "failed": self.failed,
+        }
+
+    async def _wait_idle(self):
+        while self.is_busy() or time.monotonic() - self._last_activity < self.idle_delay:
+            await asyncio.sleep(0.25)
+
+    async def _run(self, run_id, texts, voice, rate):
+        for text in texts:
+            while True:
+                await self._wait_idle()
+                if self.is_cached(text, voice, rate):
+                    self.skipped += 1
+                    break
+                self._current_request = (text, voice, rate)
+                self._current = asyncio.ensure_future(self.synthesize(text, voice, rate))
+                try:
+                    await self._current
+                    self.warmed += 1
+                    break
+                except asyncio.CancelledError:
+                    if run_id != self._run_id:
+                        raise
+                    self.preempted += 1  # Retry once the user is done
+                except Exception as e:
+                    print(f"Cache warming failed for a message: {e}")
+                    self.failed += 1
+                    break
+                finally:
+                    self._current = None
+                    self._current_request = None
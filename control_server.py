@@ -0,0 +1,266 @@
+"""
+Local control server for the Discord TTS App.
+
+Lets bots, scripts and stream-deck macros drive the app over HTTP or a WebSocket. The
+server only listens on localhost and runs on the engine's asyncio loop, so requests go
+through the same cache and queue as the Speak button and never wait on the Tk mainloop.
+
+HTTP endpoints (JSON in and out):
+    POST /speak   {"text", "voice"?, "rate"?, "policy"?, "priority"?, "routes"?, "wait"?}
+                  Queues the text. "routes" is a list of configured route names. With
+                  "wait": true the reply is sent once the first sample is handed to the
+                  playback engine and includes "latency_ms".
+    POST /stop    Stops playback and clears the queue
+    GET  /status  Current utterance and queue
+    GET  /metrics Rolling per-stage latency in the Prometheus text format
+
+WebSocket /ws: send {"op": "speak", ...}, {"op": "stop"} or {"op": "status"}. Every
+queued utterance reports back {"event": "first_sample", "id", "latency_ms"} once its first
+sample is handed to the playback engine, or a "dropped" / "error" event.
+
+Usage without the GUI:
+    python control_server.py --voice en-US-AriaNeural --port 8765
+"""
+
+import sys
+import hmac
+import json
+import time
+import asyncio
+import argparse
+from urllib.parse import urlsplit
+
+from aiohttp import web, WSMsgType
+
+from speech_pipeline import UtteranceScheduler
+
+# Browser origins allowed to call the API; pages on any other host are refused
+LOCAL_HOSTS = {"127.0.0.1", "localhost", "::1"}
+
+def _is_local_origin(origin: str) -> bool:
+    """Whether an Origin header names a page served from this machine"""
+    try:
+        parts = urlsplit(origin)
+        return parts.scheme in ("http", "https") and parts.hostname in LOCAL_HOSTS
+    except ValueError:
+        return False
+
+class ControlServer:
+    """
+    aiohttp application exposing a TtsEngine on localhost
+
+    POST requests must be JSON, and WebSocket connections from web pages on other origins
+    are refused, so a website open in the user's browser cannot make the app speak.
+    """
+    def __init__(self, engine, host: str = "127.0.0.1", port: int = 8765,
+                 voice: str = None, rate: str = "+0%", token: str = None):
+        """
+        Args:
+            engine (TtsEngine): The engine that speaks the requests
+            host (str): Interface to bind (keep it on localhost)
+            port (int): TCP port
+            voice (str): Voice used when a request does not name one
+            rate (str): Rate used when a request does not give one
+            token (str): If set, requests must send it as "Authorization: Bearer <token>"
+                         or ?token=<token>
+        """
+        self.engine = engine
+        self.host = host
+        self.port = port
+        self.voice = voice
+        self.rate = rate
+        self.token = token
+        self._runner = None
+        self.requests = 0
+
+    def start(self):
+        """
+        Start listening (thread-safe)
+
+        Returns:
+            concurrent.futures.Future: Resolves once the port is open
+        """
+        return self.engine.run(self._start())
+
+    def stop(self):
+        """Close the server (thread-safe)"""
+        return self.engine.run(self._stop())
+
+    async def _start(self):
+        app = web.Application(middlewares=[self._guard])
+        app.add_routes([
+            web.post('/speak', self._http_speak),
+            web.post('/stop', self._http_stop),
+            web.get('/status', self._http_status),
+            web.get('/metrics', self._http_metrics),
+            web.get('/ws', self._websocket),
+        ])
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def _stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @web.middleware
+    async def _guard(self, request, handler):
+        """Reject requests without the token or from other web origins"""
+        if self.token:
+            supplied = request.query.get("token") or request.headers.get("Authorization", "")
+            if supplied.startswith("Bearer "):
+                supplied = supplied[len("Bearer "):]
+            if not hmac.compare_digest(supplied.strip().encode(), self.token.encode()):
+                return web.json_response({"error": "unauthorized"}, status=401)
+        origin = request.headers.get("Origin")
+        if origin and not _is_local_origin(origin):
+            return web.json_response({"error": "forbidden origin"}, status=403)
+        if request.method == "POST" and request.content_type != "application/json" and request.can_read_body:
+            return web.json_response({"error": "expected application/json"}, status=415)
+        return await handler(request)
+
+    async def _speak(self, params: dict):
+        """Validate a speak request and queue it"""
+        text = str(params.get("text", "")).strip()
+        if not text:
+            raise ValueError("text is required")
+        voice = params.get("voice") or self.voice
+        if not voice:
+            raise ValueError("voice is required (no default voice selected)")
+        policy = params.get("policy", UtteranceScheduler.APPEND)
+        routes = params.get("routes")
+        if routes is not None:
+            if not isinstance(routes, list) or not all(isinstance(r, str) for r in routes):
+                raise ValueError("routes must be a list of route names")
+            unknown = [r for r in routes if r not in self.engine.route_names]
+            if unknown:
+                raise ValueError(f"unknown routes: {', '.join(unknown)} "
+                                 f"(configured: {', '.join(self.engine.route_names) or 'none'})")
+        self.requests += 1
+        return await self.engine.speak(
+            text, voice, params.get("rate") or self.rate,
+            routes=tuple(routes) if routes else None,
+            policy=policy, priority=int(params.get("priority", 0)))
+
+    def status(self) -> dict:
+        """Current utterance and queue as JSON-friendly data"""
+        def describe(utterance):
+            return {"id": utterance.id, "text": utterance.text, "voice": utterance.voice,
+                    "rate": utterance.rate, "priority": utterance.priority}
+        current = self.engine.scheduler.current
+        return {
+            "busy": self.engine.busy,
+            "current": describe(current) if current else None,
+            "queue": [describe(u) for u in self.engine.pending()],
+            "requests": self.requests,
+        }
+
+    @staticmethod
+    async def _first_audio(utterance) -> dict:
+        """Wait for an utterance to start and describe the outcome"""
+        try:
+            latency = await asyncio.wrap_future(utterance.first_audio)
+            return {"event": "first_sample", "id": utterance.id, "latency_ms": round(latency * 1000, 1)}
+        except asyncio.CancelledError:
+            if not utterance.first_audio.cancelled():
+                raise  # The request itself was cancelled
+            return {"event": "dropped", "id": utterance.id}
+        except Exception as e:
+            return {"event": "error", "id": utterance.id, "error": str(e)}
+
+    async def _http_speak(self, request):
+        try:
+            params = await request.json()
+            utterance = await self._speak(params)
+        except (ValueError, TypeError, AttributeError) as e:
+            return web.json_response({"error": str(e)}, status=400)
+        if not params.get("wait"):
+            return web.json_response({"id": utterance.id, "queued": len(self.engine.pending())}, status=202)
+        result = await self._first_audio(utterance)
+        return web.json_response(result, status=500 if result["event"] == "error" else 200)
+
+    async def _http_stop(self, request):
+        await self.engine.stop()
+        return web.json_response({"stopped": True})
+
+    async def _http_status(self, request):
+        return web.json_response(self.status())
+
+    async def _http_metrics(self, request):
+        return web.Response(text=self.engine.export_metrics(),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    async def _websocket(self, request):
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        waiters = set()
+
+        async def report(utterance):
+            result = await self._first_audio(utterance)
+            if not ws.closed:
+                await ws.send_json(result)
+
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            try:
+                params = json.loads(msg.data)
+                op = params.get("op")
+                if op == "speak":
+                    utterance = await self._speak(params)
+                    await ws.send_json({"event": "queued", "id": utterance.id,
+                                        "ref": params.get("ref")})
+                    task = asyncio.ensure_future(report(utterance))
+                    waiters.add(task)
+                    task.add_done_callback(waiters.discard)
+                elif op == "stop":
+                    await self.engine.stop()
+                    await ws.send_json({"event": "stopped"})
+                elif op == "status":
+                    await ws.send_json({"event": "status", **self.status()})
+                else:
+                    raise ValueError(f"unknown op: {op}")
+            except (ValueError, TypeError, AttributeError) as e:
+                await ws.send_json({"event": "error", "error": str(e)})
+
+        for task in waiters:
+            task.cancel()
+        return ws
+
+def main(argv=None) -> int:
+    """Run the engine and the control server without the GUI"""
+    from tts_engine import TtsEngine
+    from audio_sinks import WavFileSink
+
+    parser = argparse.ArgumentParser(description="Headless Discord TTS control server")
+    parser.add_argument("--voice", required=True, help="Default voice (e.g. en-US-AriaNeural)")
+    parser.add_argument("--rate", default="+0%", help="Default rate (default: +0%%)")
+    parser.add_argument("--port", type=int, default=8765, help="Port on 127.0.0.1 (default: 8765)")
+    parser.add_argument("--device", type=int, action="append", default=[],
+                        help="Output device index (repeat for several; default: none)")
+    parser.add_argument("--wav", help="Also record everything spoken to this WAV file")
+    parser.add_argument("--token", help="Require this bearer token")
+    args = parser.parse_args(argv)
+
+    engine = TtsEngine()
+    routes = {f"out{i}": device for i, device in enumerate(args.device)}
+    if args.wav:
+        routes["wav"] = WavFileSink(args.wav, speed=1.0)
+    engine.set_routes(routes)
+    server = ControlServer(engine, port=args.port, voice=args.voice, rate=args.rate, token=args.token)
+    server.start().result()
+    engine.prewarm()
+    print(f"Listening on http://127.0.0.1:{args.port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop().result()
+        engine.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
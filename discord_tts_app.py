@@ -22,35 +22,27 @@ if sys.platform == "win32":
         # Handle case where the wrapper is not available
         pass
 
-import asyncio
-import tempfile
 import json
 from datetime import datetime
 import re
-import hashlib
 from functools import lru_cache
 
 import customtkinter as ctk
-import pyaudio
-import sounddevice as sd
-import soundfile as sf
-import edge_tts
 from pydub import AudioSegment
 from CTkToolTip import CTkToolTip
 from CTkMessagebox import CTkMessagebox as MessageBox
 import numpy as np
 
-# Create a cache directory for temporary audio files
-CACHE_DIR = os.path.join(tempfile.gettempdir(), "discord_tts_temp")
-os.makedirs(CACHE_DIR, exist_ok=True)
-
-# Clear old cache files on startup
-for f in os.listdir(CACHE_DIR):
-    if f.endswith('.wav') or f.endswith('.mp3'):
-        try:
-            os.unlink(os.path.join(CACHE_DIR, f))
-        except:
-            pass
+from audio_cache import AudioCache
+from audio_engine import AudioEngine
+from audio_sinks import list_output_devices, default_output_device
+from speech_pipeline import UtteranceScheduler
+from tts_engine import TtsEngine, get_tts_key
+from cache_warmer import rank_history
+from history_store import HistoryStore
+from history_view import VirtualList
+from voice_catalog import VoiceCatalog
+from control_server import ControlServer
 
 # ─── HIDE FFmpeg CONSOLES ON WINDOWS ─────────────────────────────────
 if sys.platform == "win32":
@@ -93,118 +85,6 @@ else:
 AudioSegment.converter = os.path.join(base_path, 'ffmpeg.exe')
 AudioSegment.ffprobe   = os.path.join(base_path, 'ffprobe.exe')
 
-# ─── EDGE-TTS ASYNC FUNCTIONS ────────────────────────────────
-async def _get_voices() -> list:
-    """
-    Retrieve all available voices from Edge TTS API and group them by language
-    
-    Returns:
-        dict: A dictionary of voice groups organized by locale
-    """
-    voices = await edge_tts.list_voices()
-    # Group voices by language
-    voice_groups = {}
-    for v in voices:
-        locale = v.get('Locale', '')
-        if locale not in voice_groups:
-            voice_groups[locale] = []
-        voice_groups[locale].append({
-            'name': v['ShortName'],
-            'gender': v.get('Gender', 'Unknown'),
-            'display': f"{v['ShortName']} ({v.get('Gender', 'Unknown')})"
-        })
-    return voice_groups
-
-# Cache for TTS generation - avoid regenerating the same text/voice
-# Format: { hash(text+voice+rate): wav_path }
-TTS_CACHE = {}
-TTS_CACHE_LOCK = threading.Lock()
-
-def get_tts_key(text, voice, rate):
-    """
-    Generate a unique key for the TTS combination to use in caching
-    
-    Args:
-        text (str): The text to convert to speech
-        voice (str): The voice name to use
-        rate (str): The speaking rate
-        
-    Returns:
-        str: A hash that uniquely identifies this TTS request
-    """
-    return hashlib.md5(f"{text}|{voice}|{rate}".encode('utf-8')).hexdigest()
-
-async def _tts_edge(text: str, voice: str, rate: str = "+0%") -> str:
-    """
-    Generate speech from text using Edge TTS API
-    
-    Args:
-        text (str): The text to convert to speech
-        voice (str): The voice name to use
-        rate (str): The speaking rate adjustment (e.g., "+10%", "-5%")
-        
-    Returns:
-        str: Path to the generated WAV file
-        
-    Raises:
-        RuntimeError: If speech generation fails
-    """
-    # Check if we already generated this exact audio
-    cache_key = get_tts_key(text, voice, rate)
-    
-    with TTS_CACHE_LOCK:
-        if cache_key in TTS_CACHE and os.path.exists(TTS_CACHE[cache_key]):
-            return TTS_CACHE[cache_key]
-    
-    # Create temporary files with predictable names
-    mp3_path = os.path.join(CACHE_DIR, f"{cache_key}.mp3")
-    wav_path = os.path.join(CACHE_DIR, f"{cache_key}.wav")
-    
-    try:
-        # Generate speech with edge-tts
-        # Force subprocess creation flags if on Windows
-        if sys.platform == 'win32':
-            # Set process creation flags to suppress console window
-            import edge_tts.constants as constants
-            if hasattr(constants, 'Process'):
-                # Ensure subprocess creationflags are set on Windows
-                orig_flags = constants.Process.CREATION_FLAGS
-                constants.Process.CREATION_FLAGS = subprocess.CREATE_NO_WINDOW | subprocess.DETACHED_PROCESS
-                
-        # Generate the audio
-        comm = edge_tts.Communicate(text, voice, rate=rate)
-        await comm.save(mp3_path)
-        
-        # Restore original flags
-        if sys.platform == 'win32' and hasattr(constants, 'Process'):
-            constants.Process.CREATION_FLAGS = orig_flags
-            
-        # Convert to WAV at 48kHz (required for Discord)
-        audio = AudioSegment.from_file(mp3_path, format='mp3')
-        audio = audio.set_frame_rate(48000)
-        audio.export(wav_path, format='wav')
-        
-        # Add to cache
-        with TTS_CACHE_LOCK:
-            TTS_CACHE[cache_key] = wav_path
-        
-        # Clean up mp3 file
-        try:
-            os.unlink(mp3_path)
-        except:
-            pass
-            
-        return wav_path
-    except Exception as e:
-        # Clean up in case of error
-        for path in [mp3_path, wav_path]:
-            try:
-                if os.path.exists(path):
-                    os.unlink(path)
-            except:
-                pass
-        raise RuntimeError(f'Edge-tts failed: {e}')
-
 class VirtualMicrophoneApp:
     """
     Main application class for the Discord TTS app
@@ -236,8 +116,14 @@ class VirtualMicrophoneApp:
         self.config_file = os.path.join(os.path.expanduser("~"), "discord_tts_config.json")
         self.history_file = os.path.join(os.path.expanduser("~"), "discord_tts_history.json")
         self.settings = self.load_settings()
-        self.message_history = self.load_history()
-        self.current_history_index = -1
+        self.voice_catalog = VoiceCatalog(
+            os.path.join(os.path.expanduser("~"), "discord_tts_voices.json"),
+            ttl=float(self.settings.get("voice_catalog_ttl_hours", 24)) * 3600)
+        # Opened on first use; the old JSON history is imported once
+        self.history = HistoryStore(
+            os.path.join(os.path.expanduser("~"), "discord_tts_history.sqlite3"),
+            legacy_json=self.history_file)
+        self.current_history_index = -1  # Places back from the newest message, -1: not browsing
         
         # UI Language support (English/Chinese)
         self.ui_language = self.settings.get("ui_language", "en")  # Default to English
@@ -267,6 +153,7 @@ class VirtualMicrophoneApp:
                 "save_wav": "Save as WAV",
                 # History
                 "message_history": "Message History",
+                "search_history": "Search history...",
                 "type_message": "Type your message:",
                 # Status and messages
                 "ready": "Ready",
@@ -288,22 +175,35 @@ class VirtualMicrophoneApp:
                 "exit_confirm": "Are you sure you want to exit?",
                 # Errors
                 "error_loading_voices": "Error loading voices: ",
+                "voices_offline": "Offline: using the saved voice list",
                 "error_tts": "TTS Error",
                 "error_playback": "Playback Error",
                 "error_save": "Save Error",
                 "error_settings": "Settings Error",
                 "force_overlap": "Force overlap (stop current playback)",
+                "queued": "Queued ({count} waiting)",
+                "stream_playback": "Stream audio while generating",
+                "speculative": "Pre-generate while typing",
                 "preview": "Preview",
                 "previewing": "Previewing...",
                 "error_voice_selection": "Invalid voice selection",
+                "stats": "Stats",
+                "latency_stats": "Latency by stage (ms, last {count} messages)",
+                "no_stats": "No messages timed yet",
+                "output_stats": "Outputs (ms; offset and drift against the Discord output)",
+                "copy_metrics": "Copy metrics",
+                "metrics_copied": "Metrics copied to clipboard",
                 # Tooltips
                 "tooltip_speed": "Adjust voice speed (-50% to +50%)",
                 "tooltip_speak": "Send TTS to Discord (Ctrl+Enter)",
                 "tooltip_stop": "Stop playback (Esc)",
                 "tooltip_clear": "Clear text input and history",
                 "tooltip_cable": "For Discord to receive the audio, set the Voice Input device to 'Cable Output'",
-                "tooltip_overlap": "When checked, new playback will stop any currently playing audio",
+                "tooltip_overlap": "When checked, new playback will stop any currently playing audio; otherwise new messages are queued",
+                "tooltip_stream": "Start playing as soon as the first audio arrives instead of waiting for the whole message",
+                "tooltip_speculative": "Generate the text you are typing during pauses, so it plays instantly when you send it",
                 "tooltip_preview": "Play a short sample of the selected voice",
+                "tooltip_stats": "Show how long each step of recent messages took",
                 "tooltip_history": "Double-click to select a previous message"
             },
             "zh": {
@@ -331,6 +231,7 @@ class VirtualMicrophoneApp:
                 "save_wav": "保存為WAV",
                 # History
                 "message_history": "消息歷史",
+                "search_history": "搜尋歷史...",
                 "type_message": "輸入您的消息:",
                 # Status and messages
                 "ready": "✅",
@@ -352,34 +253,52 @@ class VirtualMicrophoneApp:
                 "exit_confirm": "確定要退出嗎？",
                 # Errors
                 "error_loading_voices": "加載語音失敗: ",
+                "voices_offline": "離線：使用已保存的語音列表",
                 "error_tts": "語音轉換錯誤",
                 "error_playback": "播放錯誤",
                 "error_save": "保存錯誤",
                 "error_settings": "設置錯誤",
                 "force_overlap": "強制覆蓋 (停止當前播放)",
+                "queued": "已排隊 (等待中: {count})",
+                "stream_playback": "邊生成邊播放",
+                "speculative": "輸入時預先生成",
                 "preview": "預覽",
                 "previewing": "預覽中...",
                 "error_voice_selection": "無效的語音選擇",
+                "stats": "統計",
+                "latency_stats": "各階段延遲 (毫秒, 最近 {count} 條消息)",
+                "no_stats": "尚未有計時數據",
+                "output_stats": "輸出設備 (毫秒; 相對Discord輸出的偏移和漂移)",
+                "copy_metrics": "複製指標",
+                "metrics_copied": "指標已複製到剪貼板",
                 # Tooltips
                 "tooltip_speed": "調整語音速度 (-50% 到 +50%)",
                 "tooltip_speak": "發送語音到 Discord (Ctrl+Enter)",
                 "tooltip_stop": "停止播放 (Esc)",
                 "tooltip_clear": "清除文字輸入和歷史記錄",
                 "tooltip_cable": "為了讓 Discord 接收音頻，請在 Discord 中將語音輸入設備設置為 'Cable Output'",
-                "tooltip_overlap": "勾選時，新的播放會停止當前正在播放的音頻",
+                "tooltip_overlap": "勾選時，新的播放會停止當前正在播放的音頻；否則新消息會排隊播放",
+                "tooltip_stream": "收到第一段音頻後立即開始播放，而不是等待整條消息生成完畢",
+                "tooltip_speculative": "在輸入停頓時預先生成正在輸入的文字，發送時即可立即播放",
                 "tooltip_preview": "播放所選語音的簡短示例",
+                "tooltip_stats": "顯示最近消息每個步驟所需的時間",
                 "tooltip_history": "雙擊選擇以前的消息"
             }
         }
         
-        # Asyncio event loop for TTS
-        self.loop = asyncio.new_event_loop()
-        threading.Thread(target=self.loop.run_forever, daemon=True).start()
-
         # Audio devices
-        self.pyaudio_inst = pyaudio.PyAudio()
-        self.audio_devices = self._get_audio_devices()
-        self.default_monitor_idx = sd.default.device[1]
+        self.audio_devices = list_output_devices()
+        self.default_monitor_idx = default_output_device()
+        
+        # Synthesis, caching, queueing and playback (no UI); routes are set in _update_output_routes
+        self.tts = TtsEngine(
+            output=AudioEngine(synchronize=bool(self.settings.get("sync_outputs", True))),
+            synthesis_concurrency=int(self.settings.get("synthesis_concurrency", 3)),
+            speculation_budget_chars=int(self.settings.get("speculation_budget_chars", 2000)),
+            on_start=self._on_utterance_start,
+            on_error=self._on_utterance_error,
+            on_idle=lambda: self.root.after(0, self._playback_finished)
+        )
 
         # Initialize UI variables
         self.is_generating = False
@@ -390,14 +309,53 @@ class VirtualMicrophoneApp:
         
         # Build UI
         self._build_ui()
+        self._update_output_routes()
+        
+        self.stream_playback_var.trace_add("write", lambda *args: self._apply_playback_options())
+        self.speculative_var.trace_add("write", lambda *args: self._apply_playback_options())
+        self._apply_playback_options()
+        
+        # Apply the cache settings and tidy the cache folder without delaying startup
+        policy = self.settings.get("cache_policy")
+        self.tts.configure_cache(
+            max_bytes=int(self.settings.get("cache_max_mb", 256)) * 1024 * 1024,
+            policy=policy if policy in AudioCache.POLICIES else None,
+            pcm_max_bytes=int(self.settings.get("pcm_cache_mb", 64)) * 1024 * 1024)
+        self.tts.cleanup_cache()
+        self.tts.configure_synthesis(
+            deadline=float(self.settings.get("synthesis_deadline", 20)),
+            hedge=bool(self.settings.get("hedged_requests", True)),
+            fallback=bool(self.settings.get("fallback_backend", True)),
+            reuse_connections=bool(self.settings.get("warm_connection", True)))
+        self.tts.configure_postprocess(
+            enabled=bool(self.settings.get("postprocess_audio", True)),
+            silence_threshold_db=float(self.settings.get("silence_threshold_db", -50)),
+            target_lufs=float(self.settings.get("target_lufs", -18)),
+            peak_db=float(self.settings.get("peak_db", -1)))
+        # Connect to Edge TTS now, so the first message skips the handshake
+        self.tts.prewarm()
+        
+        # Optional localhost API for bots and macros; runs on the engine loop, not on Tk
+        self.control_server = None
+        if self.settings.get("control_server", False):
+            self.control_server = ControlServer(
+                self.tts, port=int(self.settings.get("control_port", 8765)),
+                rate=self.update_speed_label(), token=self.settings.get("control_token") or None)
+            try:
+                self.control_server.start().result(timeout=5)
+            except Exception as e:
+                print(f"Could not start control server: {e}")
+                self.control_server = None
         
-        # Fetch voices (async)
-        self.status_var.set(self.get_text("loading_voices"))
-        threading.Thread(target=self.fetch_voices, daemon=True).start()
+        # Show the saved voice catalog right away and refresh it in the background
+        self.fetch_voices()
         
         # Bind keyboard shortcuts
         self.root.bind("<Control-Return>", lambda e: self.speak_text())
         self.root.bind("<Escape>", lambda e: self.stop_speaking())
+        # Reconnect when the user comes back to type, in case the connection was dropped.
+        # Bound to the text box only: <FocusIn> on the root fires for every child widget.
+        self.text_input.bind("<FocusIn>", lambda e: self.tts.prewarm(), add="+")
         self.text_input.bind("<Up>", self.navigate_history_up)
         self.text_input.bind("<Down>", self.navigate_history_down)
     
@@ -407,46 +365,109 @@ class VirtualMicrophoneApp:
         return self.translations.get(self.ui_language, self.translations["en"]).get(key, key)
 
     def fetch_voices(self):
+        """Show the saved voice catalog if there is one, and refresh it when it is stale"""
+        cached = self.voice_catalog.load()
+        if cached is not None:
+            self._show_voices(cached)
+            if self.voice_catalog.is_fresh():
+                return
+        else:
+            self.status_var.set(self.get_text("loading_voices"))
+        threading.Thread(target=self._refresh_voices, daemon=True).start()
+
+    def _refresh_voices(self):
+        """Background thread: download the voice list and hand it to the UI thread"""
         try:
-            self.voice_groups = asyncio.run_coroutine_threadsafe(_get_voices(), self.loop).result()
-            
-            # Filter to keep only requested languages (Chinese, Cantonese, English US/UK)
-            filtered_groups = {}
-            supported_locales = ['zh-CN', 'zh-TW', 'zh-HK', 'en-US', 'en-GB']
-            for locale, voices in self.voice_groups.items():
-                if locale in supported_locales:
-                    filtered_groups[locale] = voices
-            
-            self.voice_groups = filtered_groups
-            self.all_voices = []
-            for locale, voices in self.voice_groups.items():
-                for voice in voices:
-                    voice['locale'] = locale
-                    self.all_voices.append(voice)
-            
-            # Update language filter dropdown
-            languages = sorted(self.voice_groups.keys())
-            language_display_names = {
-                'zh-CN': self.get_text("chinese_mainland"),
-                'zh-TW': self.get_text("chinese_taiwan"),
-                'zh-HK': self.get_text("cantonese"),
-                'en-US': self.get_text("english_us"),
-                'en-GB': self.get_text("english_uk")
-            }
-            
-            language_options = [self.get_text("all_languages")] + [language_display_names[lang] for lang in languages]
-            
-            # Create mappings between display names and language codes
-            self.language_mapping = {language_display_names[lang]: lang for lang in languages}
-            self.language_mapping[self.get_text("all_languages")] = "All Languages"
+            groups = self.tts.run(self.tts.list_voices()).result()
+            self.voice_catalog.save(groups)
+            self.root.after(0, lambda: self._on_voices_refreshed(groups))
+        except Exception as e:
+            print(f"Error loading voices: {e}")
+            self.root.after(0, lambda err=e: self._on_voices_failed(err))
+
+    def _on_voices_refreshed(self, groups):
+        """Apply a downloaded catalog, touching the UI only if the voices changed"""
+        if not self.all_voices:
+            self._show_voices(groups)
+            return
+        added, removed = VoiceCatalog.diff(self.voice_catalog_groups, groups)
+        if not added and not removed:
+            return
+        print(f"Voice catalog changed: {len(added)} added, {len(removed)} removed")
+        
+        current_voice = self.voice_cb.get()
+        self._set_voice_groups(groups)
+        selected_language = self.language_filter.get()
+        locale = self.language_mapping.get(selected_language, "All Languages")
+        if locale == "All Languages":
+            self.filtered_voices = self.all_voices
+        else:
+            self.filtered_voices = [v for v in self.all_voices if v['locale'] == locale]
+        voice_display_list = [v['display'] for v in self.filtered_voices]
+        self.voice_cb.configure(values=voice_display_list)
+        # Keep the selected voice unless it no longer exists
+        if current_voice not in voice_display_list and voice_display_list:
+            self.voice_cb.set(voice_display_list[0])
+            self.auto_save_settings()
+
+    def _on_voices_failed(self, error):
+        """The catalog could not be downloaded; keep working from the saved one if possible"""
+        if self.all_voices:
+            self.status_var.set(self.get_text("voices_offline"))
+            return
+        self.status_var.set(f'{self.get_text("error_loading_voices")}{str(error)}')
+        MessageBox(
+            title=self.get_text("error_tts"),
+            message=str(error),
+            icon="cancel"
+        )
+
+    def _set_voice_groups(self, groups):
+        """Keep the supported languages of a catalog and rebuild the voice and language lists"""
+        self.voice_catalog_groups = groups
+        
+        # Filter to keep only requested languages (Chinese, Cantonese, English US/UK)
+        filtered_groups = {}
+        supported_locales = ['zh-CN', 'zh-TW', 'zh-HK', 'en-US', 'en-GB']
+        for locale, voices in groups.items():
+            if locale in supported_locales:
+                filtered_groups[locale] = voices
+        
+        self.voice_groups = filtered_groups
+        self.all_voices = []
+        for locale, voices in self.voice_groups.items():
+            for voice in voices:
+                voice['locale'] = locale
+                self.all_voices.append(voice)
+        
+        # Update language filter dropdown
+        languages = sorted(self.voice_groups.keys())
+        language_display_names = {
+            'zh-CN': self.get_text("chinese_mainland"),
+            'zh-TW': self.get_text("chinese_taiwan"),
+            'zh-HK': self.get_text("cantonese"),
+            'en-US': self.get_text("english_us"),
+            'en-GB': self.get_text("english_uk")
+        }
+        
+        language_options = [self.get_text("all_languages")] + [language_display_names[lang] for lang in languages]
+        
+        # Create mappings between display names and language codes
+        self.language_mapping = {language_display_names[lang]: lang for lang in languages}
+        self.language_mapping[self.get_text("all_languages")] = "All Languages"
+        
+        # Create reverse mapping (code -> display name) for settings loading
+        self.reverse_language_mapping = {"All Languages": self.get_text("all_languages")}
+        for code, name in language_display_names.items():
+            self.reverse_language_mapping[code] = name
             
-            # Create reverse mapping (code -> display name) for settings loading
-            self.reverse_language_mapping = {"All Languages": self.get_text("all_languages")}
-            for code, name in language_display_names.items():
-                self.reverse_language_mapping[code] = name
-                
-            # Update the language filter combobox with available options
-            self.language_filter.configure(values=language_options)
+        # Update the language filter combobox with available options
+        self.language_filter.configure(values=language_options)
+
+    def _show_voices(self, groups):
+        """Fill the language and voice selectors and restore the saved selection"""
+        try:
+            self._set_voice_groups(groups)
             
             # First set filtered_voices to all voices so that when we try to find a specific voice,
             # we have the complete list available
@@ -539,6 +560,14 @@ class VirtualMicrophoneApp:
             # After loading the settings, register change callbacks to auto-save
             self._register_auto_save_callbacks()
             
+            if self.control_server:
+                selected_display = self.voice_cb.get()
+                self.control_server.voice = next(
+                    (v['name'] for v in self.filtered_voices if v['display'] == selected_display), None)
+            
+            # Pre-render frequent messages for the restored voice once the UI has settled
+            self.root.after(2000, self._warm_cache)
+            
         except Exception as e:
             self.status_var.set(f'{self.get_text("error_loading_voices")}{str(e)}')
             print(f"Error loading voices: {e}")
@@ -582,6 +611,8 @@ class VirtualMicrophoneApp:
         
         # Track variable changes for checkboxes/sliders
         self.force_overlap_var.trace_add("write", lambda *args: self.auto_save_settings())
+        self.stream_playback_var.trace_add("write", lambda *args: self.auto_save_settings())
+        self.speculative_var.trace_add("write", lambda *args: self.auto_save_settings())
         self.speed_slider.configure(command=self.on_speed_change)
         
     def on_speed_change(self, value):
@@ -635,6 +666,11 @@ class VirtualMicrophoneApp:
             
         print(f"Saving language: {selected_language_display} -> {language_code}")
         
+        # API requests without a voice or rate use the current selection
+        if self.control_server and selected_voice:
+            self.control_server.voice = selected_voice
+            self.control_server.rate = self.update_speed_label()
+        
         settings = {
             "output_device": self.cable_cb.get(),
             "monitor_device": self.mon_cb.get(),
@@ -642,7 +678,28 @@ class VirtualMicrophoneApp:
             "speed": int(self.speed_slider.get()),
             "language": language_code,  # Store language code not display name
             "ui_language": self.ui_language,
-            "force_overlap": self.force_overlap_var.get()
+            "force_overlap": self.force_overlap_var.get(),
+            "stream_playback": self.stream_playback_var.get(),
+            "speculative_synthesis": self.speculative_var.get(),
+            "speculation_budget_chars": self.settings.get("speculation_budget_chars", 2000),
+            "warm_cache_count": self.settings.get("warm_cache_count", 20),
+            "voice_catalog_ttl_hours": self.settings.get("voice_catalog_ttl_hours", 24),
+            "control_server": self.settings.get("control_server", False),
+            "control_port": self.settings.get("control_port", 8765),
+            "control_token": self.settings.get("control_token", ""),
+            "cache_max_mb": self.settings.get("cache_max_mb", 256),
+            "cache_policy": self.settings.get("cache_policy", "lru"),
+            "pcm_cache_mb": self.settings.get("pcm_cache_mb", 64),
+            "synthesis_concurrency": self.settings.get("synthesis_concurrency", 3),
+            "sync_outputs": self.settings.get("sync_outputs", True),
+            "synthesis_deadline": self.settings.get("synthesis_deadline", 20),
+            "hedged_requests": self.settings.get("hedged_requests", True),
+            "fallback_backend": self.settings.get("fallback_backend", True),
+            "warm_connection": self.settings.get("warm_connection", True),
+            "postprocess_audio": self.settings.get("postprocess_audio", True),
+            "silence_threshold_db": self.settings.get("silence_threshold_db", -50),
+            "target_lufs": self.settings.get("target_lufs", -18),
+            "peak_db": self.settings.get("peak_db", -1)
         }
         
         try:
@@ -659,14 +716,6 @@ class VirtualMicrophoneApp:
                 icon="cancel"
             )
 
-    def _get_audio_devices(self) -> dict:
-        devs = {}
-        for i in range(self.pyaudio_inst.get_device_count()):
-            info = self.pyaudio_inst.get_device_info_by_index(i)
-            if info.get('maxOutputChannels',0) > 0:
-                devs[info['name']] = i
-        return devs
-
     def _build_ui(self):
         # Create main frames
         self.sidebar = ctk.CTkFrame(self.root, width=200, corner_radius=0)
@@ -693,7 +742,8 @@ class VirtualMicrophoneApp:
         
         # Discord output
         ctk.CTkLabel(self.sidebar_audio, text=self.get_text("discord_output")).pack(anchor=tk.W, padx=10, pady=(5, 0))
-        self.cable_cb = ctk.CTkComboBox(self.sidebar_audio, values=list(self.audio_devices), width=180)
+        self.cable_cb = ctk.CTkComboBox(self.sidebar_audio, values=list(self.audio_devices), width=180,
+                                        command=self._update_output_routes)
         self.cable_cb.pack(padx=10, pady=(0, 5))
         
         # Discord reminder - Cable output notice
@@ -715,7 +765,8 @@ class VirtualMicrophoneApp:
             
         # Monitor output
         ctk.CTkLabel(self.sidebar_audio, text=self.get_text("monitor_output")).pack(anchor=tk.W, padx=10, pady=(5, 0))
-        self.mon_cb = ctk.CTkComboBox(self.sidebar_audio, values=list(self.audio_devices), width=180)
+        self.mon_cb = ctk.CTkComboBox(self.sidebar_audio, values=list(self.audio_devices), width=180,
+                                      command=self._update_output_routes)
         self.mon_cb.pack(padx=10, pady=(0, 5))
         
         # Set monitor device from settings or default
@@ -793,17 +844,33 @@ class VirtualMicrophoneApp:
         
         # Main content area
         # Message history
-        self.history_label = ctk.CTkLabel(self.main_frame, text=self.get_text("message_history"),
+        history_header = ctk.CTkFrame(self.main_frame, fg_color="transparent")
+        history_header.pack(fill=tk.X, padx=5, pady=(0, 5))
+        self.history_label = ctk.CTkLabel(history_header, text=self.get_text("message_history"),
                                         anchor="w", font=ctk.CTkFont(weight="bold"))
-        self.history_label.pack(fill=tk.X, padx=5, pady=(0, 5))
+        self.history_label.pack(side=tk.LEFT)
+        
+        # Search over the whole history, filtered as you type
+        self.history_search_var = tk.StringVar()
+        self.history_search = ctk.CTkEntry(history_header, width=220, textvariable=self.history_search_var,
+                                           placeholder_text=self.get_text("search_history"))
+        self.history_search.pack(side=tk.RIGHT)
+        self.history_search_var.trace_add("write", self._on_history_search)
+        # Build the search index in the background before the first query
+        self.history_search.bind("<FocusIn>", lambda e: threading.Thread(
+            target=self.history.search, args=("", 1), daemon=True).start())
+        self._history_search_job = None
+        self._history_query = ""
+        self._history_query_seq = 0
         
         self.history_frame = ctk.CTkFrame(self.main_frame, height=120)
         self.history_frame.pack(fill=tk.X, padx=5, pady=(0, 10))
         self.history_frame.pack_propagate(False)
         
-        self.history_list = ctk.CTkTextbox(self.history_frame, height=120, wrap="word")
-        self.history_list.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
-        self.history_list.configure(state="disabled")
+        # Only the rows in view are drawn, so long histories stay fast
+        self.history_list = VirtualList(self.history_frame, render=self._history_row,
+                                        on_activate=self.select_history_item)
+        self.history_list.pack(fill=tk.BOTH, expand=True)
         self.update_history_display()
         
         # Text input area
@@ -833,6 +900,11 @@ class VirtualMicrophoneApp:
                                      command=self.clear_all)
         self.clear_btn.pack(side=tk.LEFT, padx=5)
         
+        self.stats_btn = ctk.CTkButton(self.button_frame, text=self.get_text("stats"), width=60,
+                                      command=self.show_stats)
+        self.stats_btn.pack(side=tk.RIGHT, padx=(5, 0))
+        self.stats_window = None
+        
         # Force overlap checkbox (below buttons)
         self.overlap_frame = ctk.CTkFrame(self.main_frame, fg_color="transparent")
         self.overlap_frame.pack(fill=tk.X, padx=5, pady=(0, 5))
@@ -844,6 +916,20 @@ class VirtualMicrophoneApp:
                                                onvalue=True, offvalue=False)
         self.force_overlap_cb.pack(side=tk.LEFT, padx=5)
         
+        self.stream_playback_var = tk.BooleanVar(value=self.settings.get("stream_playback", True))
+        self.stream_playback_cb = ctk.CTkCheckBox(self.overlap_frame,
+                                                 text=self.get_text("stream_playback"),
+                                                 variable=self.stream_playback_var,
+                                                 onvalue=True, offvalue=False)
+        self.stream_playback_cb.pack(side=tk.LEFT, padx=5)
+        
+        self.speculative_var = tk.BooleanVar(value=self.settings.get("speculative_synthesis", False))
+        self.speculative_cb = ctk.CTkCheckBox(self.overlap_frame,
+                                             text=self.get_text("speculative"),
+                                             variable=self.speculative_var,
+                                             onvalue=True, offvalue=False)
+        self.speculative_cb.pack(side=tk.LEFT, padx=5)
+        
         # Status bar
         self.statusbar_frame = ctk.CTkFrame(self.root, height=25, fg_color=("gray85", "gray25"))
         self.statusbar_frame.pack(side=tk.BOTTOM, fill=tk.X)
@@ -860,11 +946,12 @@ class VirtualMicrophoneApp:
         CTkToolTip(self.clear_btn, message=self.get_text("tooltip_clear"))
         CTkToolTip(self.cable_reminder, message=self.get_text("tooltip_cable"))
         CTkToolTip(self.force_overlap_cb, message=self.get_text("tooltip_overlap"))
+        CTkToolTip(self.stream_playback_cb, message=self.get_text("tooltip_stream"))
+        CTkToolTip(self.speculative_cb, message=self.get_text("tooltip_speculative"))
         CTkToolTip(self.preview_btn, message=self.get_text("tooltip_preview"))
+        CTkToolTip(self.stats_btn, message=self.get_text("tooltip_stats"))
         CTkToolTip(self.history_list, message=self.get_text("tooltip_history"))
-        
-        # Configure history list double click event
-        self.history_list.bind("<Double-Button-1>", self.select_history_item)
+
 
         # Bind text change event for auto language detection
         self.text_input.bind("<KeyRelease>", self.on_text_change)
@@ -878,9 +965,8 @@ class VirtualMicrophoneApp:
         self.speed_label.configure(text=f"×{factor:.1f}")
         return f"{int(speed):+d}%"
 
-    def generate_tts(self, text: str) -> str:
-        """Generate TTS with performance optimizations"""
-        # Get selected voice object
+    def _get_selected_voice(self):
+        """Return the name of the selected voice, or None after telling the user it is invalid"""
         selected_display = self.voice_cb.get()
         selected_voice = next((v['name'] for v in self.filtered_voices if v['display'] == selected_display), None)
         
@@ -890,116 +976,59 @@ class VirtualMicrophoneApp:
                 message=self.get_text("error_voice_selection"),
                 icon="cancel"
             )
-            return None
-            
-        # Get speech rate
-        rate = self.update_speed_label()
-        
-        # Pre-calculate the cache key to avoid regenerating the same audio
-        cache_key = get_tts_key(text, selected_voice, rate)
-        with TTS_CACHE_LOCK:
-            if cache_key in TTS_CACHE and os.path.exists(TTS_CACHE[cache_key]):
-                return TTS_CACHE[cache_key]
-        
-        # Generate TTS if not in cache
-        future = asyncio.run_coroutine_threadsafe(_tts_edge(text, selected_voice, rate), self.loop)
-        try:
-            return future.result()
-        except Exception as e:
-            MessageBox(
-                title=self.get_text("error_tts"),
-                message=str(e),
-                icon="cancel"
-            )
-            return None
+        return selected_voice
 
-    def play_audio(self, path: str):
-        """Play a WAV, but first tear down any existing streams immediately."""
-        # 1) Stop any existing playback and mark new playback as active
-        self.stop_speaking()
-        self.is_playing = True
-
-        # 2) Load the audio file
-        try:
-            data, fs = sf.read(path, dtype='float32')
-            chans = data.shape[1] if data.ndim > 1 else 1
-        except Exception as e:
-            MessageBox(
-                title=self.get_text("error_playback"),
-                message=f'WAV read failed: {e}',
-                icon="cancel"
-            )
-            self.status_var.set(self.get_text("ready"))
+    def _warm_cache(self):
+        """Render the most frequent and recent history messages in the background"""
+        count = int(self.settings.get("warm_cache_count", 20))
+        selected_display = self.voice_cb.get()
+        voice = next((v['name'] for v in self.filtered_voices if v['display'] == selected_display), None)
+        if count <= 0 or not voice or not len(self.history):
             return
+        texts = rank_history(self.history.recent(1000), count)
+        self.tts.warm_cache(texts, voice, self.update_speed_label())
 
-        # 3) Resolve audio devices
+    def _on_utterance_start(self, utterance):
+        """Scheduler callback when an utterance starts playing (runs off the UI thread)"""
+        def update():
+            self.is_playing = True
+            if utterance.priority == self.tts.PREVIEW_PRIORITY:
+                return  # Voice previews keep their own status and stay out of the history
+            self.status_var.set(self.get_text("speaking"))
+            self.add_to_history(utterance.text, utterance.voice, utterance.rate)
+        self.root.after(0, update)
+
+    def _on_utterance_error(self, utterance, error):
+        """Scheduler callback when an utterance could not be synthesized"""
+        self.root.after(0, lambda: MessageBox(
+            title=self.get_text("error_tts"),
+            message=str(error),
+            icon="cancel"
+        ))
+
+    def _update_output_routes(self, *args):
+        """
+        Point the audio engine at the selected Discord and monitor devices
+        
+        Streams are only reopened when a device actually changes.
+        
+        Returns:
+            bool: True if both devices are valid and open
+        """
         cidx = self.audio_devices.get(self.cable_cb.get())
         midx = self.audio_devices.get(self.mon_cb.get())
         if cidx is None or midx is None:
-            MessageBox(
-                title=self.get_text("error_playback"),
-                message='Invalid audio device',
-                icon="cancel"
-            )
-            self.status_var.set(self.get_text("ready"))
-            return
-
-        # 4) Spawn playback threads, tracking each stream so we can abort if needed
-        self._active_streams = []
-
-        def stream_to(idx):
-            try:
-                stream = sd.OutputStream(
-                    device=idx,
-                    samplerate=fs,
-                    channels=chans,
-                    dtype='float32',
-                    blocksize=2048,
-                    latency='low'
-                )
-                self._active_streams.append(stream)
-                stream.start()
-
-                chunk = 2048
-                if chans > 1:
-                    pad = np.zeros((chunk, chans), dtype=np.float32)
-                else:
-                    pad = np.zeros(chunk, dtype=np.float32)
-
-                for i in range(0, len(data), chunk):
-                    if not self.is_playing:
-                        break
-                    block = data[i:i+chunk]
-                    if len(block) < chunk:
-                        # Pad the final block
-                        if chans > 1:
-                            block = np.vstack((block, pad[:chunk - len(block)]))
-                        else:
-                            block = np.concatenate((block, pad[:chunk - len(block)]))
-                    stream.write(block)
-            except Exception as e:
-                if self.is_playing:
-                    self.root.after(0, lambda: self.status_var.set(f'Playback error: {e}'))
-            finally:
-                try:
-                    stream.close()
-                except:
-                    pass
-
-        for idx in (cidx, midx):
-            threading.Thread(target=stream_to, args=(idx,), daemon=True).start()
-
-        # 5) Schedule a single "playback finished" callback for this audio
-        playback_ms = int(len(data) / fs * 1000 + 200)  # duration + 200ms buffer
-        if hasattr(self, '_cleanup_after_id'):
-            try:
-                self.root.after_cancel(self._cleanup_after_id)
-            except:
-                pass
-        self._cleanup_after_id = self.root.after(playback_ms, self._playback_finished)
+            return False
+        try:
+            self.tts.set_routes({"cable": cidx, "monitor": midx})
+            return True
+        except Exception as e:
+            print(f"Could not open audio device: {e}")
+            self.status_var.set(f'Playback error: {e}')
+            return False
 
     def _playback_finished(self):
-        """Called when the scheduled finish timer fires."""
+        """Called on the UI thread when everything queued has been played."""
         self.is_playing = False
         self.status_var.set(self.get_text("ready"))
         # Also ensure Speak is re-enabled if it somehow wasn't
@@ -1008,50 +1037,36 @@ class VirtualMicrophoneApp:
             
     def speak_text(self):
         """Called by Ctrl+Enter or Speak button."""
-        # If we're already generating or playing (and not forced overlap), ignore spamming
-        if self.is_generating or (self.is_playing and not self.force_overlap_var.get()):
-            return
-
         text = self.text_input.get('1.0', tk.END).strip()
         if not text:
             return
 
-        # Mark as generating, disable the button
-        self.is_generating = True
-        self.speak_btn.configure(state="disabled")
-        self.status_var.set(self.get_text("generating"))
-
-        # Spawn background thread to generate + play
-        threading.Thread(
-            target=self._continue_speak_text,
-            args=(text,),
-            daemon=True
-        ).start()
-
-    def _continue_speak_text(self, text):
-        try:
-            # Stop any existing playback immediately
-            self.stop_speaking()
+        selected_voice = self._get_selected_voice()
+        if not selected_voice:
+            return
+        rate = self.update_speed_label()
 
-            # Generate TTS (this may raise)
-            wav_path = self.generate_tts(text)
-            if not wav_path:
-                return
+        if not self._update_output_routes():
+            MessageBox(
+                title=self.get_text("error_playback"),
+                message='Invalid audio device',
+                icon="cancel"
+            )
+            return
 
-            # Mark playing
-            self.is_playing = True
-            self.status_var.set(self.get_text("speaking"))
-            self.add_to_history(text)
+        # Messages sent while busy are queued; force overlap interrupts the current one
+        busy = self.tts.busy
+        if self.force_overlap_var.get():
+            policy = UtteranceScheduler.INTERRUPT
+        else:
+            policy = UtteranceScheduler.APPEND
+        self.tts.run(self.tts.speak(text, selected_voice, rate, policy=policy)).result()
 
-            # Play the audio
-            self.play_audio(wav_path)
+        if busy and policy == UtteranceScheduler.APPEND:
+            self.status_var.set(self.get_text("queued").format(count=len(self.tts.pending())))
+        else:
+            self.status_var.set(self.get_text("generating"))
 
-        except Exception as e:
-            # Show error on UI thread
-            self.root.after(0, lambda: self.status_var.set(f"Error: {e}"))
-        finally:
-            # Re-enable Speak button once generation is done
-            self.root.after(0, self._on_playback_ready)
     def _on_playback_ready(self):
         """Called after generation/thread-launch to re-enable Speak."""
         self.is_generating = False
@@ -1071,7 +1086,28 @@ class VirtualMicrophoneApp:
             "speed": int(self.speed_slider.get()),
             "language": selected_language,
             "ui_language": self.ui_language,
-            "force_overlap": self.force_overlap_var.get()
+            "force_overlap": self.force_overlap_var.get(),
+            "stream_playback": self.stream_playback_var.get(),
+            "speculative_synthesis": self.speculative_var.get(),
+            "speculation_budget_chars": self.settings.get("speculation_budget_chars", 2000),
+            "warm_cache_count": self.settings.get("warm_cache_count", 20),
+            "voice_catalog_ttl_hours": self.settings.get("voice_catalog_ttl_hours", 24),
+            "control_server": self.settings.get("control_server", False),
+            "control_port": self.settings.get("control_port", 8765),
+            "control_token": self.settings.get("control_token", ""),
+            "cache_max_mb": self.settings.get("cache_max_mb", 256),
+            "cache_policy": self.settings.get("cache_policy", "lru"),
+            "pcm_cache_mb": self.settings.get("pcm_cache_mb", 64),
+            "synthesis_concurrency": self.settings.get("synthesis_concurrency", 3),
+            "sync_outputs": self.settings.get("sync_outputs", True),
+            "synthesis_deadline": self.settings.get("synthesis_deadline", 20),
+            "hedged_requests": self.settings.get("hedged_requests", True),
+            "fallback_backend": self.settings.get("fallback_backend", True),
+            "warm_connection": self.settings.get("warm_connection", True),
+            "postprocess_audio": self.settings.get("postprocess_audio", True),
+            "silence_threshold_db": self.settings.get("silence_threshold_db", -50),
+            "target_lufs": self.settings.get("target_lufs", -18),
+            "peak_db": self.settings.get("peak_db", -1)
         }
         
         try:
@@ -1087,44 +1123,68 @@ class VirtualMicrophoneApp:
 
     def stop_speaking(self):
         """Stop all audio immediately and clean up."""
-        if not self.is_playing:
+        if not self.is_playing and not self.tts.busy:
             return
         self.is_playing = False
 
-        # Abort each stream
-        if hasattr(self, '_active_streams'):
-            for stream in self._active_streams:
-                try: stream.abort()
-                except: pass
-            self._active_streams = []
-
-        # Also call sounddevice.stop just in case
-        sd.stop()
-
-        # Cancel any pending finish callback
-        if hasattr(self, '_cleanup_after_id'):
-            try: self.root.after_cancel(self._cleanup_after_id)
-            except: pass
+        # Drop queued messages and silence both outputs; the device streams stay open
+        self.tts.run(self.tts.stop())
 
         # Update UI
         self.root.after(100, lambda: self.status_var.set(self.get_text("stopped")))
 
-    def add_to_history(self, text):
-        # Add to history (with timestamp)
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        self.message_history.append({
-            "text": text,
-            "timestamp": timestamp,
-            "voice": self.voice_cb.get(),
-            "date": datetime.now().strftime("%Y-%m-%d")
-        })
-        
-        # Keep only last 50 messages
-        if len(self.message_history) > 50:
-            self.message_history = self.message_history[-50:]
-            
-        # Save history
-        self.save_history()
+    def show_stats(self):
+        """Open (or raise) a small window with rolling per-stage latency percentiles"""
+        if self.stats_window is not None and self.stats_window.winfo_exists():
+            self.stats_window.lift()
+            return
+        self.stats_window = ctk.CTkToplevel(self.root)
+        self.stats_window.title(self.get_text("stats"))
+        self.stats_window.geometry("460x330")
+        self.stats_window.transient(self.root)
+        
+        stats_text = ctk.CTkTextbox(self.stats_window, font=ctk.CTkFont(family="Courier", size=12))
+        stats_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=(10, 5))
+        
+        def copy_metrics():
+            self.root.clipboard_clear()
+            self.root.clipboard_append(self.tts.export_metrics())
+            self.status_var.set(self.get_text("metrics_copied"))
+        ctk.CTkButton(self.stats_window, text=self.get_text("copy_metrics"),
+                      command=copy_metrics).pack(pady=(0, 10))
+        
+        def refresh():
+            if self.stats_window is None or not self.stats_window.winfo_exists():
+                return
+            stats = self.tts.timing_stats()
+            if stats:
+                count = max(s["count"] for s in stats.values())
+                lines = [self.get_text("latency_stats").format(count=count), "",
+                         f"{'':<15}{'p50':>9}{'p95':>9}{'p99':>9}{'n':>6}"]
+                for stage, s in stats.items():
+                    lines.append(f"{stage:<15}{s['p50']:>9.1f}{s['p95']:>9.1f}{s['p99']:>9.1f}{s['count']:>6}")
+            else:
+                lines = [self.get_text("no_stats")]
+            devices = self.tts.output.sync_stats()
+            if devices:
+                names = {i: n for n, i in self.audio_devices.items()}
+                lines += ["", self.get_text("output_stats"), "",
+                          f"{'':<15}{'latency':>9}{'offset':>9}{'ppm':>9}"]
+                for device, d in devices.items():
+                    lines.append(f"{names.get(device, str(device))[:14]:<15}{d['latency_ms']:>9.1f}"
+                                 f"{d['offset_ms']:>9.2f}{d['drift_ppm']:>9.0f}")
+            stats_text.configure(state="normal")
+            stats_text.delete("1.0", tk.END)
+            stats_text.insert("1.0", "\n".join(lines))
+            stats_text.configure(state="disabled")
+            self.stats_window.after(1000, refresh)
+        refresh()
+
+    def add_to_history(self, text, voice=None, rate=None):
+        # Add to history with the voice, rate and cache key it was spoken with
+        # (written to disk in the background)
+        key = get_tts_key(text, voice, rate) if voice and rate else None
+        self.history.append(text, voice=voice, rate=rate, key=key)
         
         # Update display
         self.update_history_display()
@@ -1132,27 +1192,9 @@ class VirtualMicrophoneApp:
         # Reset history navigation
         self.current_history_index = -1
 
-    def load_history(self):
-        try:
-            if os.path.exists(self.history_file):
-                with open(self.history_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-        except Exception:
-            pass
-            
-        return []
-
-    def save_history(self):
-        try:
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                json.dump(self.message_history, f, indent=2)
-        except Exception as e:
-            # Just log error but don't show to user
-            print(f"Could not save history: {str(e)}")
-
     def clear_all(self):
         # Ask for confirmation if there's text or history
-        if (self.text_input.get("1.0", tk.END).strip() or self.message_history):
+        if (self.text_input.get("1.0", tk.END).strip() or len(self.history)):
             confirm = MessageBox(
                 title=self.get_text("app_title"),
                 message=self.get_text("clear_confirm") if "clear_confirm" in self.translations[self.ui_language] 
@@ -1168,11 +1210,9 @@ class VirtualMicrophoneApp:
         # Clear text input
         self.text_input.delete("1.0", tk.END)
         # Clear history
-        self.message_history = []
+        self.history.clear()
         self.current_history_index = -1
         self.update_history_display()
-        # Save empty history to file
-        self.save_history()
         self.status_var.set(self.get_text("cleared"))
 
     def on_closing(self):
@@ -1190,7 +1230,15 @@ class VirtualMicrophoneApp:
                 return
                 
             self.save_settings()
-            self.save_history()
+            self.history.close()
+            stats = self.tts.speculator.stats()
+            if stats["issued"]:
+                print(f"Speculative synthesis: {stats['hits'] + stats['inflight_hits']} hits, "
+                      f"{stats['misses']} misses, {stats['cancelled']} cancelled, "
+                      f"{stats['issued_chars']} characters issued")
+            if self.control_server:
+                self.control_server.stop().result(timeout=2)
+            self.tts.close()
             self.root.destroy()
         except Exception as e:
             print(f"Error during closing: {e}")
@@ -1216,11 +1264,15 @@ class VirtualMicrophoneApp:
         self.logo_label.configure(text=self.get_text("app_title"))
         self.subtitle.configure(text=self.get_text("app_subtitle"))
         self.history_label.configure(text=self.get_text("message_history"))
+        self.history_search.configure(placeholder_text=self.get_text("search_history"))
         self.text_label.configure(text=self.get_text("type_message"))
         self.speak_btn.configure(text=self.get_text("speak"))
         self.stop_btn.configure(text=self.get_text("stop"))
         self.clear_btn.configure(text=self.get_text("clear"))
+        self.stats_btn.configure(text=self.get_text("stats"))
         self.force_overlap_cb.configure(text=self.get_text("force_overlap"))
+        self.stream_playback_cb.configure(text=self.get_text("stream_playback"))
+        self.speculative_cb.configure(text=self.get_text("speculative"))
         self.cable_reminder.configure(text=self.get_text("discord_reminder"))
         self.status_var.set(self.get_text("ready"))
 
@@ -1278,54 +1330,95 @@ class VirtualMicrophoneApp:
         if hasattr(self, '_suggest_after_id'):
             self.root.after_cancel(self._suggest_after_id)
         self._suggest_after_id = self.root.after(1000, self.suggest_voice_for_text)
+        
+        # Pre-generate the text once typing pauses
+        if hasattr(self, '_speculate_after_id'):
+            self.root.after_cancel(self._speculate_after_id)
+        if self.tts.speculative:
+            self._speculate_after_id = self.root.after(600, self._speculate)
+
+    def _speculate(self):
+        """Start rendering the current text; jobs for text that changed are cancelled"""
+        selected_display = self.voice_cb.get()
+        voice = next((v['name'] for v in self.filtered_voices if v['display'] == selected_display), None)
+        if not voice:
+            return
+        text = self.text_input.get('1.0', tk.END).strip()
+        self.tts.speculate(text, voice, self.update_speed_label())
+
+    def _apply_playback_options(self):
+        """Pass the streaming and speculation checkboxes on to the engine"""
+        self.tts.stream_playback = self.stream_playback_var.get()
+        self.tts.speculative = self.speculative_var.get()
+        if not self.tts.speculative:
+            self.tts.cancel_speculation()
+
+    def _on_history_search(self, *args):
+        """Search again shortly after the user stops typing"""
+        if self._history_search_job is not None:
+            self.root.after_cancel(self._history_search_job)
+        self._history_search_job = self.root.after(150, self.update_history_display)
 
     def update_history_display(self):
-        self.history_list.configure(state="normal")
-        self.history_list.delete("1.0", tk.END)
+        self._history_search_job = None
+        query = self.history_search_var.get().strip()
+        reset = query != self._history_query
+        self._history_query = query
+        self._history_query_seq += 1
+        seq = self._history_query_seq
+        if not query:
+            # Newest first, read page by page as the list scrolls
+            self.history_list.set_source(len(self.history), self.history.page, reset=reset)
+            return
         
-        for i, item in enumerate(reversed(self.message_history[-10:])):  # Show last 10 messages
-            timestamp = item.get("timestamp", "")
-            text = item.get("text", "")
-            
-            # Truncate long messages
-            if len(text) > 50:
-                text = text[:47] + "..."
-                
-            # Remove newlines
-            text = text.replace("\n", " ")
-            
-            self.history_list.insert(tk.END, f"[{timestamp}] {text}\n")
-            
-        self.history_list.configure(state="disabled")
-
-    def select_history_item(self, event):
-        try:
-            # Get clicked line
-            index = self.history_list.index("@%s,%s" % (event.x, event.y))
-            line = int(index.split(".")[0]) - 1
-            
-            # Reverse index to match history
-            history_index = min(9, len(self.message_history) - 1) - line
-            if 0 <= history_index < len(self.message_history):
-                # Set text to input
-                selected_text = self.message_history[history_index]["text"]
-                self.text_input.delete("1.0", tk.END)
-                self.text_input.insert("1.0", selected_text)
-                
-                # Update current index for up/down navigation
-                self.current_history_index = history_index
-        except Exception:
-            pass
+        # The first search builds the index, so search off the UI thread
+        def search():
+            try:
+                ids = self.history.search(query)
+            except Exception as e:
+                print(f"History search failed: {e}")
+                return
+            def show():
+                if seq == self._history_query_seq:
+                    self.history_list.set_source(
+                        len(ids), lambda start, count: self.history.entries(ids[start:start + count]),
+                        reset=reset)
+            self.root.after(0, show)
+        threading.Thread(target=search, daemon=True).start()
+
+    @staticmethod
+    def _history_row(item) -> str:
+        """Text of a history list row"""
+        text = item.get("text", "").replace("\n", " ")
+        
+        # Truncate long messages
+        if len(text) > 80:
+            text = text[:77] + "..."
+        
+        # Messages from earlier days show their date
+        timestamp = item.get("timestamp", "")
+        if item.get("date") != datetime.now().strftime("%Y-%m-%d"):
+            timestamp = f'{item.get("date")} {timestamp}'
+        return f"[{timestamp}] {text}"
+
+    def select_history_item(self, index, item):
+        # Set text to input
+        self.text_input.delete("1.0", tk.END)
+        self.text_input.insert("1.0", item["text"])
+        
+        # Up/down navigation continues from here when the list is not filtered
+        self.current_history_index = -1 if self._history_query else index
 
     def navigate_history_up(self, event):
-        if not self.message_history:
+        if not len(self.history):
             return "break"
             
-        if self.current_history_index < len(self.message_history) - 1:
+        if self.current_history_index < len(self.history) - 1:
             self.current_history_index += 1
             
-        if 0 <= self.current_history_index < len(self.message_history):
-            selected_text = self.message_history[self.current_history_index]["text"]
+        item = self.history.newest(self.current_history_index)
+        if item is not None:
+            selected_text = item["text"]
             self.text_input.delete("1.0", tk.END)
             self.text_input.insert("1.0", selected_text)
             
@@ -1334,7 +1427,7 @@ class VirtualMicrophoneApp:
     def navigate_history_down(self, event):
         if self.current_history_index > 0:
             self.current_history_index -= 1
-            selected_text = self.message_history[self.current_history_index]["text"]
+            selected_text = self.history.newest(self.current_history_index)["text"]
             self.text_input.delete("1.0", tk.END)
             self.text_input.insert("1.0", selected_text)
         elif self.current_history_index == 0:
@@ -1351,7 +1444,28 @@ class VirtualMicrophoneApp:
             "speed": 0,
             "language": "All Languages",
             "ui_language": "en",  # Default to English
-            "force_overlap": False  # Default to not overlapping playback
+            "force_overlap": False,  # Default to not overlapping playback
+            "stream_playback": True,  # Default to playing audio while it is generated
+            "speculative_synthesis": False,  # Render text during typing pauses
+            "speculation_budget_chars": 2000,  # Speculative characters allowed per minute
+            "warm_cache_count": 20,  # History messages pre-rendered at startup (0 = off)
+            "voice_catalog_ttl_hours": 24,  # Refresh the saved voice list after this long
+            "control_server": False,  # Local HTTP/WebSocket API on 127.0.0.1
+            "control_port": 8765,
+            "control_token": "",  # Optional bearer token for the API
+            "cache_max_mb": 256,  # Disk budget for cached speech
+            "cache_policy": "lru",  # Cache eviction: "lru" or "lfu"
+            "pcm_cache_mb": 64,  # Memory budget for decoded audio of recent phrases
+            "synthesis_concurrency": 3,  # Sentences of a long message rendered at once
+            "sync_outputs": True,  # Keep the monitor in step with the Discord cable
+            "synthesis_deadline": 20,  # Seconds to wait for the first audio before giving up
+            "hedged_requests": True,  # Send a second request when Edge TTS is slower than usual
+            "fallback_backend": True,  # Use gTTS when Edge TTS fails
+            "warm_connection": True,  # Keep an Edge TTS connection open between messages
+            "postprocess_audio": True,  # Trim silence and even out loudness of new audio
+            "silence_threshold_db": -50,  # Level (dBFS) below which leading/trailing audio is cut
+            "target_lufs": -18,  # Loudness every voice is brought to
+            "peak_db": -1  # Peak limiter ceiling (dBFS)
         }
         
         try:
@@ -1401,33 +1515,10 @@ class VirtualMicrophoneApp:
             # Get speech rate from slider
             rate = self.update_speed_label()
             
-            # Generate TTS
-            future = asyncio.run_coroutine_threadsafe(_tts_edge(text, voice_name, rate), self.loop)
-            wav_path = future.result()
-            
-            if wav_path:
-                # Set playing flag
-                self.is_playing = True
-                
-                # Play the audio
-                try:
-                    data, fs = sf.read(wav_path, dtype='float32')
-                    chans = data.shape[1] if data.ndim > 1 else 1
-                    
-                    # Play only to monitor device (not to Discord)
-                    midx = self.audio_devices.get(self.mon_cb.get())
-                    if midx is not None:
-                        with sd.OutputStream(device=midx, samplerate=fs,
-                                          channels=chans, dtype='float32',
-                                          blocksize=1024, latency='low') as s:
-                            s.write(data)
-                finally:
-                    # Clean up
-                    self.is_playing = False
-                    try:
-                        os.unlink(wav_path)
-                    except:
-                        pass
+            # Play only to monitor device (not to Discord); the clip stays cached for next time.
+            # It goes through the scheduler, so a message that is playing is not cut off.
+            if self._update_output_routes():
+                self.tts.run(self.tts.play(text, voice_name, rate, routes=("monitor",))).result()
         except Exception as e:
             print(f"Preview error: {e}")
         finally:
@@ -0,0 +1,336 @@
+"""
+Warm, reusable Edge TTS connections for the Discord TTS App.
+
+edge_tts.Communicate opens a new websocket for every message, paying for a DNS lookup and
+the TCP, TLS and websocket handshakes each time; on a slow link that is a large part of
+the wait for a short message. EdgeConnectionPool keeps connections to the service open
+and sends one request after another over them, which the protocol allows once the turn
+of the previous request has ended. Connections are opened ahead of time (prewarm), kept
+alive with websocket pings, retired when they have been idle or open for too long, and
+never reused after a request that did not end cleanly. A request that fails on a warm
+connection before any audio arrived is retried once on a new connection, so a connection
+the service dropped costs a handshake, not an error.
+
+The protocol helpers come from edge_tts (pinned in requirements.txt). If they cannot be
+imported, EdgeBackend keeps using edge_tts.Communicate.
+"""
+
+import ssl
+import time
+import asyncio
+from collections import deque
+from xml.sax.saxutils import escape
+
+import aiohttp
+import certifi
+import numpy as np
+
+try:
+    from edge_tts import communicate as _protocol
+    from edge_tts.constants import SEC_MS_GEC_VERSION, WSS_HEADERS
+    from edge_tts.data_classes import TTSConfig
+    from edge_tts.drm import DRM
+    from edge_tts.exceptions import NoAudioReceived, UnexpectedResponse, UnknownResponse, WebSocketError
+except ImportError:
+    _protocol = None
+
+# Audio format and metadata requested once per connection, as edge_tts.Communicate does
+_SPEECH_CONFIG = (
+    "Content-Type:application/json; charset=utf-8\r\n"
+    "Path:speech.config\r\n\r\n"
+    '{"context":{"synthesis":{"audio":{"metadataoptions":{'
+    '"sentenceBoundaryEnabled":"false","wordBoundaryEnabled":"true"},'
+    '"outputFormat":"audio-24khz-48kbitrate-mono-mp3"'
+    "}}}}\r\n"
+)
+
+class EdgeConnection:
+    """An open websocket to the service; carries one request at a time"""
+    def __init__(self, ws, handshake: float):
+        self.ws = ws
+        self.handshake = handshake
+        self.opened = time.monotonic()
+        self.idle_since = self.opened
+        self.requests = 0
+
+    @property
+    def closed(self) -> bool:
+        return self.ws.closed
+
+    async def close(self):
+        try:
+            await self.ws.close()
+        except Exception:
+            pass
+
+class EdgeConnectionPool:
+    """
+    Open Edge TTS websockets, reused across requests
+
+    All methods must be called on one event loop; connections opened on a loop that is no
+    longer running are dropped.
+    """
+    def __init__(self, max_idle: int = 2, idle_timeout: float = 90.0, max_age: float = 240.0,
+                 heartbeat: float = 20.0, connect_timeout: int = 10):
+        """
+        Args:
+            max_idle (int): Open connections kept for later requests
+            idle_timeout (float): Seconds an unused connection stays open
+            max_age (float): Seconds after which a connection is no longer reused
+                (the service's connection token is only valid for a few minutes)
+            heartbeat (float): Seconds between pings that keep an idle connection alive
+            connect_timeout (int): Seconds allowed for the TCP connection
+        """
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.max_age = max_age
+        self.heartbeat = heartbeat
+        self.connect_timeout = connect_timeout
+        self._loop = None
+        self._session = None
+        self._ssl = None
+        self._idle = []         # EdgeConnection, most recently used last
+        self._opening = None    # Task opening a connection ahead of time
+        self._prune_handle = None
+        self._prewarm_after = 0.0  # No prewarm before this time after one failed
+        self.opened = 0
+        self.warm = 0           # Requests sent over a connection that was already open
+        self.cold = 0           # Requests that waited for a new connection
+        self.dropped = 0        # Warm connections the service had closed
+        self.handshakes = deque(maxlen=200)
+
+    @property
+    def supported(self) -> bool:
+        """Whether the edge_tts protocol helpers could be imported"""
+        return _protocol is not None
+
+    async def prewarm(self):
+        """Open a connection for the next request unless one is open or being opened"""
+        self._bind()
+        self._prune()
+        if self._idle or (self._opening is None and time.monotonic() < self._prewarm_after):
+            return
+        if self._opening is None:
+            self._opening = asyncio.ensure_future(self._open())
+            self._opening.add_done_callback(self._prewarmed)
+        await asyncio.wait([self._opening])
+
+    async def stream(self, text: str, voice: str, rate: str, timings: dict = None):
+        """
+        Yield the MP3 chunks of text, over a warm connection when there is one
+
+        Args:
+            text (str): The text to convert to speech
+            voice (str): Edge voice name
+            rate (str): Speaking rate (e.g. "+10%")
+            timings (dict): Receives the seconds spent waiting for a handshake as "handshake"
+        """
+        config = TTSConfig(voice, rate, "+0%", "+0Hz")
+        parts = _protocol.split_text_by_byte_length(
+            escape(_protocol.remove_incompatible_characters(text)),
+            _protocol.calc_max_mesg_size(config))
+        for part in parts:
+            fresh = False
+            while True:
+                conn, waited, warm = await self._acquire(fresh)
+                if timings is not None:
+                    timings["handshake"] = timings.get("handshake", 0.0) + waited
+                ended = received = False
+                try:
+                    async for chunk in self._request(conn, config, part):
+                        received = True
+                        yield chunk
+                    ended = True
+                except (aiohttp.ClientError, ConnectionError, WebSocketError):
+                    if received or not warm:
+                        raise
+                    # The service closed the connection while it was idle; use a new one
+                    self.dropped += 1
+                    fresh = True
+                    continue
+                finally:
+                    self._release(conn, ended)
+                break
+
+    def stats(self) -> dict:
+        """Connections opened, requests on warm and new connections, and handshake times"""
+        def ms(q):
+            return round(float(np.percentile(self.handshakes, q)) * 1000, 1) if self.handshakes else None
+        return {
+            "opened": self.opened,
+            "warm": self.warm,
+            "cold": self.cold,
+            "dropped": self.dropped,
+            "idle": len(self._idle),
+            "handshake_p50_ms": ms(50),
+            "handshake_p95_ms": ms(95),
+        }
+
+    async def close(self):
+        """Close the idle connections and the HTTP session"""
+        if self._prune_handle is not None:
+            self._prune_handle.cancel()
+            self._prune_handle = None
+        if self._opening is not None:
+            self._opening.cancel()
+            self._opening = None
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            await conn.close()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _bind(self):
+        """Start over when called from a different event loop than before"""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Connections and the session belong to the loop that opened them
+            self._loop = loop
+            self._session = None
+            self._idle = []
+            self._opening = None
+            self._prune_handle = None
+
+    async def _acquire(self, fresh: bool = False):
+        """
+        A connection for one request
+
+        Returns:
+            tuple: (EdgeConnection, seconds waited for a handshake, whether it was already open)
+        """
+        self._bind()
+        started = time.monotonic()
+        while not fresh:
+            self._prune()
+            if self._idle:
+                self.warm += 1
+                conn = self._idle.pop()
+                conn.requests += 1
+                return conn, time.monotonic() - started, True
+            if self._opening is None:
+                break
+            # A prewarm is under way; its connection becomes idle when it is open
+            await asyncio.wait([self._opening])
+        self.cold += 1
+        conn = await self._open()
+        conn.requests += 1
+        return conn, time.monotonic() - started, False
+
+    def _release(self, conn, reusable: bool):
+        """Keep a connection for later requests, or close it"""
+        now = time.monotonic()
+        if (reusable and not conn.closed and self._loop is not None and not self._loop.is_closed()
+                and len(self._idle) < self.max_idle and now - conn.opened < self.max_age):
+            conn.idle_since = now
+            self._idle.append(conn)
+            self._schedule_prune()
+        else:
+            asyncio.ensure_future(conn.close())
+
+    def _prewarmed(self, task):
+        if task is self._opening:
+            self._opening = None
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            self._prewarm_after = time.monotonic() + 30
+            print(f"Could not open Edge TTS connection: {error}")
+        else:
+            self._release(task.result(), True)
+
+    def _prune(self):
+        """Close idle connections that are dead, unused for too long or too old"""
+        now = time.monotonic()
+        keep = []
+        for conn in self._idle:
+            if (conn.closed or now - conn.idle_since > self.idle_timeout
+                    or now - conn.opened > self.max_age):
+                asyncio.ensure_future(conn.close())
+            else:
+                keep.append(conn)
+        self._idle = keep
+
+    def _schedule_prune(self):
+        if self._prune_handle is None:
+            self._prune_handle = self._loop.call_later(self.idle_timeout, self._on_prune_timer)
+
+    def _on_prune_timer(self):
+        self._prune_handle = None
+        self._prune()
+        if self._idle:
+            self._schedule_prune()
+
+    async def _open(self) -> EdgeConnection:
+        """Connect to the service and send the speech configuration"""
+        if self._session is None or self._session.closed:
+            if self._ssl is None:
+                # Loading the CA bundle takes milliseconds; do it once
+                self._ssl = ssl.create_default_context(cafile=certifi.where())
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(ttl_dns_cache=300),
+                trust_env=True,
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.connect_timeout))
+        started = time.monotonic()
+        for attempt in range(2):
+            try:
+                ws = await self._session.ws_connect(
+                    f"{_protocol.WSS_URL}&Sec-MS-GEC={DRM.generate_sec_ms_gec()}"
+                    f"&Sec-MS-GEC-Version={SEC_MS_GEC_VERSION}"
+                    f"&ConnectionId={_protocol.connect_id()}",
+                    compress=15, headers=WSS_HEADERS, ssl=self._ssl, heartbeat=self.heartbeat)
+                break
+            except aiohttp.ClientResponseError as e:
+                # 403 means the clock is off; edge_tts corrects it from the server's date
+                if e.status != 403 or attempt:
+                    raise
+                DRM.handle_client_response_error(e)
+        try:
+            await ws.send_str(f"X-Timestamp:{_protocol.date_to_string()}\r\n{_SPEECH_CONFIG}")
+        except BaseException:
+            await ws.close()
+            raise
+        handshake = time.monotonic() - started
+        self.opened += 1
+        self.handshakes.append(handshake)
+        return EdgeConnection(ws, handshake)
+
+    @staticmethod
+    async def _request(conn, config, part):
+        """Send one SSML request and yield its audio until the service ends the turn"""
+        ws = conn.ws
+        await ws.send_str(_protocol.ssml_headers_plus_data(
+            _protocol.connect_id(), _protocol.date_to_string(), _protocol.mkssml(config, part)))
+        audio_received = False
+        while True:
+            received = await ws.receive()
+            if received.type == aiohttp.WSMsgType.TEXT:
+                data = received.data.encode("utf-8")
+                parameters, _ = _protocol.get_headers_and_data(data, data.find(b"\r\n\r\n"))
+                path = parameters.get(b"Path")
+                if path == b"turn.end":
+                    break
+                if path not in (b"response", b"turn.start", b"audio.metadata"):
+                    raise UnknownResponse("Unknown path received")
+            elif received.type == aiohttp.WSMsgType.BINARY:
+                if len(received.data) < 2:
+                    raise UnexpectedResponse("Binary message is missing the header length")
+                header_length = int.from_bytes(received.data[:2], "big")
+                if header_length > len(received.data):
+                    raise UnexpectedResponse("Header length is greater than the message")
+                parameters, data = _protocol.get_headers_and_data(received.data, header_length)
+                if parameters.get(b"Path") != b"audio":
+                    raise UnexpectedResponse("Binary message is not audio")
+                if not data:
+                    continue  # The end of the audio is marked by an empty message
+                if parameters.get(b"Content-Type") != b"audio/mpeg":
+                    raise UnexpectedResponse("Audio with an unexpected Content-Type")
+                audio_received = True
+                yield data
+            elif received.type == aiohttp.WSMsgType.ERROR:
+                raise WebSocketError(str(received.data or "Unknown error"))
+            else:
+                raise ConnectionResetError("Edge TTS closed the connection")
+        if not audio_received:
+            raise NoAudioReceived("No audio was received. Please verify that your parameters are correct.")
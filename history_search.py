@@ -0,0 +1,98 @@
+"""
+Full-text search over the message history of the Discord TTS App.
+
+Messages are indexed by character trigrams, which works the same for English words and
+for CJK text that has no spaces to split on. A query is looked up through the posting
+list of its rarest trigram and every candidate is checked with a substring match, so
+results are exact. Queries shorter than three characters (common in Chinese) are
+answered by scanning the folded texts, which is still fast for 50k+ messages.
+"""
+
+import bisect
+import threading
+from array import array
+
+def normalize(text: str) -> str:
+    """Case-fold text and collapse whitespace, for indexing and queries alike"""
+    return " ".join(text.casefold().split())
+
+def trigrams(text: str) -> set:
+    """Distinct three-character substrings of normalized text"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class TrigramIndex:
+    """
+    In-memory trigram index of history entries
+
+    Entries are identified by increasing integer ids; results are returned newest (highest
+    id) first. add() and search() may be called from different threads.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._texts = {}         # id -> normalized text
+        self._ids = array('q')   # every id, ascending
+        self._postings = {}      # trigram -> array of ids, ascending
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def __contains__(self, entry_id) -> bool:
+        return entry_id in self._texts
+
+    def add(self, entry_id: int, text: str):
+        """Index an entry; ids normally arrive in increasing order"""
+        folded = normalize(text)
+        with self._lock:
+            if entry_id in self._texts:
+                return
+            self._texts[entry_id] = folded
+            self._insert(self._ids, entry_id)
+            for gram in trigrams(folded):
+                ids = self._postings.get(gram)
+                if ids is None:
+                    self._postings[gram] = array('q', (entry_id,))
+                else:
+                    self._insert(ids, entry_id)
+
+    def clear(self):
+        with self._lock:
+            self._texts = {}
+            self._ids = array('q')
+            self._postings = {}
+
+    def search(self, query: str, limit: int = None) -> list:
+        """
+        Ids of the entries containing query (case-insensitive), newest first
+
+        Args:
+            query (str): Text to look for; an empty query matches every entry
+            limit (int): Maximum number of ids (default: all matches)
+        """
+        needle = normalize(query)
+        with self._lock:
+            if not needle:
+                ids = self._ids[::-1]
+                return list(ids if limit is None else ids[:limit])
+            if len(needle) < 3:
+                candidates = self._ids
+            else:
+                lists = [self._postings.get(gram) for gram in trigrams(needle)]
+                if not all(lists):
+                    return []
+                candidates = min(lists, key=len)
+            texts = self._texts
+            result = []
+            for entry_id in reversed(candidates):
+                if needle in texts[entry_id]:
+                    result.append(entry_id)
+                    if limit is not None and len(result) >= limit:
+                        break
+            return result
+
+    @staticmethod
+    def _insert(ids, entry_id):
+        """Append to an ascending array, keeping the order if an older id arrives late"""
+        if not ids or ids[-1] < entry_id:
+            ids.append(entry_id)
+        else:
+            ids.insert(bisect.bisect_left(ids, entry_id), entry_id)
@@ -0,0 +1,327 @@
+"""
+Persistent message history for the Discord TTS App.
+
+Sent messages are kept in a SQLite database instead of a JSON file that is rewritten on
+every message, so the history can grow to tens of thousands of entries. Every entry
+records the voice, rate and audio cache key it was spoken with. New entries go to an
+in-memory page of recent messages right away and are written in batches by a background
+thread, so the UI thread never waits on the disk. The database is only opened when the
+history is first used, and only the recent page is read at that point. The full-text
+search index (history_search) is likewise built on the first search.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import deque
+from datetime import datetime
+
+from history_search import TrigramIndex
+
+class HistoryStore:
+    """
+    Append-only message history backed by SQLite
+
+    Methods may be called from any thread. Entries are dicts with "id", "text", "voice",
+    "rate", "key", "time" (Unix time), and "date"/"timestamp" strings for display.
+    """
+    def __init__(self, path: str, legacy_json: str = None, page_size: int = 200,
+                 batch_size: int = 64, flush_interval: float = 0.5):
+        """
+        Args:
+            path (str): SQLite database file
+            legacy_json (str): Old JSON history imported once when the database is created
+            page_size (int): Recent entries kept in memory
+            batch_size (int): Pending entries that trigger a write right away
+            flush_interval (float): Longest time in seconds an entry waits to be written
+        """
+        self.path = path
+        self.legacy_json = legacy_json
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._recent = deque(maxlen=page_size)
+        self._pending = []
+        self._cond = threading.Condition()
+        self._db_lock = threading.Lock()
+        self._db = None
+        self._next_id = 1
+        self._count = 0
+        self._epoch = 0
+        self._writer = None
+        self._closed = False
+        self._index = None
+        self._index_lock = threading.Lock()
+
+    def append(self, text: str, voice: str = None, rate: str = None, key: str = None) -> dict:
+        """
+        Add a message; it is written to disk shortly afterwards
+
+        Returns:
+            dict: The new entry
+        """
+        self._ensure_open()
+        with self._cond:
+            created = time.time()
+            entry = self._entry(self._next_id, created, text, voice, rate, key)
+            self._next_id += 1
+            self._count += 1
+            self._recent.append(entry)
+            if self._index is not None:
+                self._index.add(entry["id"], text)
+            self._pending.append((entry["id"], created, text, voice, rate, key))
+            if self._writer is None and not self._closed:
+                self._writer = threading.Thread(target=self._write_loop, daemon=True)
+                self._writer.start()
+            self._cond.notify()
+        return entry
+
+    def recent(self, limit: int = None) -> list:
+        """
+        The newest entries, oldest first
+
+        Args:
+            limit (int): Number of entries (default: the whole recent page)
+        """
+        self._ensure_open()
+        with self._cond:
+            entries, count = list(self._recent), self._count
+        if limit is None:
+            return entries
+        if limit <= len(entries):
+            return entries[len(entries) - limit:] if limit > 0 else []
+        if entries and count > len(entries):
+            # Older than the recent page: read them from the database
+            return self.before(entries[0]["id"], limit - len(entries)) + entries
+        return entries
+
+    def newest(self, offset: int):
+        """
+        The entry offset places back from the newest (0 is the newest)
+
+        Returns:
+            dict: The entry, or None past the oldest one
+        """
+        self._ensure_open()
+        with self._cond:
+            if offset < len(self._recent):
+                return self._recent[-1 - offset]
+            if not self._recent or offset >= self._count:
+                return None
+            oldest_id, skip = self._recent[0]["id"], offset - len(self._recent)
+        rows = self._query("SELECT id, created, text, voice, rate, cache_key FROM history "
+                           "WHERE id < ? ORDER BY id DESC LIMIT 1 OFFSET ?", (oldest_id, skip))
+        return self._entry(*rows[0]) if rows else None
+
+    def page(self, offset: int, limit: int) -> list:
+        """
+        Up to limit entries starting offset places back from the newest, newest first
+        """
+        self._ensure_open()
+        with self._cond:
+            recent = list(self._recent)
+        entries = recent[::-1][offset:offset + limit]
+        if len(entries) < limit and recent and self._count > len(recent):
+            skip = max(0, offset - len(recent))
+            rows = self._query("SELECT id, created, text, voice, rate, cache_key FROM history "
+                               "WHERE id < ? ORDER BY id DESC LIMIT ? OFFSET ?",
+                               (recent[0]["id"], limit - len(entries), skip))
+            entries += [self._entry(*row) for row in rows]
+        return entries
+
+    def entries(self, ids) -> list:
+        """The entries with the given ids, in that order (ids that no longer exist are skipped)"""
+        self._ensure_open()
+        with self._cond:
+            found = {entry["id"]: entry for entry in self._recent}
+        missing = [entry_id for entry_id in ids if entry_id not in found]
+        for start in range(0, len(missing), 500):
+            chunk = missing[start:start + 500]
+            rows = self._query("SELECT id, created, text, voice, rate, cache_key FROM history "
+                               f"WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+            found.update((row[0], self._entry(*row)) for row in rows)
+        return [found[entry_id] for entry_id in ids if entry_id in found]
+
+    def search(self, query: str, limit: int = None) -> list:
+        """
+        Ids of the messages containing query (case-insensitive), newest first
+
+        The first search builds the index, which takes about a second per 50k messages;
+        call it off the UI thread.
+        """
+        return self._ensure_index().search(query, limit)
+
+    def before(self, entry_id: int, limit: int) -> list:
+        """Up to limit entries older than entry_id, oldest first"""
+        rows = self._query("SELECT id, created, text, voice, rate, cache_key FROM history "
+                           "WHERE id < ? ORDER BY id DESC LIMIT ?", (entry_id, limit))
+        return [self._entry(*row) for row in reversed(rows)]
+
+    def __len__(self) -> int:
+        self._ensure_open()
+        return self._count
+
+    def clear(self):
+        """Delete every entry"""
+        self._ensure_open()
+        with self._db_lock:
+            with self._cond:
+                self._pending = []
+                self._recent.clear()
+                self._count = 0
+                self._epoch += 1  # Batches taken before this point are dropped
+                if self._index is not None:
+                    self._index.clear()
+            if self._db is not None:
+                with self._db:
+                    self._db.execute("DELETE FROM history")
+
+    def flush(self):
+        """Write pending entries now"""
+        with self._cond:
+            batch, self._pending, epoch = self._pending, [], self._epoch
+        self._write(batch, epoch)
+
+    def close(self):
+        """Write pending entries and close the database"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self.flush()
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    @staticmethod
+    def _entry(entry_id, created, text, voice, rate, key) -> dict:
+        when = datetime.fromtimestamp(created)
+        return {
+            "id": entry_id,
+            "text": text,
+            "voice": voice,
+            "rate": rate,
+            "key": key,
+            "time": created,
+            "date": when.strftime("%Y-%m-%d"),
+            "timestamp": when.strftime("%H:%M:%S"),
+        }
+
+    def _ensure_open(self):
+        """Open the database and read the recent page on first use"""
+        if self._db is not None or self._closed:
+            return
+        with self._db_lock:
+            if self._db is not None:
+                return
+            is_new = not os.path.exists(self.path)
+            try:
+                db = sqlite3.connect(self.path, check_same_thread=False)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("PRAGMA synchronous=NORMAL")
+                with db:
+                    db.execute("CREATE TABLE IF NOT EXISTS history (id INTEGER PRIMARY KEY, "
+                               "created REAL NOT NULL, text TEXT NOT NULL, voice TEXT, rate TEXT, "
+                               "cache_key TEXT)")
+                    db.execute("CREATE INDEX IF NOT EXISTS history_key ON history (cache_key)")
+                    if is_new and self.legacy_json:
+                        self._import_legacy(db)
+                rows = db.execute("SELECT id, created, text, voice, rate, cache_key FROM history "
+                                  "ORDER BY id DESC LIMIT ?", (self._recent.maxlen,)).fetchall()
+                count = db.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+            except sqlite3.Error as e:
+                # Keep the history for this session only
+                print(f"Could not open history database: {e}")
+                db, rows, count = sqlite3.connect(":memory:", check_same_thread=False), [], 0
+                db.execute("CREATE TABLE history (id INTEGER PRIMARY KEY, created REAL NOT NULL, "
+                           "text TEXT NOT NULL, voice TEXT, rate TEXT, cache_key TEXT)")
+            with self._cond:
+                self._recent.extend(self._entry(*row) for row in reversed(rows))
+                self._count = count
+                self._next_id = rows[0][0] + 1 if rows else 1
+            self._db = db
+
+    def _ensure_index(self) -> TrigramIndex:
+        """Build the search index from the database on first use"""
+        self._ensure_open()
+        with self._index_lock:
+            if self._index is not None:
+                return self._index
+            index = TrigramIndex()
+            epoch, last = self._epoch, 0
+            while True:
+                # Read in chunks so writers and page reads are not blocked for long
+                rows = self._query("SELECT id, text FROM history WHERE id > ? ORDER BY id LIMIT 5000", (last,))
+                if not rows:
+                    break
+                for entry_id, text in rows:
+                    index.add(entry_id, text)
+                last = rows[-1][0]
+            with self._cond:
+                if epoch != self._epoch:
+                    index.clear()  # Cleared while indexing
+                # Entries that were not written yet when the table was read
+                for entry in self._recent:
+                    index.add(entry["id"], entry["text"])
+                self._index = index
+            return index
+
+    def _import_legacy(self, db):
+        """Copy the entries of the old JSON history into a new database"""
+        try:
+            with open(self.legacy_json, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"Could not import old history: {e}")
+            return
+        rows = []
+        for entry in entries:
+            try:
+                created = datetime.strptime(f'{entry.get("date")} {entry.get("timestamp")}',
+                                            "%Y-%m-%d %H:%M:%S").timestamp()
+            except (TypeError, ValueError):
+                created = 0.0
+            if entry.get("text"):
+                rows.append((created, entry["text"], entry.get("voice"), entry.get("rate"), entry.get("key")))
+        db.executemany("INSERT INTO history (created, text, voice, rate, cache_key) "
+                       "VALUES (?, ?, ?, ?, ?)", rows)
+
+    def _query(self, sql, params=()) -> list:
+        with self._db_lock:
+            if self._db is None:
+                return []
+            return self._db.execute(sql, params).fetchall()
+
+    def _write(self, batch, epoch):
+        """Insert a batch of entries in one transaction, unless the history was cleared since"""
+        if not batch:
+            return
+        with self._db_lock:
+            if self._db is None or epoch != self._epoch:
+                return
+            try:
+                with self._db:
+                    self._db.executemany("INSERT OR REPLACE INTO history (id, created, text, voice, "
+                                         "rate, cache_key) VALUES (?, ?, ?, ?, ?, ?)", batch)
+            except sqlite3.Error as e:
+                print(f"Could not save history: {e}")
+
+    def _write_loop(self):
+        """Write pending entries in batches"""
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                if not self._pending:
+                    self._cond.wait()
+                    continue
+                if len(self._pending) < self.batch_size:
+                    # Let a burst of messages collect into one transaction
+                    self._cond.wait(self.flush_interval)
+                if self._closed:
+                    return
+                batch, self._pending, epoch = self._pending, [], self._epoch
+            self._write(batch, epoch)
@@ -0,0 +1,179 @@
+"""
+Virtualized list widget for the Discord TTS App message history.
+
+The history can hold tens of thousands of messages, far more than a text box or one
+widget per row can handle. VirtualList draws only the rows that are in view on a canvas
+and asks its data source for just those rows, so scrolling and filtering stay fast no
+matter how long the list is.
+"""
+
+import tkinter as tk
+
+import customtkinter as ctk
+
+class VirtualList(ctk.CTkFrame):
+    """
+    Scrollable single-column list that renders only the visible rows
+
+    The rows come from fetch(start, count), which returns the items at those positions;
+    render(item) turns an item into the text of its row. Double-clicking or pressing Enter
+    on a row calls on_activate(index, item).
+    """
+    # Rows fetched beyond the visible ones, so small scrolls need no new fetch
+    _PREFETCH = 20
+
+    def __init__(self, master, render=str, on_activate=None, row_height: int = 22, **kwargs):
+        """
+        Args:
+            master: Parent widget
+            render (callable): item -> row text
+            on_activate (callable): Called with (index, item) when a row is chosen
+            row_height (int): Row height in pixels
+        """
+        super().__init__(master, **kwargs)
+        self.render = render
+        self.on_activate = on_activate
+        self.row_height = row_height
+        self._count = 0
+        self._fetch = lambda start, count: []
+        self._rows = {}       # index -> item of the rows fetched for the current view
+        self._top = 0         # Scroll position in pixels
+        self._selected = None
+
+        self.canvas = tk.Canvas(self, highlightthickness=0, borderwidth=0, takefocus=True,
+                                background=self._apply_appearance_mode(self.cget("fg_color")))
+        self.scrollbar = ctk.CTkScrollbar(self, command=self._on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(5, 0), pady=5)
+        self._font = ctk.CTkFont()
+
+        self.canvas.bind("<Configure>", lambda e: self.redraw())
+        self.canvas.bind("<Button-1>", self._on_click)
+        self.canvas.bind("<Double-Button-1>", self._on_double_click)
+        self.canvas.bind("<Return>", lambda e: self._activate(self._selected))
+        self.canvas.bind("<Up>", lambda e: self._move_selection(-1))
+        self.canvas.bind("<Down>", lambda e: self._move_selection(1))
+        for widget in (self.canvas, self):
+            widget.bind("<MouseWheel>", self._on_wheel)
+            widget.bind("<Button-4>", lambda e: self.scroll_rows(-3))
+            widget.bind("<Button-5>", lambda e: self.scroll_rows(3))
+
+    def set_source(self, count: int, fetch, reset: bool = True):
+        """
+        Show a new list of count items
+
+        Args:
+            count (int): Number of rows
+            fetch (callable): (start, count) -> items at those positions
+            reset (bool): Scroll back to the top and clear the selection
+        """
+        self._count = count
+        self._fetch = fetch
+        self._rows = {}
+        if reset:
+            self._top = 0
+            self._selected = None
+        self.redraw()
+
+    def scroll_rows(self, rows: int):
+        self._scroll_to(self._top + rows * self.row_height)
+
+    def redraw(self):
+        """Draw the rows in view, fetching the ones that are not loaded yet"""
+        canvas = self.canvas
+        height = max(canvas.winfo_height(), 1)
+        self._top = max(0, min(self._top, self._max_top()))
+        first = self._top // self.row_height
+        last = min(self._count, (self._top + height) // self.row_height + 1)
+        self._load(first, last)
+
+        canvas.delete("all")
+        mode = 1 if ctk.get_appearance_mode() == "Dark" else 0
+        text_color = ctk.ThemeManager.theme["CTkLabel"]["text_color"][mode]
+        select_color = ctk.ThemeManager.theme["CTkButton"]["fg_color"][mode]
+        canvas.configure(background=self._apply_appearance_mode(self.cget("fg_color")))
+        for index in range(first, last):
+            item = self._rows.get(index)
+            if item is None:
+                continue
+            y = index * self.row_height - self._top
+            if index == self._selected:
+                canvas.create_rectangle(0, y, canvas.winfo_width(), y + self.row_height,
+                                        fill=select_color, width=0)
+            canvas.create_text(4, y + self.row_height // 2, anchor="w", text=self.render(item),
+                               fill=text_color, font=self._font)
+
+        total = max(self._count * self.row_height, 1)
+        self.scrollbar.set(self._top / total, min(1.0, (self._top + height) / total))
+
+    def _load(self, first, last):
+        """Fetch the rows first..last (plus some margin) that are not loaded"""
+        missing = [index for index in range(first, last) if index not in self._rows]
+        if not missing:
+            return
+        if len(self._rows) > 10 * (last - first + 2 * self._PREFETCH):
+            # Only keep rows near the view
+            self._rows = {}
+            missing = [first, last - 1]
+        start = max(0, missing[0] - self._PREFETCH)
+        end = min(self._count, missing[-1] + 1 + self._PREFETCH)
+        items = self._fetch(start, end - start)
+        for offset, item in enumerate(items):
+            self._rows[start + offset] = item
+
+    def _max_top(self) -> int:
+        return max(0, self._count * self.row_height - self.canvas.winfo_height())
+
+    def _scroll_to(self, top):
+        top = max(0, min(int(top), self._max_top()))
+        if top != self._top:
+            self._top = top
+            self.redraw()
+
+    def _on_scrollbar(self, *args):
+        if args[0] == "moveto":
+            self._scroll_to(float(args[1]) * self._count * self.row_height)
+        elif args[0] == "scroll":
+            step = self.canvas.winfo_height() if args[2] == "pages" else self.row_height
+            self._scroll_to(self._top + int(args[1]) * step)
+
+    def _on_wheel(self, event):
+        # Windows reports multiples of 120, macOS small deltas
+        delta = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        self.scroll_rows(-3 * delta)
+        return "break"
+
+    def _index_at(self, y):
+        index = (self._top + y) // self.row_height
+        return index if 0 <= index < self._count else None
+
+    def _on_click(self, event):
+        self.canvas.focus_set()
+        self._selected = self._index_at(event.y)
+        self.redraw()
+
+    def _on_double_click(self, event):
+        self._activate(self._index_at(event.y))
+
+    def _move_selection(self, step):
+        if not self._count:
+            return "break"
+        index = 0 if self._selected is None else max(0, min(self._count - 1, self._selected + step))
+        self._selected = index
+        # Keep the selected row in view
+        y = index * self.row_height
+        if y < self._top:
+            self._scroll_to(y)
+        elif y + self.row_height > self._top + self.canvas.winfo_height():
+            self._scroll_to(y + self.row_height - self.canvas.winfo_height())
+        self.redraw()
+        return "break"
+
+    def _activate(self, index):
+        if index is None or self.on_activate is None:
+            return
+        if index not in self._rows:
+            self._load(index, index + 1)
+        item = self._rows.get(index)
+        if item is not None:
+            self.on_activate(index, item)
@@ -0,0 +1,104 @@
+"""
+Single-flight deduplication for the Discord TTS App.
+
+A preview and a speak of the same text, two quick Ctrl+Enters, or a speculative render
+that is still running when the message is sent all ask for the same TTS key at once.
+SingleFlight keeps a table of the requests that are in flight, so the first caller starts
+the work and everyone else awaits that same result instead of opening another Edge TTS
+connection and writing the same cache entry again.
+
+Work may also publish blocks (decoded audio) while it runs. A caller that joins late first
+receives every block published so far, so streamed playback of a shared render is complete.
+"""
+
+import asyncio
+
+class Flight:
+    """One shared piece of work and the callers waiting for it"""
+    def __init__(self, task=None):
+        self.task = task
+        self.waiters = 0
+        self.blocks = []
+        self._listeners = []
+
+    def publish(self, block):
+        """Pass a block to every subscribed caller and keep it for late joiners"""
+        self.blocks.append(block)
+        for listener in list(self._listeners):
+            listener(block)
+
+    def subscribe(self, listener):
+        """Replay the blocks published so far to listener and send it the rest"""
+        for block in list(self.blocks):
+            listener(block)
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+class SingleFlight:
+    """
+    Table of in-flight work keyed by request
+
+    Must be used from coroutines; flights are kept per event loop. The shared work keeps
+    running while any caller waits for it. When the last waiting caller is cancelled the
+    work is cancelled too, so abandoned requests do not use the network for nothing.
+    """
+    def __init__(self):
+        self._flights = {}  # (loop, key) -> Flight
+        self.started = 0
+        self.joined = 0
+
+    async def run(self, key, work, on_block=None):
+        """
+        Run work for key, or join the run that is already in flight
+
+        Args:
+            key: Identifies the request (e.g. the TTS key)
+            work (callable): Coroutine function taking a publish(block) callback
+            on_block (callable): Receives every block the work publishes (optional)
+
+        Returns:
+            The result of the shared work; its exception is raised to every caller
+        """
+        loop = asyncio.get_running_loop()
+        flight = self._flights.get((loop, key))
+        if flight is None:
+            flight = Flight()
+            flight.task = loop.create_task(work(flight.publish))
+            self._flights[(loop, key)] = flight
+            flight.task.add_done_callback(lambda _: self._forget(loop, key, flight))
+            self.started += 1
+        else:
+            self.joined += 1
+        if on_block is not None:
+            flight.subscribe(on_block)
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            # Only cancel the work itself once nobody is waiting for it any more
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+            if on_block is not None:
+                flight.unsubscribe(on_block)
+
+    def stats(self) -> dict:
+        """Runs started, callers that joined a running one, and runs in flight now"""
+        total = self.started + self.joined
+        return {
+            "started": self.started,
+            "joined": self.joined,
+            "in_flight": len(self._flights),
+            "dedup_rate": self.joined / total if total else 0.0,
+        }
+
+    def _forget(self, loop, key, flight):
+        if self._flights.get((loop, key)) is flight:
+            del self._flights[(loop, key)]
+        if not flight.task.cancelled():
+            flight.task.exception()  # Retrieved, so an unawaited failure is not logged
@@ -0,0 +1,171 @@
+"""
+Speculative pre-synthesis for the Discord TTS App.
+
+While the user pauses typing, the segments of the current text are rendered into the
+audio cache ahead of time, so pressing Ctrl+Enter usually finds the audio ready. Jobs for
+text that has since changed are cancelled, the amount of speculative synthesis is limited
+by a rolling character budget, and hit/miss counters show how often it paid off.
+"""
+
+import time
+import asyncio
+import threading
+from collections import OrderedDict, deque
+
+from speech_pipeline import split_segments
+
+class SpeculativeSynthesizer:
+    """
+    Render the segments of text that is still being typed
+
+    update() is called from the UI thread after a typing pause. Jobs run on the app's
+    asyncio loop, one at a time, so speculation never competes with more than one
+    connection's worth of real synthesis. claim() is called when a segment is actually
+    spoken; it records whether speculation helped and hands over a job that is still
+    running so the segment is not synthesized twice.
+    """
+    # Recently completed keys remembered for hit accounting
+    _DONE_LIMIT = 256
+
+    def __init__(self, loop, synthesize, key_func, is_cached, budget_chars: int = 2000,
+                 window: float = 60.0, max_jobs: int = 1):
+        """
+        Args:
+            loop: The asyncio event loop that runs the synthesis coroutines
+            synthesize: Coroutine function (text, voice, rate) that renders into the cache
+            key_func (callable): (text, voice, rate) -> cache key
+            is_cached (callable): key -> whether the audio is already cached
+            budget_chars (int): Characters that may be synthesized speculatively per window
+            window (float): Length of the budget window in seconds
+            max_jobs (int): Speculative jobs rendered at once
+        """
+        self.loop = loop
+        self.synthesize = synthesize
+        self.key_func = key_func
+        self.is_cached = is_cached
+        self.budget_chars = budget_chars
+        self.window = window
+        self.max_jobs = max_jobs
+        self._lock = threading.Lock()
+        self._jobs = {}              # key -> concurrent.futures.Future of a queued/running job
+        self._done = OrderedDict()   # key -> completion time of speculative renders
+        self._spent = deque()        # (time, chars) of jobs started inside the window
+        self._semaphore = None       # Created on the loop by the first job
+        self.issued = 0
+        self.issued_chars = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.over_budget = 0
+        self.hits = 0
+        self.inflight_hits = 0
+        self.misses = 0
+
+    def update(self, text: str, voice: str, rate: str):
+        """
+        Speculate on the current text, cancelling jobs for text that is gone
+
+        Args:
+            text (str): Current contents of the input box
+            voice (str): Selected voice name
+            rate (str): Selected speaking rate
+        """
+        wanted = OrderedDict()  # key -> segment, in reading order
+        for segment in split_segments(text) if text.strip() else []:
+            wanted.setdefault(self.key_func(segment, voice, rate), segment)
+
+        with self._lock:
+            for key in [k for k in self._jobs if k not in wanted]:
+                if self._jobs.pop(key).cancel():
+                    self.cancelled += 1
+            # Finished sentences come first, the one being typed last
+            for key, segment in wanted.items():
+                if key in self._jobs or key in self._done or self.is_cached(key):
+                    continue
+                self._jobs[key] = asyncio.run_coroutine_threadsafe(
+                    self._job(key, segment, voice, rate), self.loop)
+
+    def cancel_all(self):
+        """Cancel every speculative job that has not been claimed"""
+        with self._lock:
+            for future in self._jobs.values():
+                if future.cancel():
+                    self.cancelled += 1
+            self._jobs = {}
+
+    def claim(self, text: str, voice: str, rate: str):
+        """
+        Record that a segment is being spoken and take over its speculative job
+
+        Args:
+            text (str): The segment text
+            voice (str): Voice name
+            rate (str): Speaking rate
+
+        Returns:
+            concurrent.futures.Future: The job if it is still running, else None
+        """
+        key = self.key_func(text, voice, rate)
+        with self._lock:
+            job = self._jobs.pop(key, None)
+            if job is not None and not job.done():
+                self.inflight_hits += 1
+                return job
+            if key in self._done:
+                del self._done[key]
+                self.hits += 1
+            elif not self.is_cached(key):
+                self.misses += 1
+            return None
+
+    def stats(self) -> dict:
+        """Job counters, budget use and how often speculation paid off"""
+        with self._lock:
+            spoken = self.hits + self.inflight_hits + self.misses
+            return {
+                "issued": self.issued,
+                "issued_chars": self.issued_chars,
+                "completed": self.completed,
+                "cancelled": self.cancelled,
+                "over_budget": self.over_budget,
+                "budget_used": self._budget_used_locked(),
+                "budget_chars": self.budget_chars,
+                "hits": self.hits,
+                "inflight_hits": self.inflight_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.inflight_hits) / spoken if spoken else 0.0,
+            }
+
+    def _budget_used_locked(self):
+        """Characters started inside the budget window (caller holds the lock)"""
+        cutoff = time.monotonic() - self.window
+        while self._spent and self._spent[0][0] < cutoff:
+            self._spent.popleft()
+        return sum(chars for _, chars in self._spent)
+
+    async def _job(self, key, segment, voice, rate):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_jobs)
+        async with self._semaphore:
+            with self._lock:
+                if self._budget_used_locked() + len(segment) > self.budget_chars:
+                    self.over_budget += 1
+                    self._jobs.pop(key, None)
+                    return None
+                self._spent.append((time.monotonic(), len(segment)))
+                self.issued += 1
+                self.issued_chars += len(segment)
+            try:
+                path = await self.synthesize(segment, voice, rate)
+            except Exception as e:
+                print(f"Speculative synthesis failed: {e}")
+                with self._lock:
+                    self._jobs.pop(key, None)
+                return None
+            with self._lock:
+                self.completed += 1
+                # Claimed jobs are no longer in _jobs and already counted as a hit
+                if self._jobs.pop(key, None) is not None:
+                    self._done[key] = time.monotonic()
+                    while len(self._done) > self._DONE_LIMIT:
+                        self._done.popitem(last=False)
+            return path
@@ -0,0 +1,484 @@
+"""
+Sentence-level synthesis pipeline for the Discord TTS App.
+
+Long messages are split at sentence (and, if needed, clause) boundaries. The segments are
+synthesized concurrently on the app's asyncio loop with a concurrency limit and handed to
+playback strictly in order, so the first sentence can play while the rest is rendered.
+Both English and Chinese punctuation is recognised.
+
+UtteranceScheduler queues whole messages with priorities, renders the next ones ahead of
+playback and plays them back to back in one output stream, so a burst of messages plays
+without dead air instead of being dropped.
+"""
+
+import re
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+import concurrent.futures
+
+from stage_timing import StageTrace
+
+# Sentence ends: Latin terminators need following whitespace (so "3.14" stays intact),
+# CJK terminators and line breaks always end a sentence
+_SENTENCE_END = re.compile(
+    r'(?<=[.!?…])["\'”’)\]]*\s+'
+    r'|(?<=[。！？；…])["\'”’」』）\]]*'
+    r'|\n+'
+)
+# Clause boundaries used to break up sentences that are too long
+_CLAUSE_END = re.compile(r'(?<=[,;:，、；：])\s*')
+# Abbreviations that end with a period but do not end a sentence
+_ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "st", "vs", "etc", "e.g", "i.e", "jr", "sr"}
+# Abbreviations that only continue the sentence when a number follows ("No. 5")
+_NUMBER_ABBREVIATIONS = {"no"}
+# A CJK sentence is complete however few characters it has ("他说。")
+_CJK_SENTENCE = re.compile(r'[。！？；…]["\'”’」』）\]]*\s*$')
+
+def _split_keep(pattern, text):
+    """Split text after each match of pattern, dropping empty pieces"""
+    pieces, start = [], 0
+    for m in pattern.finditer(text):
+        if m.end() == 0 or m.end() <= start:
+            continue
+        pieces.append(text[start:m.end()])
+        start = m.end()
+    pieces.append(text[start:])
+    return [p for p in pieces if p.strip()]
+
+def _hard_wrap(text, max_chars):
+    """Split text without usable punctuation at spaces, or at max_chars for CJK"""
+    pieces = []
+    while len(text) > max_chars:
+        cut = text.rfind(' ', 0, max_chars)
+        if cut <= 0:
+            cut = max_chars
+        pieces.append(text[:cut])
+        text = text[cut:]
+    pieces.append(text)
+    return [p for p in pieces if p.strip()]
+
+def split_segments(text: str, max_chars: int = 200, min_chars: int = 4) -> list:
+    """
+    Split text into segments that can be synthesized independently
+
+    Args:
+        text (str): The message to speak
+        max_chars (int): Longest allowed segment; longer sentences are split at clauses
+        min_chars (int): Shorter segments are merged into the following one, except
+                         complete CJK sentences
+
+    Returns:
+        list: Non-empty, stripped text segments in reading order
+    """
+    sentences = []
+    for piece in _split_keep(_SENTENCE_END, text):
+        # Re-join pieces that were split after an abbreviation such as "Mr."
+        if sentences:
+            last_word = sentences[-1].rstrip().rsplit(None, 1)[-1].rstrip('.').lower()
+            if sentences[-1].rstrip().endswith('.') and (
+                    last_word in _ABBREVIATIONS
+                    or (last_word in _NUMBER_ABBREVIATIONS and piece.lstrip()[:1].isdigit())):
+                sentences[-1] += piece
+                continue
+        sentences.append(piece)
+
+    segments = []
+    for sentence in sentences:
+        if len(sentence) <= max_chars:
+            segments.append(sentence)
+            continue
+        # Break long sentences at clauses, then pack clauses back up to max_chars
+        current = ''
+        for clause in _split_keep(_CLAUSE_END, sentence):
+            for part in _hard_wrap(clause, max_chars):
+                if current and len(current) + len(part) > max_chars:
+                    segments.append(current)
+                    current = ''
+                current += part
+        if current:
+            segments.append(current)
+
+    # Merge fragments that are too short to sound natural on their own
+    merged = []
+    carry = ''
+    for segment in segments:
+        segment = carry + segment
+        if len(segment.strip()) < min_chars and not _CJK_SENTENCE.search(segment):
+            carry = segment
+            continue
+        merged.append(segment)
+        carry = ''
+    if carry.strip():
+        if merged:
+            merged[-1] += carry
+        else:
+            merged.append(carry)
+    return [segment.strip() for segment in merged]
+
+class SegmentPipeline:
+    """
+    Render segments concurrently on an asyncio loop and return them in order
+
+    start() returns one concurrent.futures.Future per segment, so a playback thread can
+    simply wait on them one after another. Segments start rendering in order, limited to
+    max_concurrency at a time, which keeps the first segment at the front of the line.
+    """
+    def __init__(self, loop, max_concurrency: int = 3):
+        """
+        Args:
+            loop: The asyncio event loop that runs the synthesis coroutines
+            max_concurrency (int): Maximum number of segments rendered at once
+        """
+        self.loop = loop
+        self.max_concurrency = max_concurrency
+
+    def start(self, segments, synthesize) -> list:
+        """
+        Begin rendering all segments
+
+        Args:
+            segments (list): Text segments in playback order
+            synthesize: Coroutine function (index, segment) -> audio for that segment
+
+        Returns:
+            list: concurrent.futures.Future per segment, in the same order
+        """
+        futures = [concurrent.futures.Future() for _ in segments]
+        limit = self.max_concurrency
+
+        async def render_all():
+            semaphore = asyncio.Semaphore(limit)
+
+            async def render(index, segment):
+                async with semaphore:
+                    future = futures[index]
+                    # cancel() reaches the running synthesis through its task, which is
+                    # attached before the future counts as running
+                    future.task = asyncio.ensure_future(synthesize(index, segment))
+                    if not future.set_running_or_notify_cancel():
+                        future.task.cancel()  # Cancelled before it started
+                        return
+                    try:
+                        future.set_result(await future.task)
+                    except asyncio.CancelledError:
+                        future.set_exception(concurrent.futures.CancelledError())
+                    except Exception as e:
+                        future.set_exception(e)
+
+            await asyncio.gather(*(render(i, s) for i, s in enumerate(segments)))
+
+        asyncio.run_coroutine_threadsafe(render_all(), self.loop)
+        return futures
+
+    def cancel(self, futures):
+        """
+        Skip the segments that have not started and abort the ones being rendered
+
+        Aborting cancels the synthesis coroutine, which closes its Edge TTS connection
+        and stops decoding; a render other requests still wait for keeps running.
+        """
+        for future in futures:
+            if not future.cancel() and not future.done():
+                task = getattr(future, "task", None)
+                if task is not None:
+                    self.loop.call_soon_threadsafe(task.cancel)
+
+class Utterance:
+    """A message waiting to be spoken"""
+    _ids = itertools.count(1)
+
+    def __init__(self, text: str, voice: str, rate: str, segments=None, priority: int = 0,
+                 routes=None):
+        """
+        Args:
+            text (str): The full message
+            voice (str): Voice name
+            rate (str): Speaking rate (e.g. "+10%")
+            segments (list): Pieces to synthesize separately (default: the whole text)
+            priority (int): Higher priorities are spoken first
+            routes (tuple): Output route names to play to (default: all)
+        """
+        self.id = next(self._ids)
+        self.text = text
+        self.voice = voice
+        self.rate = rate
+        self.segments = segments or [text]
+        self.priority = priority
+        self.routes = tuple(routes) if routes is not None else None
+        self.created = time.time()
+        self.submitted = time.monotonic()
+        self.futures = None  # Segment futures once rendering has started
+        # Resolves with the seconds from creation to the first sample handed to the output;
+        # cancelled if the utterance is dropped, fails if synthesis fails
+        self.first_audio = concurrent.futures.Future()
+        # Resolves with the outcome ("played", "stopped", "dropped" or "failed") once the
+        # utterance is over
+        self.finished = concurrent.futures.Future()
+        # Per-stage timings, recorded by the scheduler when the utterance is done
+        self.trace = StageTrace(self.id, len(text), voice, started=self.submitted)
+
+class UtteranceScheduler:
+    """
+    Priority queue of utterances with look-ahead synthesis and gapless playback
+
+    A worker thread takes the highest-priority utterance, waits for its segments in
+    order and pushes them into the audio engine. The stream is kept open while more
+    utterances are queued, and the next few queued utterances are rendered while the
+    current one plays.
+
+    Policies for submit():
+        append:    wait behind everything already queued with the same priority
+        interrupt: stop the current utterance and speak this one next; the queue is kept
+        replace:   stop the current utterance and drop the queue
+    """
+    APPEND = "append"
+    INTERRUPT = "interrupt"
+    REPLACE = "replace"
+
+    def __init__(self, engine, pipeline, synthesize, lookahead: int = 2, timings=None,
+                 on_start=None, on_error=None, on_idle=None):
+        """
+        Args:
+            engine: AudioEngine used for playback
+            pipeline (SegmentPipeline): Renders the segments of an utterance
+            synthesize: Coroutine function (utterance, index, segment, on_pcm) returning
+                        the segment samples. on_pcm is only given for the first segment
+                        of the utterance about to play; if the coroutine streams its audio
+                        into it, it returns None.
+            lookahead (int): Queued utterances rendered ahead of playback
+            timings (TimingStore): Receives the trace of every finished utterance
+            on_start (callable): Called with the utterance when it starts playing
+            on_error (callable): Called with (utterance, exception) if synthesis fails
+            on_idle (callable): Called when everything queued has been played
+        """
+        self.engine = engine
+        self.pipeline = pipeline
+        self.synthesize = synthesize
+        self.lookahead = lookahead
+        self.on_start = on_start
+        self.on_error = on_error
+        self.on_idle = on_idle
+        self.timings = timings
+        self._cond = threading.Condition()
+        self._queue = []  # heap of (urgent, -priority, seq, utterance)
+        self._seq = itertools.count()
+        self._current = None
+        self._push = None
+        self._routes = None
+        self._epoch = 0
+        self._awaiting_end = set()  # Fully pushed utterances that are still playing
+        self._interrupted = concurrent.futures.Future()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    @property
+    def busy(self) -> bool:
+        """Whether an utterance is playing or waiting"""
+        return self._current is not None or bool(self._queue) or self.engine.is_active
+
+    @property
+    def current(self):
+        """The utterance being played, or None"""
+        return self._current
+
+    def pending(self) -> list:
+        """Queued utterances in the order they will be spoken"""
+        with self._cond:
+            return [entry[-1] for entry in sorted(self._queue)]
+
+    def submit(self, utterance: Utterance, policy: str = APPEND) -> Utterance:
+        """
+        Queue an utterance
+
+        Args:
+            utterance (Utterance): The message to speak
+            policy (str): APPEND, INTERRUPT or REPLACE
+
+        Returns:
+            Utterance: The queued utterance
+        """
+        if policy not in (self.APPEND, self.INTERRUPT, self.REPLACE):
+            raise ValueError(f"Unknown queue policy: {policy}")
+        with self._cond:
+            if policy == self.REPLACE:
+                self._clear_queue_locked()
+            if policy != self.APPEND:
+                self._interrupt_locked()
+            urgent = 0 if policy != self.APPEND else 1
+            heapq.heappush(self._queue, (urgent, -utterance.priority, next(self._seq), utterance))
+            self._cond.notify()
+        if self._current is not None:
+            self._prefetch()
+        return utterance
+
+    def stop(self):
+        """Stop playback and drop everything that is queued"""
+        with self._cond:
+            self._clear_queue_locked()
+            self._interrupt_locked()
+
+    def _clear_queue_locked(self):
+        for entry in self._queue:
+            if entry[-1].futures:
+                self.pipeline.cancel(entry[-1].futures)
+            entry[-1].first_audio.cancel()
+            self._finish_trace(entry[-1], "dropped")
+        self._queue = []
+
+    def _interrupt_locked(self):
+        """End the current utterance immediately (caller holds the lock)"""
+        self._epoch += 1
+        self._interrupted.set_result(None)
+        self._interrupted = concurrent.futures.Future()
+        if self._current is not None and self._current.futures:
+            self.pipeline.cancel(self._current.futures)
+        awaiting, self._awaiting_end = self._awaiting_end, set()
+        for utterance in awaiting:
+            self._finish_trace(utterance, "stopped")
+        self._push = None
+        self.engine.stop()
+
+    def _render(self, utterance, on_pcm=None):
+        """Start synthesizing all segments of an utterance"""
+        def synthesize(index, segment):
+            return self.synthesize(utterance, index, segment, on_pcm if index == 0 else None)
+        utterance.futures = self.pipeline.start(utterance.segments, synthesize)
+
+    def _prefetch(self):
+        """Render the next queued utterances while the current one plays"""
+        with self._cond:
+            upcoming = [entry[-1] for entry in sorted(self._queue)[:self.lookahead]]
+        for utterance in upcoming:
+            if utterance.futures is None:
+                self._render(utterance)
+
+    def _stream_for(self, epoch, routes):
+        """Push function for the next utterance, continuing the open stream if possible"""
+        with self._cond:
+            if epoch != self._epoch:
+                return None
+            push = self._push
+            same_routes = routes == self._routes
+        if push is not None and not same_routes:
+            # Let the previous utterance finish on its own routes before switching
+            push(None)
+            while self.engine.is_active and epoch == self._epoch:
+                time.sleep(0.01)
+            push = None
+        if push is not None:
+            push = self.engine.continue_stream(push, on_finished=self._engine_finished)
+        if push is None:
+            push = self.engine.begin_stream(routes, on_finished=self._engine_finished)
+        with self._cond:
+            if epoch != self._epoch:
+                return None
+            self._push = push
+            self._routes = routes
+        return push
+
+    def _engine_finished(self):
+        """The engine played everything it was given"""
+        with self._cond:
+            if self._queue or self._current is not None:
+                return  # More audio is on its way
+            self._push = None
+        if self.on_idle:
+            self.on_idle()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                utterance = heapq.heappop(self._queue)[-1]
+                self._current = utterance
+                epoch = self._epoch
+                interrupted = self._interrupted
+
+            push = self._stream_for(epoch, utterance.routes)
+            if push is not None:
+                utterance.trace.mark("device_open")
+                push = self._timed_push(utterance, push)
+                if utterance.futures is None:
+                    self._render(utterance, on_pcm=push)
+                self._prefetch()
+                if self.on_start:
+                    self.on_start(utterance)
+                self._play(utterance, push, epoch, interrupted)
+            else:
+                utterance.first_audio.cancel()  # Stopped before it could start
+                self._finish_trace(utterance, "stopped")
+
+            with self._cond:
+                self._current = None
+                if epoch == self._epoch and not self._queue and self._push is not None:
+                    # Nothing else to say: let the stream finish
+                    self._push(None)
+
+    def _finish_trace(self, utterance, outcome):
+        """Close the stage trace of an utterance and hand it to the timing store (once)"""
+        trace = utterance.trace
+        with self._cond:
+            if trace.outcome is not None:
+                return
+            trace.outcome = outcome
+            self._awaiting_end.discard(utterance)
+        if outcome == "played":
+            trace.mark("playback_end")
+        if self.timings is not None:
+            self.timings.record(trace)
+        utterance.finished.set_result(outcome)
+
+    @staticmethod
+    def _timed_push(utterance, push):
+        """Wrap push so the first real block records the utterance latency"""
+        def timed(block):
+            if (block is not None and not callable(block) and len(block)
+                    and not utterance.first_audio.done()):
+                utterance.first_audio.set_result(time.monotonic() - utterance.submitted)
+                # The engine calls this when the devices reach the first sample
+                push(lambda: utterance.trace.mark("first_sample"))
+            push(block)
+        timed.generation = push.generation
+        return timed
+
+    def _play(self, utterance, push, epoch, interrupted):
+        """Push the segments of an utterance in order as they become ready"""
+        outcome = "stopped"
+        try:
+            for future in utterance.futures:
+                concurrent.futures.wait([future, interrupted],
+                                        return_when=concurrent.futures.FIRST_COMPLETED)
+                if epoch != self._epoch:
+                    return
+                samples = future.result()
+                if samples is not None:
+                    push(samples)
+            outcome = "played"
+        except concurrent.futures.CancelledError:
+            pass
+        except Exception as e:
+            outcome = "failed"
+            if not utterance.first_audio.done():
+                utterance.first_audio.set_exception(e)
+            if epoch == self._epoch and self.on_error:
+                self.on_error(utterance, e)
+        finally:
+            utterance.first_audio.cancel()  # No-op if audio was played
+            if epoch != self._epoch:
+                self.pipeline.cancel(utterance.futures)
+            self._end_trace(utterance, push, epoch, outcome)
+
+    def _end_trace(self, utterance, push, epoch, outcome):
+        """Record the trace now, or once the devices have played the last sample"""
+        with self._cond:
+            playing = outcome == "played" and epoch == self._epoch
+            if playing:
+                self._awaiting_end.add(utterance)  # Recorded as stopped if interrupted
+        if playing:
+            push(lambda: self._finish_trace(utterance, "played"))
+        else:
+            self._finish_trace(utterance, outcome)
@@ -0,0 +1,163 @@
+"""
+Per-stage latency instrumentation for the Discord TTS App.
+
+Every utterance carries a StageTrace. The engine marks the moment each stage completes
+(key computation, cache lookup, first and last network byte, output ready, first sample
+played, playback end) as an offset from submission, and adds up the time spent waiting
+for a connection handshake, decoding, resampling and post-processing. Finished traces go
+to a TimingStore, which keeps the most recent ones in memory for rolling percentiles,
+appends them to a JSON-lines log and exports summaries in the Prometheus text format.
+"""
+
+import os
+import json
+import time
+import threading
+from collections import deque
+
+import numpy as np
+
+# Stages in pipeline order. Marks are offsets from submission; durations are time spent.
+MARKS = ("key", "cache_lookup", "net_first_byte", "net_last_byte", "device_open",
+         "first_sample", "playback_end")
+DURATIONS = ("handshake", "decode", "resample", "postprocess")
+STAGES = MARKS + DURATIONS
+
+class StageTrace:
+    """Stage timestamps of one utterance"""
+    def __init__(self, utterance_id: int = 0, chars: int = 0, voice: str = "", started: float = None):
+        """
+        Args:
+            utterance_id (int): Id of the traced utterance
+            chars (int): Length of its text
+            voice (str): Voice name
+            started (float): time.monotonic() of submission (default: now)
+        """
+        self.utterance_id = utterance_id
+        self.chars = chars
+        self.voice = voice
+        self.started = time.monotonic() if started is None else started
+        self.created = time.time()
+        self.marks = {}
+        self.durations = {}
+        self.cache_hit = None
+        self.backend = None  # Synthesis backend that produced the audio, if not cached
+        self.outcome = None  # "played", "stopped" or "failed" once finished
+
+    def mark(self, stage: str, at: float = None):
+        """Record that a stage was reached; only the first time counts"""
+        if stage not in self.marks:
+            self.marks[stage] = (time.monotonic() if at is None else at) - self.started
+
+    def add(self, stage: str, seconds: float):
+        """Add time spent in a stage (several segments may contribute)"""
+        self.durations[stage] = self.durations.get(stage, 0.0) + seconds
+
+    def to_dict(self) -> dict:
+        """JSON-friendly form with all times in milliseconds"""
+        return {
+            "id": self.utterance_id,
+            "time": round(self.created, 3),
+            "voice": self.voice,
+            "chars": self.chars,
+            "cache_hit": self.cache_hit,
+            "backend": self.backend,
+            "outcome": self.outcome,
+            "stages": {stage: round(value * 1000, 3)
+                       for stage, value in list(self.marks.items()) + list(self.durations.items())},
+        }
+
+class TimingStore:
+    """
+    Rolling in-memory store of finished traces with an optional JSON-lines log
+
+    record() may be called from any thread.
+    """
+    def __init__(self, maxlen: int = 500, log_path: str = None, max_log_bytes: int = 5 * 1024 * 1024):
+        """
+        Args:
+            maxlen (int): Traces kept for the rolling statistics
+            log_path (str): JSON-lines file every trace is appended to (None disables it)
+            max_log_bytes (int): Size at which the log is rotated to log_path + ".1"
+        """
+        self.log_path = log_path
+        self.max_log_bytes = max_log_bytes
+        self._traces = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        self._total = 0
+        self._outcomes = {}
+
+    def record(self, trace: StageTrace):
+        """Store a finished trace and append it to the log"""
+        entry = trace.to_dict()
+        with self._lock:
+            self._traces.append(entry)
+            self._total += 1
+            self._outcomes[trace.outcome] = self._outcomes.get(trace.outcome, 0) + 1
+            if self.log_path:
+                self._append_log(entry)
+
+    def recent(self) -> list:
+        """The stored traces, oldest first"""
+        with self._lock:
+            return list(self._traces)
+
+    def percentiles(self, quantiles=(50, 95, 99)) -> dict:
+        """
+        Rolling percentiles of every stage over the stored traces
+
+        Returns:
+            dict: stage -> {"count", "p50", "p95", ...} in milliseconds, in pipeline order
+        """
+        values = {stage: [] for stage in STAGES}
+        for entry in self.recent():
+            for stage, ms in entry["stages"].items():
+                values.setdefault(stage, []).append(ms)
+        result = {}
+        for stage, samples in values.items():
+            if not samples:
+                continue
+            points = np.percentile(samples, quantiles)
+            result[stage] = {"count": len(samples),
+                             **{f"p{q}": round(float(p), 2) for q, p in zip(quantiles, points)}}
+        return result
+
+    def export_text(self, prefix: str = "discord_tts") -> str:
+        """
+        Rolling statistics in the Prometheus text exposition format
+
+        Returns:
+            str: Summary metric per stage (in seconds) plus utterance counters
+        """
+        quantiles = (50, 95, 99)
+        lines = [f"# HELP {prefix}_stage_seconds Per-stage latency over the last "
+                 f"{self._traces.maxlen} utterances",
+                 f"# TYPE {prefix}_stage_seconds summary"]
+        for stage, stats in self.percentiles(quantiles).items():
+            for q in quantiles:
+                lines.append(f'{prefix}_stage_seconds{{stage="{stage}",quantile="{q / 100}"}} '
+                             f'{stats[f"p{q}"] / 1000:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        with self._lock:
+            total, outcomes = self._total, dict(self._outcomes)
+        lines.append(f"# HELP {prefix}_utterances_total Utterances traced since startup")
+        lines.append(f"# TYPE {prefix}_utterances_total counter")
+        for outcome, count in sorted(outcomes.items(), key=lambda item: str(item[0])):
+            lines.append(f'{prefix}_utterances_total{{outcome="{outcome}"}} {count}')
+        if not outcomes:
+            lines.append(f"{prefix}_utterances_total {total}")
+        return "\n".join(lines) + "\n"
+
+    def _append_log(self, entry):
+        """Append one JSON line, rotating the file when it gets too big (lock held)"""
+        try:
+            if os.path.getsize(self.log_path) > self.max_log_bytes:
+                os.replace(self.log_path, self.log_path + ".1")
+        except OSError:
+            pass  # No log yet
+        try:
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"Could not write timing log: {e}")
+            self.log_path = None
@@ -0,0 +1,105 @@
+"""Playback through the audio engine into loopback sinks, without sound hardware"""
+
+import time
+
+import numpy as np
+import pytest
+
+from audio_engine import AudioEngine
+from audio_sinks import LoopbackSink, RingBuffer
+
+SAMPLE_RATE = 24000
+BLOCK = 256
+
+def wait_until(condition, timeout=2.0):
+    """Poll until condition() is true; the engine feeds the rings from its own thread"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached in time")
+        time.sleep(0.001)
+
+@pytest.fixture
+def engine():
+    engine = AudioEngine(sample_rate=SAMPLE_RATE, blocksize=BLOCK, buffer_seconds=0.5)
+    yield engine
+    engine.close()
+
+@pytest.fixture
+def sink(engine):
+    sink = LoopbackSink(speed=0)
+    engine.set_routes({"loop": sink})
+    return sink
+
+def test_ring_buffer_wraps_around():
+    ring = RingBuffer(8)
+    out = np.empty(8, dtype=np.float32)
+    assert ring.write(np.arange(6, dtype=np.float32)) == 6
+    assert ring.read_into(out[:4]) == 4
+    np.testing.assert_array_equal(out[:4], [0, 1, 2, 3])
+
+    # Crosses the end of the storage; only the free space is taken
+    assert ring.write(np.arange(6, 13, dtype=np.float32)) == 6
+    assert ring.available() == 8 and ring.free() == 0
+    assert ring.read_into(out) == 8
+    np.testing.assert_array_equal(out, [4, 5, 6, 7, 8, 9, 10, 11])
+    assert ring.played() == ring.written() == 12
+
+def test_ring_buffer_pads_with_silence_and_flushes():
+    ring = RingBuffer(8)
+    out = np.ones(5, dtype=np.float32)
+    ring.write(np.full(3, 0.5, dtype=np.float32))
+    assert ring.read_into(out) == 3
+    np.testing.assert_array_equal(out, [0.5, 0.5, 0.5, 0, 0])
+
+    ring.write(np.ones(4, dtype=np.float32))
+    ring.request_flush()
+    assert ring.queued() == 0
+    assert ring.read_into(out) == 0
+    assert ring.played() == ring.written()
+
+def test_loopback_records_everything_in_order(engine, sink):
+    samples = np.random.default_rng(0).uniform(-1, 1, SAMPLE_RATE).astype(np.float32)
+    finished = []
+    engine.play(samples, on_finished=lambda: finished.append(True))
+    while not finished:
+        # The ring holds 0.5 s, so the engine can only finish if we keep playing
+        wait_until(lambda: sink.ring.available() > 0 or not engine.is_active)
+        sink.advance()
+        time.sleep(0.001)
+    np.testing.assert_array_equal(sink.recorded(), samples)
+    assert [b.frame for b in sink.blocks] == [i * BLOCK for i in range(len(sink.blocks))]
+    assert sink.underruns == 0
+
+def test_stop_silences_the_next_block(engine, sink):
+    engine.play(np.ones(SAMPLE_RATE, dtype=np.float32))
+    wait_until(lambda: sink.ring.available() >= 4 * BLOCK)
+    assert sink.advance(2) == 2 * BLOCK
+
+    engine.stop()
+    assert sink.advance() == 0
+    assert not engine.is_active
+    assert len(sink.recorded()) == 2 * BLOCK
+
+def test_underruns_are_counted_once_per_gap(engine, sink):
+    push = engine.begin_stream()
+    push(np.ones(BLOCK, dtype=np.float32))
+    wait_until(lambda: sink.ring.available() == BLOCK and sink.expect_audio)
+    assert sink.advance() == BLOCK
+    assert sink.underruns == 0
+
+    # More audio is expected but none has arrived
+    assert sink.advance(3) == 0
+    assert sink.underruns == 1
+
+    push(np.ones(2 * BLOCK, dtype=np.float32))
+    wait_until(lambda: sink.ring.available() == 2 * BLOCK)
+    assert sink.advance(2) == 2 * BLOCK
+    sink.advance()
+    assert sink.underruns == 2
+
+    # Silence after the end of the stream is not an underrun
+    push(None)
+    wait_until(lambda: not sink.expect_audio)
+    sink.advance(3)
+    assert sink.underruns == 2
@@ -0,0 +1,38 @@
+"""Streaming resampling"""
+
+import numpy as np
+import pytest
+
+from audio_utils import PolyphaseResampler, resample_poly
+
+@pytest.mark.parametrize("orig_sr, target_sr", [(24000, 48000), (22050, 48000), (48000, 24000)])
+def test_block_wise_output_matches_one_shot(orig_sr, target_sr):
+    rng = np.random.default_rng(1)
+    x = rng.uniform(-1, 1, orig_sr // 2).astype(np.float32)
+    expected = resample_poly(x, orig_sr, target_sr)
+
+    resampler = PolyphaseResampler(orig_sr, target_sr)
+    blocks, start = [], 0
+    while start < len(x):
+        size = int(rng.integers(1, 2000))
+        blocks.append(resampler.process(x[start:start + size]))
+        start += size
+    blocks.append(resampler.flush())
+    out = np.concatenate(blocks)
+
+    assert len(out) == len(expected) == -(-len(x) * target_sr // orig_sr)
+    np.testing.assert_allclose(out, expected, atol=1e-6)
+
+def test_flush_resets_for_the_next_signal():
+    x = np.sin(np.linspace(0, 100, 5000)).astype(np.float32)
+    resampler = PolyphaseResampler(24000, 48000)
+    first = np.concatenate((resampler.process(x), resampler.flush()))
+    second = np.concatenate((resampler.process(x), resampler.flush()))
+    np.testing.assert_array_equal(first, second)
+
+def test_sine_keeps_its_level():
+    t = np.arange(24000) / 24000
+    x = (0.5 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+    y = resample_poly(x, 24000, 48000)
+    # Ignore the filter's edges
+    assert np.sqrt(np.mean(y[1000:-1000] ** 2)) == pytest.approx(0.5 / np.sqrt(2), rel=0.01)
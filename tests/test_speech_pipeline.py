@@ -0,0 +1,120 @@
+"""Sentence splitting and the utterance scheduler"""
+
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from audio_engine import AudioEngine
+from audio_sinks import LoopbackSink
+from speech_pipeline import SegmentPipeline, Utterance, UtteranceScheduler, split_segments
+from test_audio_sinks import wait_until
+
+@pytest.mark.parametrize("text", ["", "   ", "\n\n"])
+def test_blank_text_has_no_segments(text):
+    assert split_segments(text) == []
+
+def test_splits_at_sentence_ends():
+    assert split_segments("Hello there. How are you? Fine!") == \
+        ["Hello there.", "How are you?", "Fine!"]
+
+def test_decimal_points_and_abbreviations_do_not_split():
+    assert split_segments("Pi is 3.14 today.") == ["Pi is 3.14 today."]
+    assert split_segments("Mr. Smith met Dr. Jones. They talked.") == \
+        ["Mr. Smith met Dr. Jones.", "They talked."]
+
+def test_no_only_continues_before_a_number():
+    assert split_segments("No. I will not.", min_chars=1) == ["No.", "I will not."]
+    assert split_segments("Take No. 5 please. Thanks.") == ["Take No. 5 please.", "Thanks."]
+
+def test_closing_quotes_stay_with_their_sentence():
+    assert split_segments('He said "Stop!" Then he left.') == ['He said "Stop!"', "Then he left."]
+
+def test_short_latin_fragments_are_merged():
+    assert split_segments("Hi. Welcome back.") == ["Hi. Welcome back."]
+
+def test_short_cjk_sentences_are_kept():
+    assert split_segments("他说。我们走吧！") == ["他说。", "我们走吧！"]
+
+def test_long_sentences_split_at_clauses():
+    clause = "这是一个很长的句子的一部分，"
+    segments = split_segments(clause * 30 + "结束。", max_chars=50)
+    assert len(segments) > 1
+    assert all(len(segment) <= 50 for segment in segments)
+    assert "".join(segments) == clause * 30 + "结束。"
+
+def test_text_without_punctuation_is_wrapped():
+    words = " ".join(["word"] * 100)
+    segments = split_segments(words, max_chars=60)
+    assert all(len(segment) <= 60 for segment in segments)
+    assert " ".join(segments).split() == words.split()
+
+class TestScheduler:
+    """Stopping and interrupting while a fully pushed utterance is still playing"""
+    BLOCK = 256
+
+    @pytest.fixture
+    def loop(self):
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        yield loop
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(1.0)
+
+    @pytest.fixture
+    def sink(self):
+        return LoopbackSink(speed=0)
+
+    @pytest.fixture
+    def scheduler(self, loop, sink):
+        engine = AudioEngine(sample_rate=24000, blocksize=self.BLOCK, buffer_seconds=0.5)
+        engine.set_routes({"loop": sink})
+
+        async def synthesize(utterance, index, segment, on_pcm):
+            if segment == "slow":
+                await asyncio.sleep(30)
+            level = float(segment.split()[-1])
+            return np.full(2 * self.BLOCK, level, dtype=np.float32)
+
+        yield UtteranceScheduler(engine, SegmentPipeline(loop), synthesize)
+        engine.close()
+
+    def _play_until_pushed(self, scheduler, sink, text="level 1.0"):
+        """Submit an utterance and wait until all of it is in the sink's ring"""
+        utterance = scheduler.submit(Utterance(text, "voice", "+0%"))
+        wait_until(lambda: scheduler.current is None and sink.ring.available() == 2 * self.BLOCK)
+        assert sink.advance() == self.BLOCK  # Still playing
+        assert utterance.trace.outcome is None
+        return utterance
+
+    def test_stop(self, scheduler, sink):
+        utterance = self._play_until_pushed(scheduler, sink)
+        scheduler.stop()
+        assert sink.advance() == 0
+        assert utterance.finished.result(1.0) == "stopped"
+        assert not scheduler.busy
+
+    def test_interrupt(self, scheduler, sink):
+        first = self._play_until_pushed(scheduler, sink)
+        second = scheduler.submit(Utterance("level 0.5", "voice", "+0%"), UtteranceScheduler.INTERRUPT)
+        assert first.finished.result(1.0) == "stopped"
+        assert sink.advance() in (0, self.BLOCK)
+        wait_until(lambda: sink.ring.available() == 2 * self.BLOCK)
+        sink.clear()
+        assert sink.advance(2) == 2 * self.BLOCK
+        assert np.all(sink.recorded() == 0.5)
+        sink.advance()
+        assert second.finished.result(1.0) == "played"
+
+    def test_replace(self, scheduler, sink):
+        first = self._play_until_pushed(scheduler, sink)
+        waiting = scheduler.submit(Utterance("slow", "voice", "+0%"))
+        queued = scheduler.submit(Utterance("slow", "voice", "+0%"))
+        wait_until(lambda: scheduler.current is waiting)
+        scheduler.submit(Utterance("slow", "voice", "+0%"), UtteranceScheduler.REPLACE)
+        assert sink.advance() == 0
+        assert first.finished.result(1.0) == "stopped"
+        assert waiting.finished.result(1.0) == "stopped"
+        assert queued.finished.result(1.0) == "dropped"
@@ -0,0 +1,397 @@
+"""
+Speech synthesis backends for the Discord TTS App.
+
+Every backend turns (text, voice, rate) into a stream of MP3 chunks, so the decoder and the
+cache do not care where the audio came from. A backend may also report time spent in
+stages such as the connection handshake, which ends up in the stage timings. Edge TTS is the primary backend; gTTS (if
+installed) serves as a fallback for the voice's language when Edge fails or is too slow.
+
+BackendRegistry decides which backend to ask and guards every request:
+    - a deadline for the first audio, so a stalled service fails instead of hanging
+    - retries with exponential backoff
+    - an optional hedge: when the first request has not produced audio by the p95 of that
+      backend's recent first-byte latency, a second request is started (a retry or the
+      next backend) and whichever answers first is used
+    - per-backend latency and failure statistics, which decide the order of the backends
+"""
+
+import sys
+import time
+import random
+import asyncio
+from collections import deque
+
+import numpy as np
+import edge_tts
+
+from edge_connection import EdgeConnectionPool
+
+try:
+    from gtts import gTTS
+    from gtts.lang import tts_langs
+except ImportError:
+    gTTS = None
+
+def _rate_percent(rate: str) -> int:
+    """Edge-style rate string ("+10%") as an integer percentage"""
+    try:
+        return int(str(rate).strip().rstrip('%'))
+    except ValueError:
+        return 0
+
+class EdgeBackend:
+    """Microsoft Edge online TTS (edge_tts); voices are Edge short names"""
+    name = "edge"
+
+    def __init__(self):
+        # Warm connections shared by every request
+        self.connections = EdgeConnectionPool()
+        self.reuse_connections = True
+
+    def supports(self, voice: str) -> bool:
+        return bool(voice)
+
+    def cache_voice(self, voice: str) -> str:
+        """Voice string used in the cache key of audio from this backend"""
+        return voice
+
+    async def stream(self, text: str, voice: str, rate: str, timings: dict = None):
+        """Yield the MP3 chunks of text as they arrive; timings receives the handshake wait"""
+        # Force subprocess creation flags if on Windows
+        if sys.platform == 'win32':
+            # Set process creation flags to suppress console window
+            import subprocess
+            import edge_tts.constants as constants
+            if hasattr(constants, 'Process'):
+                # Ensure subprocess creationflags are set on Windows
+                orig_flags = constants.Process.CREATION_FLAGS
+                constants.Process.CREATION_FLAGS = subprocess.CREATE_NO_WINDOW | subprocess.DETACHED_PROCESS
+
+        try:
+            if self.reuse_connections and self.connections.supported:
+                async for chunk in self.connections.stream(text, voice, rate, timings):
+                    yield chunk
+            else:
+                comm = edge_tts.Communicate(text, voice, rate=rate)
+                async for chunk in comm.stream():
+                    if chunk["type"] == "audio":
+                        yield chunk["data"]
+        finally:
+            # Restore original flags
+            if sys.platform == 'win32' and hasattr(constants, 'Process'):
+                constants.Process.CREATION_FLAGS = orig_flags
+
+class GttsBackend:
+    """Google Translate TTS (gTTS); one voice per language, picked from the Edge voice's locale"""
+    name = "gtts"
+
+    # Regional accents are selected through the Google domain
+    _TLDS = {"en-GB": "co.uk", "en-AU": "com.au", "en-IN": "co.in", "en-CA": "ca",
+             "fr-CA": "ca", "pt-BR": "com.br", "pt-PT": "pt", "es-MX": "com.mx", "es-ES": "es"}
+
+    def __init__(self):
+        self._langs = None
+
+    @property
+    def available(self) -> bool:
+        return gTTS is not None
+
+    def _language(self, voice: str):
+        """(lang, tld) for an Edge voice name such as "zh-TW-HsiaoChenNeural", or None"""
+        if gTTS is None or not voice:
+            return None
+        if self._langs is None:
+            self._langs = tts_langs()
+        locale = "-".join(voice.split("-")[:2])
+        tld = self._TLDS.get(locale, "com")
+        if locale in self._langs:
+            return locale, tld
+        lang = locale.split("-")[0]
+        return (lang, tld) if lang in self._langs else None
+
+    def supports(self, voice: str) -> bool:
+        return self._language(voice) is not None
+
+    def cache_voice(self, voice: str) -> str:
+        lang, tld = self._language(voice)
+        return f"gtts:{lang}:{tld}"
+
+    async def stream(self, text: str, voice: str, rate: str, timings: dict = None):
+        lang, tld = self._language(voice)
+        # gTTS only knows normal and slow speed
+        chunks = iter(gTTS(text, lang=lang, tld=tld, slow=_rate_percent(rate) <= -30).stream())
+        loop = asyncio.get_running_loop()
+        while True:
+            # gTTS uses blocking HTTP requests; wait for them on the default thread pool
+            chunk = await loop.run_in_executor(None, next, chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+
+class BackendStats:
+    """Recent latencies and outcomes of one backend"""
+    def __init__(self, maxlen: int = 200):
+        self.first_byte = deque(maxlen=maxlen)
+        self.total = deque(maxlen=maxlen)
+        self.outcomes = deque(maxlen=10)  # True for success, most recent last
+        self.last_failure = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def percentile(self, q: float, samples=None):
+        """Percentile of the first-byte latency in seconds (None without data)"""
+        samples = self.first_byte if samples is None else samples
+        return float(np.percentile(samples, q)) if samples else None
+
+    def failed(self, timeout: bool = False):
+        self.failures += 1
+        self.timeouts += timeout
+        self.outcomes.append(False)
+        self.last_failure = time.monotonic()
+
+    def healthy(self) -> bool:
+        """False after several recent failures, until a request succeeds or a minute passes"""
+        recent = list(self.outcomes)[-5:]
+        return (recent.count(False) < 3 or time.monotonic() - self.last_failure > 60)
+
+    def to_dict(self) -> dict:
+        def ms(value):
+            return None if value is None else round(value * 1000, 1)
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "healthy": self.healthy(),
+            "first_byte_p50_ms": ms(self.percentile(50)),
+            "first_byte_p95_ms": ms(self.percentile(95)),
+            "total_p50_ms": ms(self.percentile(50, self.total)),
+        }
+
+class SynthesisStream:
+    """
+    MP3 chunks of one request from the backend that answered first
+
+    Iterating yields every chunk, starting with the one that decided the race. A stall
+    longer than stall_timeout between chunks raises TimeoutError.
+    """
+    def __init__(self, registry, backend, chunks, first: bytes, started: float, hedge: bool):
+        self.registry = registry
+        self.backend = backend
+        self.hedge = hedge
+        self._chunks = chunks
+        self._first = first
+        self._started = started
+
+    async def __aiter__(self):
+        stats = self.registry.stats_for(self.backend)
+        try:
+            yield self._first
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(self._chunks.__anext__(), self.registry.stall_timeout)
+                except StopAsyncIteration:
+                    break
+                yield chunk
+        except asyncio.TimeoutError:
+            stats.failed(timeout=True)
+            raise TimeoutError(f"{self.backend.name} stopped sending audio")
+        except Exception:
+            stats.failed()
+            raise
+        finally:
+            await self._chunks.aclose()
+        stats.total.append(time.monotonic() - self._started)
+        stats.outcomes.append(True)
+
+    async def read(self, trace=None) -> bytes:
+        """Collect the complete MP3 data, marking the last network byte on trace"""
+        data = b''.join([chunk async for chunk in self])
+        if trace is not None:
+            trace.mark("net_last_byte")
+        return data
+
+    async def aclose(self):
+        await self._chunks.aclose()
+
+class BackendRegistry:
+    """
+    Ordered set of backends with deadlines, retries, hedging and latency statistics
+
+    The first registered backend that supports a voice is its native backend. Audio from
+    other backends sounds different, so they are only used as a fallback (if enabled) and
+    their audio is cached under their own cache voice.
+    """
+    def __init__(self, backends=(), deadline: float = 20.0, attempt_timeout: float = 8.0,
+                 stall_timeout: float = 10.0, retries: int = 1, backoff: float = 0.5,
+                 hedge: bool = True, hedge_after: float = 2.0, min_hedge_after: float = 0.5,
+                 fallback: bool = True):
+        """
+        Args:
+            backends (iterable): Backends in order of preference
+            deadline (float): Seconds until the first audio before a request fails
+            attempt_timeout (float): Seconds a single attempt may take to its first audio
+            stall_timeout (float): Longest gap between two chunks of a started stream
+            retries (int): Extra attempts on the native backend after a failure
+            backoff (float): Delay before the first retry; doubles with every further one
+            hedge (bool): Start a second attempt when the first is slower than usual
+            hedge_after (float): Hedge delay until a backend has enough latency samples
+            min_hedge_after (float): Shortest hedge delay
+            fallback (bool): Use other backends when the native one fails
+        """
+        self.backends = list(backends)
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.stall_timeout = stall_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge = hedge
+        self.hedge_after = hedge_after
+        self.min_hedge_after = min_hedge_after
+        self.fallback = fallback
+        self._stats = {backend.name: BackendStats() for backend in self.backends}
+
+    def register(self, backend):
+        """Add a backend after the existing ones"""
+        self.backends.append(backend)
+        self._stats.setdefault(backend.name, BackendStats())
+
+    def stats_for(self, backend) -> BackendStats:
+        return self._stats.setdefault(backend.name, BackendStats())
+
+    def stats(self) -> dict:
+        """Per-backend request counts, failures, hedges and latency percentiles"""
+        return {name: stats.to_dict() for name, stats in self._stats.items()}
+
+    def plan(self, voice: str) -> list:
+        """
+        Backends to try for a voice, in order
+
+        The native backend comes first with its retries, unless it has been failing
+        while a fallback is healthy. Fallbacks are ordered by recent first-byte latency.
+        """
+        usable = [b for b in self.backends if getattr(b, "available", True) and b.supports(voice)]
+        if not usable:
+            return []
+        native, others = usable[0], usable[1:] if self.fallback else []
+        others = sorted(others, key=lambda b: (not self.stats_for(b).healthy(),
+                                               self.stats_for(b).percentile(50) or float("inf")))
+        plan = [native] * (1 + self.retries) + others
+        if not self.stats_for(native).healthy() and others and self.stats_for(others[0]).healthy():
+            plan = others[:1] + plan
+        return plan
+
+    def hedge_delay(self, backend) -> float:
+        """How long to wait for the first audio of backend before hedging"""
+        stats = self.stats_for(backend)
+        if len(stats.first_byte) < 20:
+            return self.hedge_after
+        return max(self.min_hedge_after, stats.percentile(95))
+
+    async def open(self, text: str, voice: str, rate: str, trace=None) -> SynthesisStream:
+        """
+        Start synthesizing text and wait for its first audio
+
+        Args:
+            text (str): The text to convert to speech
+            voice (str): Voice name (an Edge voice; fallbacks derive their voice from it)
+            rate (str): Speaking rate (e.g. "+10%")
+            trace (StageTrace): Receives the first network byte, the backend used and the
+                stage times the backend reported (e.g. the connection handshake)
+
+        Returns:
+            SynthesisStream: Chunks of the backend that answered first
+
+        Raises:
+            TimeoutError: If no backend produced audio before the deadline
+            RuntimeError: If every attempt failed
+        """
+        plan = self.plan(voice)
+        if not plan:
+            raise RuntimeError(f"No speech backend supports the voice {voice}")
+        started = time.monotonic()
+        deadline = started + self.deadline
+        attempts = {}   # task -> (backend, started as hedge)
+        errors = []
+        launched = 0
+        hedged = False
+
+        def launch(delay=0.0, hedge=False):
+            nonlocal launched
+            backend = plan[launched]
+            launched += 1
+            self.stats_for(backend).requests += 1
+            task = asyncio.ensure_future(self._attempt(backend, text, voice, rate, delay))
+            attempts[task] = (backend, hedge)
+
+        launch()
+        try:
+            while attempts:
+                now = time.monotonic()
+                if now >= deadline:
+                    for backend, _ in attempts.values():
+                        self.stats_for(backend).failed(timeout=True)
+                    raise TimeoutError(f"No audio within {self.deadline:g} s")
+                timeout = deadline - now
+                hedge_at = None
+                if self.hedge and not hedged and launched < len(plan):
+                    hedge_at = started + self.hedge_delay(plan[0])
+                    timeout = min(timeout, max(0.0, hedge_at - now))
+                done, _ = await asyncio.wait(attempts, timeout=timeout,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    backend, hedge = attempts.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        chunks, first, first_byte, timings = task.result()
+                        stats = self.stats_for(backend)
+                        stats.first_byte.append(first_byte)
+                        stats.hedge_wins += hedge
+                        if trace is not None:
+                            trace.mark("net_first_byte")
+                            trace.backend = backend.name
+                            for stage, seconds in timings.items():
+                                trace.add(stage, seconds)
+                        return SynthesisStream(self, backend, chunks, first, started, hedge)
+                    self.stats_for(backend).failed(timeout=isinstance(error, asyncio.TimeoutError))
+                    errors.append(f"{backend.name}: {str(error) or type(error).__name__}")
+                    if not attempts and launched < len(plan):
+                        # Back off before retrying the same backend
+                        retry = plan[launched] is backend
+                        launch(self.backoff * (2 ** (len(errors) - 1)) * random.uniform(0.8, 1.2) if retry else 0.0)
+                if not done and hedge_at is not None and time.monotonic() >= hedge_at:
+                    hedged = True
+                    self.stats_for(plan[0]).hedges += 1
+                    launch(hedge=True)
+            raise RuntimeError("; ".join(errors))
+        finally:
+            # Stop the attempts that lost the race
+            for task in attempts:
+                task.cancel()
+                task.add_done_callback(self._close_loser)
+
+    async def _attempt(self, backend, text, voice, rate, delay):
+        """Open a stream on one backend and wait for its first chunk"""
+        if delay:
+            await asyncio.sleep(delay)
+        started = time.monotonic()
+        timings = {}
+        chunks = backend.stream(text, voice, rate, timings).__aiter__()
+        try:
+            first = await asyncio.wait_for(chunks.__anext__(), self.attempt_timeout)
+        except StopAsyncIteration:
+            raise RuntimeError("no audio received")
+        except BaseException:
+            await chunks.aclose()
+            raise
+        return chunks, first, time.monotonic() - started, timings
+
+    @staticmethod
+    def _close_loser(task):
+        """Close the stream of an attempt that produced audio after the race was decided"""
+        if not task.cancelled() and task.exception() is None:
+            asyncio.ensure_future(task.result()[0].aclose())
@@ -0,0 +1,676 @@
+"""
+Headless text-to-speech engine for the Discord TTS App.
+
+Everything between "text in" and "audio out" lives here: Edge TTS synthesis, the disk and
+memory caches, sentence segmentation, the utterance queue and device routing. Nothing in
+this module touches Tk, so the engine can be driven, profiled and load-tested on a
+headless machine; the GUI is a thin client that passes in the voice, rate and devices
+the user picked.
+"""
+
+import os
+import io
+import time
+import asyncio
+import hashlib
+import tempfile
+import threading
+
+import numpy as np
+import soundfile as sf
+import edge_tts
+
+from audio_utils import TARGET_SAMPLE_RATE, MP3_SUPPORTED, decode_mp3, resample_poly, Mp3StreamDecoder
+from audio_postprocess import PostProcessor
+from audio_cache import AudioCache, PcmCache, default_cache_dir
+from audio_engine import AudioEngine
+from speech_pipeline import split_segments, SegmentPipeline, Utterance, UtteranceScheduler
+from speculation import SpeculativeSynthesizer
+from cache_warmer import CacheWarmer
+from stage_timing import TimingStore
+from single_flight import SingleFlight
+from bounded_executor import BoundedExecutor
+from tts_backends import BackendRegistry, EdgeBackend, GttsBackend
+
+# Persistent cache directory for rendered audio (survives restarts)
+CACHE_DIR = default_cache_dir()
+
+# JSON-lines log of per-stage timings, next to the cache
+TIMING_LOG = os.path.join(os.path.dirname(CACHE_DIR), "timings.jsonl")
+
+# Old per-session temp folder; emptied in the background by AudioCache.cleanup
+LEGACY_CACHE_DIR = os.path.join(tempfile.gettempdir(), "discord_tts_temp")
+
+# ─── EDGE-TTS ASYNC FUNCTIONS ────────────────────────────────
+async def _get_voices() -> list:
+    """
+    Retrieve all available voices from Edge TTS API and group them by language
+    
+    Returns:
+        dict: A dictionary of voice groups organized by locale
+    """
+    voices = await edge_tts.list_voices()
+    # Group voices by language
+    voice_groups = {}
+    for v in voices:
+        locale = v.get('Locale', '')
+        if locale not in voice_groups:
+            voice_groups[locale] = []
+        voice_groups[locale].append({
+            'name': v['ShortName'],
+            'gender': v.get('Gender', 'Unknown'),
+            'display': f"{v['ShortName']} ({v.get('Gender', 'Unknown')})"
+        })
+    return voice_groups
+
+# Cache for TTS generation - avoid regenerating the same text/voice
+# Keyed by get_tts_key(text, voice, rate); the index is only read on first use
+AUDIO_CACHE = AudioCache(CACHE_DIR)
+
+# Decoded samples of recently played audio, so replays skip disk reads and WAV parsing
+PCM_CACHE = PcmCache()
+
+# Speech backends: Edge TTS first, gTTS as a fallback, with deadlines, retries and hedging
+EDGE = EdgeBackend()
+BACKENDS = BackendRegistry([EDGE, GttsBackend()])
+
+# Renders in progress, keyed by TTS key; concurrent requests for the same audio share one
+IN_FLIGHT = SingleFlight()
+
+# New audio is leveled and its silent padding trimmed once, before it is cached
+POSTPROCESS = PostProcessor()
+
+# Decoding, resampling and cache file I/O run here so the asyncio loop only handles the
+# network; callers wait for a slot when the pool is saturated
+BLOCKING = BoundedExecutor(max_workers=2, max_pending=8)
+
+def get_tts_key(text, voice, rate):
+    """
+    Generate a unique key for the TTS combination to use in caching
+    
+    Args:
+        text (str): The text to convert to speech
+        voice (str): The voice name to use
+        rate (str): The speaking rate
+        
+    Returns:
+        str: A hash that uniquely identifies this TTS request
+    """
+    return hashlib.md5(f"{text}|{voice}|{rate}".encode('utf-8')).hexdigest()
+
+def load_audio(path: str):
+    """
+    Load a cached WAV file, using the in-memory PCM cache when possible
+    
+    Args:
+        path (str): Path returned by the audio cache (the file name is the TTS key)
+        
+    Returns:
+        tuple: (samples, sample_rate); mono, 48kHz, shared and read-only
+    """
+    key = os.path.splitext(os.path.basename(path))[0]
+    cached = PCM_CACHE.get(key)
+    if cached is not None:
+        return cached
+    data, fs = sf.read(path, dtype='float32')
+    # The output engine plays mono audio at the Discord sample rate
+    if data.ndim > 1:
+        data = data.mean(axis=1, dtype=np.float32)
+    if fs != TARGET_SAMPLE_RATE:
+        data, fs = resample_poly(data, fs, TARGET_SAMPLE_RATE), TARGET_SAMPLE_RATE
+    PCM_CACHE.put(key, data, fs)
+    return data, fs
+
+async def _load_audio_async(path: str):
+    """load_audio() that reads the file on the worker pool unless the samples are in memory"""
+    cached = PCM_CACHE.get(os.path.splitext(os.path.basename(path))[0])
+    if cached is not None:
+        return cached
+    return await BLOCKING.run(load_audio, path)
+
+def _mark(trace, stage):
+    """Record a stage on an optional trace"""
+    if trace is not None:
+        trace.mark(stage)
+
+def _mark_lookup(trace, hit):
+    """Record the cache lookup on an optional trace; the first segment decides hit or miss"""
+    if trace is not None:
+        trace.mark("cache_lookup")
+        if trace.cache_hit is None:
+            trace.cache_hit = hit
+
+def _storage_key(stream, text: str, voice: str, rate: str, cache_key: str) -> str:
+    """Cache key for audio from stream; fallback backends sound different and get their own"""
+    cache_voice = stream.backend.cache_voice(voice)
+    return cache_key if cache_voice == voice else get_tts_key(text, cache_voice, rate)
+
+async def _tts_edge(text: str, voice: str, rate: str = "+0%", trace=None) -> str:
+    """
+    Generate speech from text using Edge TTS API
+    
+    Args:
+        text (str): The text to convert to speech
+        voice (str): The voice name to use
+        rate (str): The speaking rate adjustment (e.g., "+10%", "-5%")
+        trace (StageTrace): Receives the stage timings of this request (optional)
+        
+    Returns:
+        str: Path to the generated WAV file
+        
+    Raises:
+        RuntimeError: If speech generation fails
+    """
+    # Check if we already generated this exact audio
+    cache_key = get_tts_key(text, voice, rate)
+    _mark(trace, "key")
+    
+    cached_path = AUDIO_CACHE.get(cache_key)
+    _mark_lookup(trace, cached_path is not None)
+    if cached_path:
+        return cached_path
+    
+    # Join a render of the same audio that is already running
+    return await IN_FLIGHT.run(cache_key, lambda publish: _render_edge(text, voice, rate, cache_key, trace))
+
+def _decode_with_ffmpeg(mp3_bytes: bytes) -> np.ndarray:
+    """Decode MP3 data into 48kHz mono float32 samples with pydub/ffmpeg (blocking)"""
+    from pydub import AudioSegment
+    audio = AudioSegment.from_file(io.BytesIO(mp3_bytes), format='mp3')
+    audio = audio.set_frame_rate(TARGET_SAMPLE_RATE).set_channels(1)
+    scale = float(1 << (8 * audio.sample_width - 1))
+    return np.asarray(audio.get_array_of_samples(), dtype=np.float32) / scale
+
+def _decode_for_cache(mp3_bytes: bytes, voice: str, timings: dict) -> np.ndarray:
+    """Decode MP3 data and post-process it for the cache (blocking)"""
+    if MP3_SUPPORTED:
+        # Decode and resample in process, no ffmpeg or temporary MP3 file
+        pcm = decode_mp3(mp3_bytes, TARGET_SAMPLE_RATE, timings=timings)
+    else:
+        # Older libsndfile builds cannot read MP3, fall back to ffmpeg
+        started = time.perf_counter()
+        pcm = _decode_with_ffmpeg(mp3_bytes)
+        timings["decode"] = timings.get("decode", 0.0) + time.perf_counter() - started
+    return POSTPROCESS.process(pcm, TARGET_SAMPLE_RATE, voice=voice, timings=timings)
+
+async def _render_edge(text: str, voice: str, rate: str, cache_key: str, trace=None) -> str:
+    """
+    Synthesize and decode text into the cache (the shared work of _tts_edge)
+
+    Cancelling it closes the Edge TTS connection and skips the decode. Files are only
+    written by single worker jobs that clean up after themselves, so cancellation never
+    leaves a partial file in the cache folder.
+    """
+    try:
+        # Generate the audio, keeping the MP3 data in memory
+        stream = await BACKENDS.open(text, voice, rate, trace=trace)
+        mp3_bytes = await stream.read(trace=trace)
+        cache_key = _storage_key(stream, text, voice, rate, cache_key)
+            
+        # Convert to 48kHz (required for Discord), trim and level it, off the event loop
+        timings = {}
+        pcm = await BLOCKING.run(_decode_for_cache, mp3_bytes, stream.backend.cache_voice(voice), timings)
+        if trace is not None:
+            for stage, seconds in timings.items():
+                trace.add(stage, seconds)
+        # The first playback can use the decoded samples directly
+        PCM_CACHE.put(cache_key, pcm, TARGET_SAMPLE_RATE)
+        # Add to cache (atomic rename, evicts old entries above the budget)
+        return await BLOCKING.run(AUDIO_CACHE.put_pcm, cache_key, pcm, TARGET_SAMPLE_RATE)
+    except Exception as e:
+        raise RuntimeError(f'Speech synthesis failed: {e}')
+
+async def _tts_edge_stream(text: str, voice: str, rate: str = "+0%", on_pcm=None, trace=None) -> str:
+    """
+    Generate speech with Edge TTS and decode it while it is still being received
+    
+    Each decoded block is passed to on_pcm as soon as it is available, so playback can
+    start before synthesis finishes. The complete audio is written to the cache afterwards
+    so replays of the same text do not need the network again.
+    
+    Args:
+        text (str): The text to convert to speech
+        voice (str): The voice name to use
+        rate (str): The speaking rate adjustment (e.g., "+10%", "-5%")
+        on_pcm (callable): Called with each 48kHz mono float32 block as it is decoded
+        trace (StageTrace): Receives the stage timings of this request (optional)
+        
+    Returns:
+        str: Path to the cached WAV file
+        
+    Raises:
+        RuntimeError: If speech generation fails
+    """
+    cache_key = get_tts_key(text, voice, rate)
+    _mark(trace, "key")
+    
+    # Replays come from the cache in one block
+    cached_path = AUDIO_CACHE.get(cache_key)
+    _mark_lookup(trace, cached_path is not None)
+    if cached_path:
+        if on_pcm:
+            on_pcm((await _load_audio_async(cached_path))[0])
+        return cached_path
+    
+    # Join a render of the same audio that is already running; blocks it has decoded
+    # so far are replayed first
+    received = []
+    def _receive(block):
+        received.append(len(block))
+        if on_pcm:
+            on_pcm(block)
+    path = await IN_FLIGHT.run(
+        cache_key, lambda publish: _render_edge_stream(text, voice, rate, cache_key, publish, trace),
+        on_block=_receive)
+    if on_pcm and not received:
+        # The shared render was not streamed (e.g. a preview): play the finished file
+        on_pcm((await _load_audio_async(path))[0])
+    return path
+
+async def _render_edge_stream(text: str, voice: str, rate: str, cache_key: str, publish, trace=None) -> str:
+    """
+    Synthesize text, publishing each decoded block, and store it in the cache
+
+    Published blocks only lose their leading silence (and get the voice's last gain); the
+    complete audio is post-processed once for the cache.
+    """
+    blocks = []
+    def _collect(block):
+        if len(block):
+            blocks.append(block)
+            block = gate.process(block)
+            if len(block):
+                publish(block)
+    
+    try:
+        decoder = Mp3StreamDecoder(TARGET_SAMPLE_RATE)
+        stream = await BACKENDS.open(text, voice, rate, trace=trace)
+        cache_voice = stream.backend.cache_voice(voice)
+        gate = POSTPROCESS.stream_gate(cache_voice)
+        async for chunk in stream:
+            _collect(await BLOCKING.run(decoder.feed, chunk))
+        _mark(trace, "net_last_byte")
+        _collect(await BLOCKING.run(decoder.flush))
+        if trace is not None:
+            trace.add("decode", decoder.decode_time)
+            trace.add("resample", decoder.resample_time)
+        
+        # Keep the complete audio for replays, trimmed and leveled
+        cache_key = _storage_key(stream, text, voice, rate, cache_key)
+        timings = {}
+        def _store():
+            pcm = np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.float32)
+            pcm = POSTPROCESS.process(pcm, TARGET_SAMPLE_RATE, voice=cache_voice, timings=timings)
+            PCM_CACHE.put(cache_key, pcm, TARGET_SAMPLE_RATE)
+            return AUDIO_CACHE.put_pcm(cache_key, pcm, TARGET_SAMPLE_RATE)
+        path = await BLOCKING.run(_store)
+        if trace is not None:
+            for stage, seconds in timings.items():
+                trace.add(stage, seconds)
+        return path
+    except Exception as e:
+        raise RuntimeError(f'Speech synthesis failed: {e}')
+
+class TtsEngine:
+    """
+    GUI-free speech engine with an async API
+
+    The engine runs its own asyncio loop in a background thread unless one is given.
+    Coroutine methods must run on that loop; from other threads use run(), e.g.
+    engine.run(engine.speak("Hello", "en-US-AriaNeural")).
+
+    Callbacks are invoked from engine threads, never from the caller's thread.
+    """
+    # Priority of clips played with play(); ahead of everything queued with speak()
+    PREVIEW_PRIORITY = 100
+
+    def __init__(self, output=None, loop=None, synthesis_concurrency: int = 3,
+                 speculation_budget_chars: int = 2000, timing_log: str = TIMING_LOG,
+                 on_start=None, on_error=None, on_idle=None):
+        """
+        Args:
+            output: AudioEngine used for playback (default: a new one)
+            loop: asyncio event loop to run synthesis on (default: a private one)
+            synthesis_concurrency (int): Sentences of a long message rendered at once
+            speculation_budget_chars (int): Characters per minute for speculative synthesis
+            timing_log (str): JSON-lines file for per-stage timings (None disables it)
+            on_start (callable): Called with an Utterance when it starts playing
+            on_error (callable): Called with (utterance, exception) if synthesis fails
+            on_idle (callable): Called when everything queued has been played
+        """
+        if loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, daemon=True).start()
+        self.loop = loop
+        self.output = output or AudioEngine()
+        self.pipeline = SegmentPipeline(loop, max_concurrency=synthesis_concurrency)
+        
+        # Stage timings of recent utterances
+        if timing_log:
+            os.makedirs(os.path.dirname(timing_log), exist_ok=True)
+        self.timings = TimingStore(log_path=timing_log)
+        
+        # Messages are queued and played back to back
+        self.scheduler = UtteranceScheduler(
+            self.output, self.pipeline, self._synthesize_segment, timings=self.timings,
+            on_start=on_start, on_error=on_error, on_idle=on_idle
+        )
+        
+        # Renders text that is still being typed into the cache (optional)
+        self.speculator = SpeculativeSynthesizer(
+            loop, _tts_edge, get_tts_key,
+            is_cached=lambda key: key in AUDIO_CACHE,
+            budget_chars=speculation_budget_chars
+        )
+        
+        # Renders frequent history messages, yielding to real requests
+        self.cache_warmer = CacheWarmer(
+            loop, _tts_edge,
+            is_cached=lambda text, voice, rate: get_tts_key(text, voice, rate) in AUDIO_CACHE,
+            is_busy=lambda: self.scheduler.busy
+        )
+        
+        # Options the client may change at any time
+        self.stream_playback = True
+        self.speculative = False
+
+    def run(self, coro):
+        """
+        Run a coroutine on the engine loop from any other thread
+
+        Returns:
+            concurrent.futures.Future: Result of the coroutine
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    # ─── Async API ────────────────────────────────────────
+    async def list_voices(self) -> dict:
+        """Voices available from Edge TTS, grouped by locale"""
+        return await _get_voices()
+
+    async def synthesize(self, text: str, voice: str, rate: str = "+0%") -> str:
+        """
+        Render text into the cache without playing it
+
+        Returns:
+            str: Path to the cached WAV file
+        """
+        self.cache_warmer.preempt(text, voice, rate)
+        return await _tts_edge(text, voice, rate)
+
+    async def synthesize_pcm(self, text: str, voice: str, rate: str = "+0%") -> np.ndarray:
+        """
+        Render text and return its samples
+
+        Returns:
+            np.ndarray: Mono float32 samples at TARGET_SAMPLE_RATE (read-only)
+        """
+        return (await _load_audio_async(await self.synthesize(text, voice, rate)))[0]
+
+    async def speak(self, text: str, voice: str, rate: str = "+0%", routes=None,
+                    policy: str = UtteranceScheduler.APPEND, priority: int = 0) -> Utterance:
+        """
+        Queue text for playback
+
+        Args:
+            text (str): The message
+            voice (str): Voice name
+            rate (str): Speaking rate (e.g. "+10%")
+            routes (iterable): Route names to play to (default: all)
+            policy (str): UtteranceScheduler.APPEND, INTERRUPT or REPLACE
+            priority (int): Higher priorities are spoken first
+
+        Returns:
+            Utterance: The queued utterance
+        """
+        # A message the warmer is rendering right now joins that render instead of
+        # being preempted and rendered again
+        warming = self.cache_warmer.rendering(text, voice, rate)
+        self.cache_warmer.preempt(text, voice, rate)
+        # A cached message plays as one piece, anything else sentence by sentence
+        if warming or get_tts_key(text, voice, rate) in AUDIO_CACHE:
+            segments = [text]
+        else:
+            segments = split_segments(text)
+        utterance = Utterance(text, voice, rate, segments=segments, priority=priority, routes=routes)
+        return self.scheduler.submit(utterance, policy)
+
+    async def play(self, text: str, voice: str, rate: str = "+0%", routes=None):
+        """
+        Speak text ahead of the queue and wait until it has finished
+
+        Meant for short clips such as voice previews. The clip goes through the scheduler
+        with PREVIEW_PRIORITY, so it waits for the current message instead of cutting it
+        off, and plays before anything else that is queued.
+
+        Returns:
+            str: The outcome ("played", "stopped", "dropped" or "failed")
+        """
+        utterance = await self.speak(text, voice, rate, routes=routes, priority=self.PREVIEW_PRIORITY)
+        outcome = await asyncio.wrap_future(utterance.finished)
+        if outcome == "failed" and not utterance.first_audio.cancelled():
+            error = utterance.first_audio.exception()
+            if error is not None:
+                raise error
+        return outcome
+
+    async def stop(self):
+        """Stop playback and drop everything that is queued"""
+        self.scheduler.stop()
+
+    async def cache_stats(self) -> dict:
+        """Statistics of the caches, shared renders, the worker pool, post-processing, speculation and warming"""
+        return {
+            "disk": AUDIO_CACHE.stats(),
+            "memory": PCM_CACHE.stats(),
+            "in_flight": IN_FLIGHT.stats(),
+            "workers": BLOCKING.stats(),
+            "postprocess": POSTPROCESS.stats(),
+            "speculation": self.speculator.stats(),
+            "warming": self.cache_warmer.stats(),
+        }
+
+    # ─── Synchronous control ──────────────────────────────
+    @property
+    def busy(self) -> bool:
+        """Whether a message is playing or waiting"""
+        return self.scheduler.busy
+
+    def pending(self) -> list:
+        """Queued utterances in the order they will be spoken"""
+        return self.scheduler.pending()
+
+    def timing_stats(self) -> dict:
+        """Rolling per-stage percentiles (ms) of recent utterances"""
+        return self.timings.percentiles()
+
+    def export_metrics(self) -> str:
+        """Rolling stage timings and output device state in the Prometheus text format"""
+        lines = [self.timings.export_text().rstrip("\n")]
+        devices = self.output.sync_stats()
+        for name, key, help_text in (
+                ("output_latency_seconds", "latency_ms", "Output latency per device"),
+                ("output_offset_seconds", "offset_ms", "Playback offset from the reference device")):
+            lines.append(f"# HELP discord_tts_{name} {help_text}")
+            lines.append(f"# TYPE discord_tts_{name} gauge")
+            for device, stats in devices.items():
+                lines.append(f'discord_tts_{name}{{device="{device}"}} {stats[key] / 1000:.6f}')
+        lines.append("# HELP discord_tts_output_drift_ppm Clock correction applied per device")
+        lines.append("# TYPE discord_tts_output_drift_ppm gauge")
+        for device, stats in devices.items():
+            lines.append(f'discord_tts_output_drift_ppm{{device="{device}"}} {stats["drift_ppm"]}')
+        backends = self.backend_stats()
+        lines.append("# HELP discord_tts_backend_first_byte_seconds First audio latency per synthesis backend")
+        lines.append("# TYPE discord_tts_backend_first_byte_seconds summary")
+        for name, stats in backends.items():
+            for q in (50, 95):
+                if stats[f"first_byte_p{q}_ms"] is not None:
+                    lines.append(f'discord_tts_backend_first_byte_seconds{{backend="{name}",quantile="{q / 100}"}} '
+                                 f'{stats[f"first_byte_p{q}_ms"] / 1000:.6f}')
+        for counter, help_text in (("requests", "Synthesis attempts"), ("failures", "Failed attempts"),
+                                   ("hedges", "Hedged requests started")):
+            lines.append(f"# HELP discord_tts_backend_{counter}_total {help_text} per backend")
+            lines.append(f"# TYPE discord_tts_backend_{counter}_total counter")
+            for name, stats in backends.items():
+                lines.append(f'discord_tts_backend_{counter}_total{{backend="{name}"}} {stats[counter]}')
+
+        connections = self.connection_stats()
+        lines.append("# HELP discord_tts_edge_handshake_seconds Time to open an Edge TTS connection")
+        lines.append("# TYPE discord_tts_edge_handshake_seconds summary")
+        for q in (50, 95):
+            if connections[f"handshake_p{q}_ms"] is not None:
+                lines.append(f'discord_tts_edge_handshake_seconds{{quantile="{q / 100}"}} '
+                             f'{connections[f"handshake_p{q}_ms"] / 1000:.6f}')
+        lines.append("# HELP discord_tts_edge_requests_total Edge TTS requests by connection state")
+        lines.append("# TYPE discord_tts_edge_requests_total counter")
+        for state in ("warm", "cold", "dropped"):
+            lines.append(f'discord_tts_edge_requests_total{{connection="{state}"}} {connections[state]}')
+        return "\n".join(lines) + "\n"
+
+    def backend_stats(self) -> dict:
+        """Requests, failures, hedges and first-audio latency per synthesis backend"""
+        return BACKENDS.stats()
+
+    def connection_stats(self) -> dict:
+        """Edge TTS connections opened and reused, and their handshake times"""
+        return EDGE.connections.stats()
+
+    def prewarm(self):
+        """
+        Open an Edge TTS connection ahead of the next message, e.g. at startup or when the
+        window gets focus; does nothing if one is open already
+
+        Returns:
+            concurrent.futures.Future: Done once a connection is open (or failed to open),
+                or None if connections are not reused
+        """
+        if not (EDGE.reuse_connections and EDGE.connections.supported):
+            return None
+        return self.run(EDGE.connections.prewarm())
+
+    def set_routes(self, routes: dict):
+        """
+        Point output routes at devices or sinks, e.g. {"cable": 5, "monitor": 3}
+
+        Raises:
+            sd.PortAudioError: If a device cannot be opened
+        """
+        self.output.set_routes(routes)
+
+    @property
+    def route_names(self) -> tuple:
+        """Names of the configured output routes"""
+        return self.output.route_names
+
+    def configure_synthesis(self, deadline: float = None, retries: int = None, hedge: bool = None,
+                            fallback: bool = None, reuse_connections: bool = None):
+        """
+        Set the synthesis guards; None leaves a value unchanged
+
+        Args:
+            deadline (float): Seconds until the first audio before a request fails
+            retries (int): Extra attempts on the voice's own backend
+            hedge (bool): Start a second request when the first is slower than usual
+            fallback (bool): Use gTTS when Edge TTS fails or times out
+            reuse_connections (bool): Keep Edge TTS connections open between messages
+        """
+        if deadline is not None:
+            if deadline <= 0:
+                raise ValueError("The synthesis deadline must be positive")
+            BACKENDS.deadline = deadline
+        if retries is not None:
+            BACKENDS.retries = max(0, int(retries))
+        if hedge is not None:
+            BACKENDS.hedge = bool(hedge)
+        if fallback is not None:
+            BACKENDS.fallback = bool(fallback)
+        if reuse_connections is not None:
+            EDGE.reuse_connections = bool(reuse_connections)
+            if not EDGE.reuse_connections:
+                self.run(EDGE.connections.close())
+
+    def configure_postprocess(self, enabled: bool = None, silence_threshold_db: float = None,
+                              target_lufs: float = None, peak_db: float = None):
+        """
+        Set how new audio is cleaned up before it is cached; None leaves a value unchanged
+
+        Audio that is already cached keeps the settings it was rendered with.
+
+        Args:
+            enabled (bool): Trim silence and normalize loudness at all
+            silence_threshold_db (float): Level in dBFS below which the start and end of a
+                clip count as silence
+            target_lufs (float): Loudness all voices are brought to
+            peak_db (float): Ceiling of the peak limiter in dBFS
+        """
+        if silence_threshold_db is not None:
+            if silence_threshold_db >= 0:
+                raise ValueError("The silence threshold must be below 0 dBFS")
+            POSTPROCESS.silence_threshold_db = float(silence_threshold_db)
+        if target_lufs is not None:
+            POSTPROCESS.target_lufs = float(target_lufs)
+        if peak_db is not None:
+            POSTPROCESS.peak_db = min(0.0, float(peak_db))
+        if enabled is not None:
+            POSTPROCESS.enabled = bool(enabled)
+
+    def configure_cache(self, max_bytes: int = None, policy: str = None, pcm_max_bytes: int = None):
+        """Apply cache budgets and the eviction policy; None leaves a value unchanged"""
+        if policy is not None:
+            if policy not in AudioCache.POLICIES:
+                raise ValueError(f"Unknown cache policy: {policy}")
+            AUDIO_CACHE.policy = policy
+        if max_bytes is not None:
+            AUDIO_CACHE.set_budget(max_bytes)
+        if pcm_max_bytes is not None:
+            PCM_CACHE.set_budget(pcm_max_bytes)
+
+    def cleanup_cache(self):
+        """Tidy the cache folder in a background thread"""
+        threading.Thread(target=AUDIO_CACHE.cleanup, args=([LEGACY_CACHE_DIR],), daemon=True).start()
+
+    def speculate(self, text: str, voice: str, rate: str):
+        """Render text that is still being typed, if speculation is enabled"""
+        if not self.speculative:
+            return
+        self.cache_warmer.preempt()
+        self.speculator.update(text, voice, rate)
+
+    def cancel_speculation(self):
+        """Cancel all speculative jobs"""
+        self.speculator.cancel_all()
+
+    def warm_cache(self, texts: list, voice: str, rate: str):
+        """Render texts in the background while the engine is idle"""
+        self.cache_warmer.start(texts, voice, rate)
+
+    def close(self):
+        """Stop background work, save the cache index and close the devices"""
+        self.speculator.cancel_all()
+        self.cache_warmer.stop()
+        self.run(EDGE.connections.close())
+        AUDIO_CACHE.close()
+        self.output.close()
+
+    async def _synthesize_segment(self, utterance, index, segment, on_pcm):
+        """
+        Scheduler hook that renders one segment of an utterance
+        
+        Returns:
+            np.ndarray: The segment samples, or None if they were streamed into on_pcm
+        """
+        # Join a speculative render of this segment instead of starting a second one
+        if self.speculative:
+            job = self.speculator.claim(segment, utterance.voice, utterance.rate)
+            if job is not None:
+                try:
+                    await asyncio.wrap_future(job)
+                except Exception:
+                    pass  # Synthesize it normally below
+        # In streaming mode the first segment plays while it is still being received
+        if on_pcm is not None and self.stream_playback and MP3_SUPPORTED:
+            await _tts_edge_stream(segment, utterance.voice, utterance.rate, on_pcm=on_pcm,
+                                   trace=utterance.trace)
+            return None
+        path = await _tts_edge(segment, utterance.voice, utterance.rate, trace=utterance.trace)
+        return (await _load_audio_async(path))[0]
@@ -0,0 +1,85 @@
+"""
+Persistent Edge TTS voice catalog for the Discord TTS App.
+
+Listing the Edge TTS voices is a network call. The last known catalog is kept on disk so
+the voice list is available immediately at startup (and offline); it is refreshed in the
+background once it is older than its TTL.
+"""
+
+import os
+import json
+import time
+import uuid
+
+class VoiceCatalog:
+    """
+    Voice groups (locale -> list of voices) saved as JSON with the time they were fetched
+    """
+    def __init__(self, path: str, ttl: float = 24 * 3600):
+        """
+        Args:
+            path (str): JSON file holding the catalog
+            ttl (float): Age in seconds after which the catalog should be refreshed
+        """
+        self.path = path
+        self.ttl = ttl
+        self.fetched_at = 0.0
+
+    def load(self):
+        """
+        Read the saved catalog
+
+        Returns:
+            dict: Voice groups by locale, or None if there is no usable catalog
+        """
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            groups = data["voices"]
+            if not isinstance(groups, dict) or not groups:
+                return None
+            self.fetched_at = float(data.get("fetched_at", 0))
+            return groups
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Could not load voice catalog: {e}")
+            return None
+
+    def is_fresh(self) -> bool:
+        """Whether the loaded or saved catalog is younger than the TTL"""
+        return 0 <= time.time() - self.fetched_at < self.ttl
+
+    def save(self, groups: dict):
+        """
+        Store a freshly fetched catalog (atomic replace)
+
+        Args:
+            groups (dict): Voice groups by locale
+        """
+        self.fetched_at = time.time()
+        tmp = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({"fetched_at": self.fetched_at, "voices": groups}, f)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print(f"Could not save voice catalog: {e}")
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+    @staticmethod
+    def diff(old: dict, new: dict):
+        """
+        Compare two catalogs
+
+        Returns:
+            tuple: (added, removed) sets of (locale, voice name, gender)
+        """
+        def entries(groups):
+            return {(locale, v['name'], v.get('gender', 'Unknown'))
+                    for locale, voices in groups.items() for v in voices}
+        old_entries, new_entries = entries(old), entries(new)
+        return new_entries - old_entries, old_entries - new_entries